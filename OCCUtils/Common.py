@@ -21,6 +21,7 @@ import random
 
 from OCC.Bnd import Bnd_Box
 from OCC.BRepBndLib import brepbndlib_Add
+from OCC.BRep import BRep_Tool
 from OCC.TColgp import (TColgp_HArray1OfPnt,
                         TColgp_Array1OfPnt,
                         TColgp_Array1OfPnt2d,
@@ -32,7 +33,7 @@ from OCC.GeomAPI import (GeomAPI_Interpolate, GeomAPI_PointsToBSpline,
                          GeomAPI_ProjectPointOnCurve)
 from OCC.gp import gp_Pnt, gp_Vec, gp_Trsf
 from OCC.BRepBuilderAPI import BRepBuilderAPI_Transform
-from OCC.TopoDS import TopoDS_Edge, TopoDS_Shape, TopoDS_Wire, TopoDS_Vertex
+from OCC.TopoDS import TopoDS_Edge, TopoDS_Shape, TopoDS_Wire, TopoDS_Vertex, topods_Edge
 from OCC.Quantity import Quantity_Color, Quantity_TOC_RGB
 from OCC.GProp import GProp_GProps
 from OCC.GeomAbs import GeomAbs_C1, GeomAbs_C2, GeomAbs_C3
@@ -41,6 +42,9 @@ from OCC.BRepGProp import (brepgprop_LinearProperties,
                            brepgprop_VolumeProperties)
 from OCC.GeomAdaptor import GeomAdaptor_Curve
 from OCC.Geom import Geom_Curve
+from OCC.GCPnts import GCPnts_AbscissaPoint_Length
+from OCC.TopAbs import TopAbs_EDGE
+from OCC.TopExp import TopExp_Explorer
 
 from OCC import Graphic3d
 
@@ -448,22 +452,36 @@ def resample_curve_with_uniform_deflection(curve, deflection=0.5, degreeMin=3, d
 
 
 class GpropsFromShape(object):
+    '''global properties of shape; tolerance is the relative error OCC
+    integrates surfaces and volumes to, None for a fixed Gauss order without
+    error control. After each call error holds the relative error achieved,
+    None without a tolerance.
+    '''
     def __init__(self, shape, tolerance=1e-5):
         self.shape = shape
         self.tolerance = tolerance
+        self.error = None
 
     def volume(self):
         '''returns the volume of a solid
         '''
         prop = GProp_GProps()
-        brepgprop_VolumeProperties(self.shape, prop, self.tolerance)
+        if self.tolerance is None:
+            brepgprop_VolumeProperties(self.shape, prop)
+            self.error = None
+        else:
+            self.error = brepgprop_VolumeProperties(self.shape, prop, self.tolerance)
         return prop
 
     def surface(self):
         '''returns the area of a surface
         '''
         prop = GProp_GProps()
-        brepgprop_SurfaceProperties(self.shape, prop, self.tolerance)
+        if self.tolerance is None:
+            brepgprop_SurfaceProperties(self.shape, prop)
+            self.error = None
+        else:
+            self.error = brepgprop_SurfaceProperties(self.shape, prop, self.tolerance)
         return prop
 
     def linear(self):
@@ -471,6 +489,25 @@ class GpropsFromShape(object):
         '''
         prop = GProp_GProps()
         brepgprop_LinearProperties(self.shape, prop)
+        self.error = None
+        if self.tolerance is None:
+            return prop
+
+        # OCC integrates edges at a fixed Gauss order; the error is taken
+        # against an adaptive length, whose tolerance is absolute and so
+        # scaled by the bounding box diagonal. Degenerated edges, collapsed
+        # onto a vertex as at the pole of a sphere, have no length and no
+        # curve to measure along
+        xmin, ymin, zmin, xmax, ymax, zmax = get_boundingbox(self.shape)
+        tolerance = self.tolerance * ((xmax - xmin) ** 2 + (ymax - ymin) ** 2 + (zmax - zmin) ** 2) ** .5
+        length = 0.
+        explorer = TopExp_Explorer(self.shape, TopAbs_EDGE)
+        while explorer.More():
+            edge = topods_Edge(explorer.Current())
+            if not BRep_Tool.Degenerated(edge):
+                length += GCPnts_AbscissaPoint_Length(BRepAdaptor_Curve(edge), tolerance)
+            explorer.Next()
+        self.error = abs(prop.Mass() - length) / length if length else 0.
         return prop
 
 
@@ -479,7 +516,8 @@ def curve_length(crv):
     get the length from a TopoDS_Edge or TopoDS_Wire
     '''
     assert isinstance(crv, (TopoDS_Wire, TopoDS_Edge)), 'either a wire or edge...'
-    gprop = GpropsFromShape(crv)
+    # without a tolerance, as the adaptive length check is not wanted here
+    gprop = GpropsFromShape(crv, None)
     return gprop.linear().Mass()
 
 
@@ -0,0 +1,133 @@
+import re
+import mmap
+
+from STParser.part21 import Lexer, Parser, Part21Error, parse_header
+
+MAX_HEADER_SIZE = 4 * 1024 * 1024
+
+# LENGTH_UNIT and PRODUCT are looked for in the first and last UNIT_WINDOW
+# bytes of the DATA section before falling back to the whole section;
+# exporters place the unit context and products at one of the two ends
+UNIT_WINDOW = 1024 * 1024
+
+UNIT_PREFIXES = {None: '', 'MILLI': 'm', 'CENTI': 'c'}
+UNIT_NAMES = {'METRE': 'm'}
+
+_DATA = re.compile(br'(?:^|;)\s*DATA\s*[;(]', re.M)
+_LENGTH_UNIT = re.compile(br'LENGTH_UNIT\s*\(\s*\)')
+_UNIT_CONTEXT = re.compile(br'GLOBAL_UNIT_ASSIGNED_CONTEXT\s*\(\s*\(([^)]*)\)')
+_REF = re.compile(br'#[0-9]+')
+_PRODUCT = re.compile(br'#[0-9]+\s*=\s*PRODUCT\s*\(')
+_SI_UNIT = re.compile(br'SI_UNIT\s*\(\s*(?:\.([A-Z_]+)\.|\$)\s*,\s*\.([A-Z_]+)\.\s*\)')
+
+def read_header(source):
+    '''parses the ISO-10303-21 header section of source, a filename or a
+    binary file object, stopping at its ENDSEC; returns a part21.Header
+    record and raises part21.Part21Error, with the line and column, if the
+    header is malformed
+    '''
+    if hasattr(source, 'read'):
+        return parse_header(source, limit=MAX_HEADER_SIZE)
+    with open(source, 'rb') as f:
+        return parse_header(f, limit=MAX_HEADER_SIZE)
+
+def data_start(data):
+    '''offset just past the first DATA section keyword in data (a string or
+    a memory map), or 0 if there is none
+    '''
+    section = _DATA.search(data)
+    return section.end() if section else 0
+
+def unit_abbr(prefix, name):
+    if prefix not in UNIT_PREFIXES or name not in UNIT_NAMES:
+        return None
+    return UNIT_PREFIXES[prefix] + UNIT_NAMES[name]
+
+def _windows(data):
+    '''the first and last UNIT_WINDOW bytes of the DATA section of data,
+    then the whole section
+    '''
+    start = data_start(data)
+    end = len(data)
+    return [(start, min(end, start + UNIT_WINDOW)),
+            (max(start, end - UNIT_WINDOW), end),
+            (start, end)]
+
+def _matches(data, pattern):
+    '''yields the matches of pattern in the DATA section of data, window by
+    window, leaving out those in a comment opened since the previous
+    statement
+    '''
+    for window_start, window_end in _windows(data):
+        for match in pattern.finditer(data, window_start, window_end):
+            start = data.rfind(b';', window_start, match.start()) + 1 or window_start
+            if data.rfind(b'/*', start, match.start()) <= data.rfind(b'*/', start, match.start()):
+                yield match
+
+def _search(filename, find):
+    '''what find returns for a memory map of filename, or None if the file
+    is empty
+    '''
+    with open(filename, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+        try:
+            return find(data)
+        finally:
+            data.close()
+
+def _statement(data, match):
+    '''start and end offset of the statement that match is in
+    '''
+    end = data.find(b';', match.end())
+    return data.rfind(b';', 0, match.start()) + 1, len(data) if end < 0 else end
+
+def _si_length_unit(data, start, end):
+    if _LENGTH_UNIT.search(data, start, end):
+        si = _SI_UNIT.search(data, start, end)
+        if si:
+            prefix = si.group(1).decode('ascii') if si.group(1) else None
+            return unit_abbr(prefix, si.group(2).decode('ascii'))
+    return None
+
+def length_unit(filename):
+    '''returns the abbreviation ('m', 'cm', 'mm') of the SI length unit that
+    the first GLOBAL_UNIT_ASSIGNED_CONTEXT assigns, or None if it assigns
+    another one, such as an inch; only a file without such a context falls
+    back to the first SI length unit in the DATA section. The entities are
+    located with regular expressions over a memory map, not by reading the
+    file line by line.
+    '''
+    def find(data):
+        for context in _matches(data, _UNIT_CONTEXT):
+            for ref in _REF.findall(context.group(1)):
+                for match in _matches(data, re.compile(ref + br'\s*=')):
+                    start, end = _statement(data, match)
+                    if _LENGTH_UNIT.search(data, start, end):
+                        return _si_length_unit(data, start, end)
+                    break
+            return None
+        for match in _matches(data, _LENGTH_UNIT):
+            unit = _si_length_unit(data, *_statement(data, match))
+            if unit:
+                return unit
+    return _search(filename, find)
+
+def product_name(filename):
+    '''returns the name of the first PRODUCT in the DATA section, or None;
+    found the way length_unit is, without indexing the file
+    '''
+    def find(data):
+        for match in _matches(data, _PRODUCT):
+            data.seek(match.start())
+            try:
+                records = Parser(Lexer(data, limit=MAX_HEADER_SIZE)).instance()[1]
+            except Part21Error:
+                continue
+            parameters = records[0].parameters
+            if len(parameters) > 1:
+                return parameters[1]
+    return _search(filename, find)
@@ -0,0 +1,335 @@
+'''
+Lexer and parser for ISO 10303-21 (STEP Part 21) exchange files.
+
+The lexer reads any file-like object in chunks and yields typed tokens with
+their line and column; strings are decoded, including the '' quote and the
+\\S\\, \\P?\\, \\X\\, \\X2\\ and \\X4\\ control directives. Nothing is ever
+evaluated. The parser builds parameter lists from those tokens and typed
+records for the header section.
+'''
+
+import re
+from io import BytesIO
+from collections import namedtuple
+
+CHUNK_SIZE = 64 * 1024
+
+# token kinds
+KEYWORD = 'keyword'
+STRING = 'string'
+BINARY = 'binary'
+ENUM = 'enum'
+INTEGER = 'integer'
+REAL = 'real'
+REF = 'ref'
+PUNCT = 'punct'
+
+# every match is one token together with the whitespace and comments in
+# front of it; the alternatives are ordered by how often they occur
+_TOKEN = re.compile(br"""
+    (?:[ \t\r\n]+|/\*.*?\*/)*
+    (?:
+      (?P<punct>[(),;=$*])
+    | (?P<ref>\#[0-9]+)
+    | (?P<string>'[^']*(?:''[^']*)*')
+    | (?P<keyword>!?[A-Za-z_][A-Za-z0-9_]*(?:-[A-Za-z0-9_]+)*)
+    | (?P<enum>\.[A-Za-z_][A-Za-z0-9_]*\.)
+    | (?P<real>[+-]?[0-9]+\.[0-9]*(?:[Ee][+-]?[0-9]+)?)
+    | (?P<integer>[+-]?[0-9]+)
+    | (?P<binary>"[0-3][0-9A-Fa-f]*")
+    )""", re.X | re.S)
+_SPACE = re.compile(br'(?:[ \t\r\n]+|/\*.*?\*/)*', re.S)
+
+# a token ending within _TAIL bytes of the end of the buffer is held back
+# until the next chunk has been read, so that one cut short by the chunk
+# boundary (1.5E of 1.5E+3) is never taken for a complete one; strings,
+# binaries and comments, which can be longer, are held back until closed
+_TAIL = 256
+_OPENERS = b"'\"/"
+
+_ESCAPE = re.compile(br"""
+      \\X2\\((?:[0-9A-Fa-f]{4})*)\\X0\\
+    | \\X4\\((?:[0-9A-Fa-f]{8})*)\\X0\\
+    | \\X\\([0-9A-Fa-f]{2})
+    | \\S\\(.)
+    | \\P([A-I])\\
+    | \\\\
+""", re.X | re.S)
+
+class Part21Error(ValueError):
+    def __init__(self, message, line=None, column=None):
+        if line is not None:
+            message = "%s (line %d, column %d)" % (message, line, column)
+        ValueError.__init__(self, message)
+        self.line = line
+        self.column = column
+
+class Enumeration(str):
+    '''an enumeration value such as .T. or .MILLI., without the dots
+    '''
+    pass
+
+class EntityRef(int):
+    '''an entity instance name such as #12
+    '''
+    def __repr__(self):
+        return '#%d' % self
+
+Token = namedtuple('Token', 'kind value line column')
+TypedParameter = namedtuple('TypedParameter', 'type parameters')
+
+FileDescription = namedtuple('FileDescription', 'description implementation_level')
+FileName = namedtuple('FileName', 'name time_stamp author organization '
+                                  'preprocessor_version originating_system authorization')
+FileSchema = namedtuple('FileSchema', 'schema_identifiers')
+Header = namedtuple('Header', 'iso file_description file_name file_schema entities')
+
+def _raw_text(raw):
+    # Part 21 strings are ASCII; exporters write UTF-8 anyway, and
+    # occasionally Latin-1
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+def decode_string(literal):
+    '''decodes the body of a Part 21 string literal (without its quotes)
+    '''
+    literal = literal.replace(b"''", b"'")
+    if b'\\' not in literal:
+        return _raw_text(literal)
+
+    parts = []
+    page = 1
+    pos = 0
+    for match in _ESCAPE.finditer(literal):
+        parts.append(_raw_text(literal[pos:match.start()]))
+        pos = match.end()
+        ucs2, ucs4, byte, high, codepage = match.groups()
+        if ucs2 is not None:
+            parts.extend(unichr(int(ucs2[i:i + 4], 16)) for i in range(0, len(ucs2), 4))
+        elif ucs4 is not None:
+            parts.extend(_codepoint(int(ucs4[i:i + 8], 16)) for i in range(0, len(ucs4), 8))
+        elif byte is not None:
+            parts.append(unichr(int(byte, 16)))
+        elif high is not None:
+            parts.append(bytearray([ord(high) + 128]).decode('iso8859-%d' % page))
+        elif codepage is not None:
+            page = ord(codepage) - ord('A') + 1
+        else:
+            parts.append(u'\\')
+    parts.append(_raw_text(literal[pos:]))
+
+    return u''.join(parts)
+
+def _codepoint(value):
+    try:
+        return unichr(value)
+    except ValueError:
+        # narrow Python 2 builds: encode as a surrogate pair
+        value -= 0x10000
+        return unichr(0xD800 + (value >> 10)) + unichr(0xDC00 + (value & 0x3FF))
+
+def _value(kind, text):
+    if kind == STRING:
+        return decode_string(text[1:-1])
+    if kind == INTEGER:
+        return int(text)
+    if kind == REAL:
+        return float(text)
+    if kind == ENUM:
+        return Enumeration(text[1:-1])
+    if kind == REF:
+        return EntityRef(text[1:])
+    return str(text)
+
+class Lexer(object):
+    '''iterates over the tokens of a binary file-like object, reading it in
+    chunks; tokens are never split at a chunk boundary. With limit set, no
+    more than limit bytes are read.
+    '''
+    def __init__(self, stream, chunk_size=CHUNK_SIZE, limit=None):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.limit = limit
+
+    def __iter__(self):
+        buf = b''
+        pos = 0
+        eof = False
+        read = 0
+        line = 1
+        line_start = 0
+
+        while not eof:
+            if self.limit is not None and read >= self.limit:
+                raise Part21Error("Read past the first %d bytes" % self.limit)
+            chunk = self.stream.read(self.chunk_size)
+            read += len(chunk)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            line_start -= pos
+            pos = 0
+
+            tail = len(buf) if eof else len(buf) - _TAIL
+            for match in _TOKEN.finditer(buf):
+                end = match.end()
+                if match.start() != pos or end > tail:
+                    break
+
+                kind = match.lastgroup
+                token_start = match.start(kind)
+                if b'\n' in buf[pos:token_start]:
+                    line += buf.count(b'\n', pos, token_start)
+                    line_start = buf.rindex(b'\n', pos, token_start) + 1
+                pos = end
+
+                text = match.group(kind)
+                yield Token(kind, _value(kind, text), line, token_start - line_start + 1)
+
+                if kind == STRING and b'\n' in text:
+                    line += text.count(b'\n')
+                    line_start = token_start + text.rindex(b'\n') + 1
+
+            rest = _SPACE.match(buf, pos).end()
+            if rest == len(buf):
+                continue
+            if not eof and (rest >= tail or buf[rest] in _OPENERS or _TOKEN.match(buf, pos)):
+                continue
+            if b'\n' in buf[pos:rest]:
+                line += buf.count(b'\n', pos, rest)
+                line_start = buf.rindex(b'\n', pos, rest) + 1
+            raise Part21Error("Unexpected character %r" % buf[rest], line, rest - line_start + 1)
+
+class Parser(object):
+    '''recursive descent over a token iterator
+    '''
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.last = None
+
+    def next(self, expected=None):
+        token = next(self.tokens, None)
+        if token is None:
+            line, column = (self.last.line, self.last.column) if self.last else (None, None)
+            raise Part21Error("Unexpected end of file" +
+                              (", expected " + expected if expected else ""), line, column)
+        self.last = token
+        return token
+
+    def expect(self, value):
+        token = self.next(repr(value))
+        if token.value != value:
+            raise Part21Error("Expected %r, found %r" % (value, token.value),
+                              token.line, token.column)
+        return token
+
+    def parameter(self, token):
+        if token.kind == PUNCT:
+            if token.value == '(':
+                return self.parameter_list()
+            if token.value == '$':
+                return None
+            if token.value == '*':
+                return '*'
+            raise Part21Error("Unexpected %r" % token.value, token.line, token.column)
+        if token.kind == KEYWORD:
+            self.expect('(')
+            return TypedParameter(token.value, self.parameter_list())
+        return token.value
+
+    def parameter_list(self):
+        '''parses a parenthesised list whose opening bracket was just consumed
+        '''
+        values = []
+        token = self.next("')'")
+        if token.value == ')':
+            return values
+        while True:
+            values.append(self.parameter(token))
+            token = self.next("',' or ')'")
+            if token.value == ')':
+                return values
+            if token.value != ',':
+                raise Part21Error("Expected ',' or ')', found %r" % token.value,
+                                  token.line, token.column)
+            token = self.next("parameter")
+
+    def entity(self, token):
+        '''NAME(parameters); for a NAME token just read
+        '''
+        name, parameters = self._record(token)
+        self.expect(';')
+        return name, parameters
+
+    def instance(self):
+        '''#id=NAME(...); or the complex #id=(A(...)B(...)); returns the id and
+        a list with one TypedParameter per (partial) entity
+        '''
+        ref = self.next("entity instance")
+        if ref.kind != REF:
+            raise Part21Error("Expected entity instance, found %r" % ref.value,
+                              ref.line, ref.column)
+        self.expect('=')
+
+        token = self.next("entity name")
+        if token.value == '(':
+            records = []
+            token = self.next("entity name")
+            while token.value != ')':
+                records.append(TypedParameter(*self._record(token)))
+                token = self.next("entity name or ')'")
+        else:
+            records = [TypedParameter(*self._record(token))]
+        self.expect(';')
+
+        return ref.value, records
+
+    def _record(self, token):
+        if token.kind != KEYWORD:
+            raise Part21Error("Expected entity name, found %r" % token.value,
+                              token.line, token.column)
+        self.expect('(')
+        return token.value, self.parameter_list()
+
+def _record(record_type, parameters):
+    parameters = list(parameters or [])
+    missing = len(record_type._fields) - len(parameters)
+    if missing > 0:
+        parameters += [None] * missing
+    return record_type(*parameters[:len(record_type._fields)])
+
+def parse_header(stream, limit=None):
+    '''parses the start token and the HEADER section of a Part 21 stream and
+    stops after the header's ENDSEC; returns a Header record. With limit set,
+    gives up if the header is not over within the first limit bytes.
+    '''
+    parser = Parser(Lexer(stream, limit=limit))
+
+    iso = parser.next("ISO-10303-21")
+    if iso.kind != KEYWORD or not iso.value.startswith('ISO-10303'):
+        raise Part21Error("Missing ISO-10303-21 start token", iso.line, iso.column)
+    parser.expect(';')
+    parser.expect('HEADER')
+    parser.expect(';')
+
+    entities = {}
+    while True:
+        token = parser.next("ENDSEC")
+        if token.value == 'ENDSEC':
+            parser.expect(';')
+            break
+        name, parameters = parser.entity(token)
+        entities[name] = parameters
+
+    return Header(iso.value,
+                  _record(FileDescription, entities.get('FILE_DESCRIPTION')),
+                  _record(FileName, entities.get('FILE_NAME')),
+                  _record(FileSchema, entities.get('FILE_SCHEMA')),
+                  entities)
+
+def parse_instance(data):
+    '''parses the bytes of one DATA section entity instance; see
+    Parser.instance
+    '''
+    return Parser(Lexer(BytesIO(data))).instance()
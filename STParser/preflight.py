@@ -0,0 +1,347 @@
+import re
+from array import array
+
+from STParser.part21 import Part21Error
+
+CHUNK_SIZE = 1024 * 1024
+MAX_STATEMENT = 64 * 1024 * 1024
+# the end of the file looked at for END-ISO-10303-21 before anything else
+TAIL_SIZE = 64 * 1024
+
+_QUOTED = re.compile(br"""'[^']*'|"[^"]*"|/\*.*?\*/""", re.S)
+_OPEN = re.compile(br"""'[^']*'|"[^"]*"|/\*.*?\*/|(['"]|/\*)""", re.S)
+
+# statements of text with strings, binaries and comments already removed:
+# a run of DATA section entity instances, or a single header entity or
+# section keyword. A quote or slash left over is the start of a string or
+# comment that is not closed yet, and stops the match.
+_FAST = re.compile(br"""
+    [ \t\r\n]*
+    (?:
+      (?P<instances>(?:\#[0-9]+[ \t\r\n]*=[^;'"/]*;[ \t\r\n]*)+)
+    | (?P<keyword>[A-Za-z_][A-Za-z0-9_-]*)[ \t\r\n]*(?P<args>\([^;'"/]*)?;
+    )""", re.X)
+_DEFINE = re.compile(br'#([0-9]+)[ \t\r\n]*=')
+_REF = re.compile(br'#([0-9]+)')
+_TYPE = re.compile(br'#[0-9]+[ \t\r\n]*=[ \t\r\n]*([A-Za-z_][A-Za-z0-9_]*)')
+_COMPLEX = re.compile(br'#[0-9]+[ \t\r\n]*=[ \t\r\n]*\(([^;]*);')
+_PARTIAL = re.compile(br'[A-Za-z_][A-Za-z0-9_]*|[()]')
+_END = re.compile(br'END-ISO-10303[A-Za-z0-9_-]*[ \t\r\n]*;')
+
+# the same statements in the original text, one at a time; only used to
+# locate a problem once the fast pass has found one
+_BODY = br"""[^;'"/]*(?:(?:'[^']*'|"[^"]*"|/\*.*?\*/|/)[^;'"/]*)*"""
+_STATEMENT = re.compile(br"""
+    (?P<space>(?:[ \t\r\n]+|/\*.*?\*/)*)
+    (?:
+      \#(?P<id>[0-9]+)[ \t\r\n]*=(?P<body>""" + _BODY + br""");
+    | (?P<keyword>[A-Za-z_][A-Za-z0-9_-]*)[ \t\r\n]*(?P<args>\(""" + _BODY + br""")?;
+    )""", re.X | re.S)
+_SPACE = re.compile(br'(?:[ \t\r\n]+|/\*.*?\*/)*', re.S)
+
+class PreflightError(Part21Error):
+    pass
+
+class _Failure(Exception):
+    '''a problem found by the fast pass, with the number of the statement
+    it was found at
+    '''
+    def __init__(self, message, statement=None, check=None):
+        Exception.__init__(self, message)
+        self.statement = statement
+        self.check = check
+
+def _strip(text):
+    '''text without its strings and comments, and the offset of a string or
+    comment that is not closed within it, or None
+    '''
+    stripped = _QUOTED.sub(b'', text)
+    if b"'" in stripped or b'"' in stripped or b'/*' in stripped:
+        for match in _OPEN.finditer(text):
+            if match.group(1):
+                return _QUOTED.sub(b'', text[:match.start()]), match.start()
+    return stripped, None
+
+def _chunks(f, chunk_size):
+    '''yields the text of f with strings and comments removed, in pieces
+    that end wherever the chunk did, and whether it is the last one. A
+    string or comment still open at the end of a chunk is kept back for the
+    next piece, as is a '/' that may open one; anywhere else the text can be
+    cut, as the pieces are joined again before statements are matched, and
+    the two quotes of an escaped '' split between chunks strip the same as
+    they do together. Line breaks play no part, so a file with CR line
+    endings or on a single line reads the same.
+    '''
+    rest = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            yield _QUOTED.sub(b'', rest), True
+            return
+        text = rest + chunk
+        stripped, unclosed = _strip(text)
+        if unclosed is None and text.endswith(b'/'):
+            # a '/' that closes a comment leaves it open without, and then
+            # the whole comment is kept back
+            stripped, unclosed = _strip(text[:-1])
+            if unclosed is None:
+                unclosed = len(text) - 1
+        yield stripped, False
+        text = text[len(text) if unclosed is None else unclosed:]
+        if len(text) > MAX_STATEMENT:
+            raise _Failure("Statement longer than %d bytes" % MAX_STATEMENT)
+        rest = text
+
+def _partials(body):
+    '''names of the partial types of a complex instance, given the text
+    after its opening bracket
+    '''
+    names = []
+    depth = 0
+    for token in _PARTIAL.findall(body):
+        if token == b'(':
+            depth += 1
+        elif token == b')':
+            depth -= 1
+        elif depth == 0:
+            names.append(token)
+    return names
+
+def _count(run, instances, counts):
+    types = _TYPE.findall(run)
+    counts.update(types)
+    if len(types) < instances:
+        for body in _COMPLEX.findall(run):
+            counts.update(_partials(body))
+
+def _fast_pass(f, chunk_size, counts):
+    state = 'start'
+    defined = array('l')
+    referenced = array('l')
+    instances = 0
+    statement = 0
+    buf = b''
+
+    for text, eof in _chunks(f, chunk_size):
+        buf += text
+        pos = 0
+        while state != 'end':
+            match = _FAST.match(buf, pos)
+            if match is None:
+                break
+            pos = match.end()
+
+            run = match.group('instances')
+            if run is not None:
+                if state != 'data':
+                    raise _Failure("Entity instance outside a DATA section", statement)
+                if run.count(b'(') != run.count(b')'):
+                    raise _Failure("Unbalanced parentheses", statement, 'parentheses')
+                ids = _DEFINE.findall(run)
+                if counts is not None:
+                    _count(run, len(ids), counts)
+                defined.extend(map(int, ids))
+                # only references to entities outside the run are left to check
+                referenced.extend(map(int, set(_REF.findall(run)).difference(ids)))
+                instances += len(ids)
+                statement += len(ids)
+                continue
+
+            keyword, args = match.group('keyword'), match.group('args')
+            if args is not None and args.count(b'(') != args.count(b')'):
+                raise _Failure("Unbalanced parentheses in " + keyword, statement)
+
+            if state == 'start':
+                if not keyword.startswith(b'ISO-10303'):
+                    raise _Failure("File does not start with ISO-10303-21", statement)
+                state = 'iso'
+            elif state == 'iso':
+                if keyword != b'HEADER':
+                    raise _Failure("Missing HEADER section", statement)
+                state = 'header'
+            elif state == 'header':
+                if keyword == b'ENDSEC':
+                    state = 'sections'
+                elif args is None:
+                    raise _Failure("Unexpected " + keyword + " in HEADER section", statement)
+            elif state == 'sections':
+                if keyword == b'DATA':
+                    state = 'data'
+                elif keyword.startswith(b'END-ISO-10303'):
+                    state = 'end'
+                else:
+                    raise _Failure("Expected DATA or END-ISO-10303-21, found " + keyword,
+                                   statement)
+            elif state == 'data':
+                if keyword != b'ENDSEC':
+                    raise _Failure("Unexpected " + keyword + " in DATA section", statement)
+                state = 'sections'
+            statement += 1
+
+        if state == 'end':
+            return instances, defined, referenced
+        buf = buf[pos:]
+        if eof and buf.strip():
+            if b';' not in buf:
+                raise _Failure("Truncated file, statement without ';'", statement)
+            raise _Failure("Malformed statement", statement)
+        if len(buf) > MAX_STATEMENT:
+            raise _Failure("Statement longer than %d bytes" % MAX_STATEMENT, statement)
+
+    raise _Failure("Truncated file, missing " +
+                   ('END-ISO-10303-21' if state == 'sections' else 'ENDSEC'))
+
+def _ended(f):
+    '''true if END-ISO-10303-21 is within the last TAIL_SIZE bytes of f,
+    which a truncated file fails without being read through
+    '''
+    f.seek(0, 2)
+    f.seek(max(0, f.tell() - TAIL_SIZE))
+    found = _END.search(f.read())
+    f.seek(0)
+    return found is not None
+
+def _bitmap(ids):
+    '''a bitmap of the ids in an array of them, and whether any is in it
+    more than once
+    '''
+    bits = bytearray((max(ids) >> 3) + 1 if ids else 0)
+    repeated = False
+    for entity_id in ids:
+        bit = 1 << (entity_id & 7)
+        if bits[entity_id >> 3] & bit:
+            repeated = True
+        bits[entity_id >> 3] |= bit
+    return bits, repeated
+
+def _missing(ids, bits):
+    '''the ids in an array of them that are not set in bits
+    '''
+    size = len(bits) << 3
+    return set(entity_id for entity_id in ids
+               if entity_id >= size or not bits[entity_id >> 3] & 1 << (entity_id & 7))
+
+def _statements(f, chunk_size):
+    '''yields (match, line, column) for every statement of f; raises
+    PreflightError where the text stops being a sequence of statements
+    '''
+    buf = b''
+    line = 1
+    line_start = 0
+    eof = False
+
+    while not eof:
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf += chunk
+
+        pos = 0
+        while True:
+            match = _STATEMENT.match(buf, pos)
+            if match is None:
+                break
+            start = match.end('space')
+            if b'\n' in buf[pos:start]:
+                line += buf.count(b'\n', pos, start)
+                line_start = buf.rindex(b'\n', pos, start) + 1
+            yield match, line, start - line_start + 1
+            if b'\n' in buf[start:match.end()]:
+                line += buf.count(b'\n', start, match.end())
+                line_start = buf.rindex(b'\n', start, match.end()) + 1
+            pos = match.end()
+
+        rest = _SPACE.match(buf, pos).end()
+        if eof and rest < len(buf):
+            if b'\n' in buf[pos:rest]:
+                line += buf.count(b'\n', pos, rest)
+                line_start = buf.rindex(b'\n', pos, rest) + 1
+            raise PreflightError("Malformed statement", line, rest - line_start + 1)
+
+        buf = buf[pos:]
+        line_start -= pos
+
+def _balanced(text):
+    depth = 0
+    for part in _QUOTED.sub(b'', text).split(b'('):
+        if depth < 0:
+            return False
+        depth += 1 - part.count(b')')
+    return depth == 1
+
+def _locate(filename, message, found, chunk_size):
+    '''second pass over the original text, only taken for broken files;
+    returns a PreflightError at the first statement for which found(match)
+    is true, or at the statement the fast pass stopped at
+    '''
+    with open(filename, 'rb') as f:
+        try:
+            for match, line, column in _statements(f, chunk_size):
+                description = found(match)
+                if description:
+                    return PreflightError(description, line, column)
+        except PreflightError as e:
+            return PreflightError(message, e.line, e.column)
+    return PreflightError(message)
+
+def preflight(filename, chunk_size=CHUNK_SIZE, counts=None):
+    '''checks the ISO-10303-21 framing, the HEADER and DATA section
+    structure, the parentheses of the statements and that every #id
+    reference is defined, without building any geometry. Raises
+    PreflightError with the line and column of the first problem; returns
+    the number of entity instances. If counts is a Counter, the instances
+    of every entity type are added to it on the way, counting each partial
+    type of a complex instance.
+
+    The file is read once, with strings and comments removed a chunk at a
+    time, and the ids kept as numbers; only a broken file is read a second
+    time, statement by statement, to find the line and column, and a file
+    without END-ISO-10303-21 at its end is not read at all.
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            if not _ended(f):
+                raise PreflightError("Truncated file, missing END-ISO-10303-21")
+            instances, defined, referenced = _fast_pass(f, chunk_size, counts)
+    except _Failure as failure:
+        message = str(failure)
+        if failure.statement is None:
+            raise PreflightError(message)
+
+        counter = [0]
+        def at_statement(match):
+            if failure.check == 'parentheses':
+                text = match.group('body') or match.group('args') or b'()'
+                if not _balanced(text):
+                    return "Unbalanced parentheses in " + (
+                        '#' + match.group('id') if match.group('id') else match.group('keyword'))
+                return None
+            counter[0] += 1
+            return message if counter[0] > failure.statement else None
+        raise _locate(filename, message, at_statement, chunk_size)
+
+    defined, repeated = _bitmap(defined)
+    if repeated:
+        seen = set()
+        def duplicate(match):
+            if match.group('id') is None:
+                return None
+            entity_id = int(match.group('id'))
+            if entity_id in seen:
+                return "Duplicate entity #%d" % entity_id
+            seen.add(entity_id)
+        raise _locate(filename, "Duplicate entity", duplicate, chunk_size)
+
+    dangling = _missing(referenced, defined)
+    if dangling:
+        def reference(match):
+            body = match.group('body')
+            if body is None:
+                return None
+            for ref in _REF.findall(_QUOTED.sub(b'', body)):
+                if int(ref) in dangling:
+                    return "#%s references undefined #%s" % (match.group('id'), ref)
+        raise _locate(filename, "References to undefined entities: " +
+                      ", ".join('#%d' % ref for ref in sorted(dangling)[:10]),
+                      reference, chunk_size)
+
+    return instances
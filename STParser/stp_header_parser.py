@@ -1,34 +1,15 @@
-import re
+from STParser.header import read_header, length_unit
 
 class stp_header_parser():
 
     def stp_header_parser(self, stp_filename='', is_debug=False):
 
-        def get_unit_abbr(units):
-            prefix = {'MILLI': 'm'}
-            unit = {'METRE': 'm'}
-            return prefix[units[0]]+unit[units[1]]
-            
-        def remove_comments(line):
-            comment_pattern = re.compile('/\*.*?\*/')
-            return comment_pattern.sub('', line)
-        
-        def line_extract(filehandle=None, str_startswith='', str_endswith=''):
-
-            while True:
-
-                line = filehandle.readline().strip()
-                #if line.startswith(str_startswith):
-                if str_startswith in line:
-                    line_extracted = ''
-                    while True:
-                        line_extracted += line
-                        if line.endswith(str_endswith):
-                            break
-                        else:
-                            line = filehandle.readline().strip()
-
-                    return line_extracted
+        def flatten(value):
+            # single-element lists read as their element, as they did when
+            # the header lines were passed through eval()
+            if isinstance(value, list) and len(value) == 1:
+                return value[0]
+            return value
 
         infos_name = [
             'ISO Standard',
@@ -45,52 +26,18 @@ class stp_header_parser():
             'Unit'
         ]
 
-        infos_value = []
-
-        len_infos_name = len(infos_name)
-
-        with open(stp_filename, 'r') as f:
-            
-            line = line_extract(f, 'ISO-', ';')
-
-            if line:
-                ISO_Standard = line[:-1]
-                infos_value.append(ISO_Standard)
-
-            line = line_extract(f, 'HEADER', ';')
-
-            if line:
-                if is_debug:
-                    print('>>> Header Start Mark Found <<<')
-
-                line = line_extract(f, 'FILE_DESCRIPTION', ';')
-                line = remove_comments(line)
-                File_Description = eval(line[16:-1])
-                infos_value += File_Description
-
-                line = line_extract(f, 'FILE_NAME', ';')
-                line = remove_comments(line)
-                File_Name = eval(line[9:-1])
-                infos_value += File_Name
+        header = read_header(stp_filename)
+        if is_debug:
+            print('>>> Header Start Mark Found <<<')
+            print('>>> Header End Mark Found <<<')
 
-                line = line_extract(f, 'FILE_SCHEMA', ';')
-                line = remove_comments(line)
-                File_Schema = eval(line[11:-1])
-                infos_value.append(File_Schema)
+        infos_value = [header.iso]
+        infos_value += [flatten(value) for value in header.file_description]
+        infos_value += [flatten(value) for value in header.file_name]
+        infos_value.append(flatten(header.file_schema.schema_identifiers))
+        infos_value.append(length_unit(stp_filename) or "units")
 
-                if line_extract(f, 'ENDSEC', ';'):
-                    if is_debug:
-                        print('>>> Header End Mark Found <<<')
-            
-            while True:
-                line = line_extract(f, 'LENGTH_UNIT', ';')
-                units = line.split('SI_UNIT')
-                if(len(units) == 2):
-                    units = units[1].split('.')[1:4:2]
-                    units = get_unit_abbr(units)
-                    infos_value.append(units)
-                    break
-                
+        len_infos_name = len(infos_name)
 
         infos_dict = {
             index: list(parameter) for (
@@ -102,4 +49,4 @@ class stp_header_parser():
             for key in infos_dict:
                 print('{:02}\t{}'.format(key, infos_dict[key]))
 
-        return infos_dict
\ No newline at end of file
+        return infos_dict
@@ -0,0 +1,328 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Batch entry point: builds one TDP per manifest row across a process pool.
+#
+#   python batchTDP.py parts.csv --processes 8 --output results.jsonl
+#
+# The manifest is either CSV with a header row or JSON lines; each row needs
+# url (or inputFile), material and coatings. Each part runs in its own
+# scratch directory and produces one JSON line in --output. A part
+# that fails is recorded with status "error" and the batch carries on, as
+# is one whose worker process dies in a native crash.
+#
+# Every STEP file is downloaded and pre-flight checked in this process
+# first, and its cost predicted from its entity counts (tdpCost.py). Parts
+# predicted to take longer than --heavy-seconds go to a separate pool of
+# --heavy-processes workers so that they never hold up the small ones;
+# files that fail the check are recorded without taking a worker at all.
+# The workers take the staged file, its digest and its counts as they are;
+# at most --staged-parts files are staged at a time, so triage waits on the
+# workers instead of filling the disk.
+
+import os
+import sys
+import csv
+import json
+import errno
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from generateTDP import (validate_inputs, run_tdp, open_cache, open_download_cache,
+                         download_stp_file, decompress_stp_file, check_stp_file,
+                         GEOMETRY_BACKENDS, BOUNDINGBOX_MODES, PRECISIONS,
+                         DEFAULT_PRECISION)
+from tdpUtility import TDPError
+from tdpMetrics import StageRecorder
+from tdpCost import CostModel, COST_MODEL_FILE, HEAVY_SECONDS
+
+# downloads and pre-flight checks run in threads of the parent process
+TRIAGE_THREADS = 4
+# how often the parent checks that the workers of running parts are alive
+POLL_INTERVAL = 1.
+
+def read_manifest(filename):
+    with open(filename) as f:
+        if filename.endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for index, row in enumerate(rows):
+        jobs.append({
+            'index': index,
+            'inputFile': (row.get('url') or row.get('inputFile') or '').strip(),
+            'material': (row.get('material') or '').strip(),
+            'coatings': (row.get('coatings') or '').strip()
+        })
+
+    return jobs
+
+def _discard(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+def _marker(staged):
+    '''the file a worker writes its pid to while it runs the part staged as
+    staged
+    '''
+    return staged + '.pid'
+
+def _lost(staged):
+    '''true if the worker that started the part staged as staged has died
+    without finishing it, as after a crash in OCC: the pool replaces the
+    worker, but the part would never return
+    '''
+    try:
+        with open(_marker(staged)) as f:
+            pid = int(f.read())
+    except (IOError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.EPERM
+    return False
+
+def triage_part(args):
+    '''downloads the STEP file of job into staging and checks it once one
+    of the slots is free; returns the record so far and (local file, hex
+    digest, entity counts), or None and the slot back if the part has
+    already failed
+    '''
+    job, staging, model, downloads, slots = args
+
+    record = dict(job)
+    filename = os.path.join(staging, str(job['index']) + '.stp')
+    slots.acquire()
+    try:
+        try:
+            validate_inputs(job['inputFile'], job['material'], job['coatings'])
+        except:
+            raise TDPError("One or more of the inputs is not valid.")
+        digest = download_stp_file(job['inputFile'], filename, downloads).hexdigest()
+        filename = decompress_stp_file(filename)
+        counts = check_stp_file(filename)
+    except TDPError as e:
+        record['outputFile'] = str(e)
+        record['status'] = 'error'
+        _discard(filename)
+        slots.release()
+        return record, None
+    except BaseException:
+        record['outputFile'] = "Unknown error."
+        record['status'] = 'error'
+        _discard(filename)
+        slots.release()
+        return record, None
+
+    record['predicted'] = model.predict(counts)
+    return record, (filename, digest, counts)
+
+def run_part(args):
+    '''runs the part staged by triage_part, or downloads it if staged is
+    None
+    '''
+    job, staged, workdir, profile_dir, cache_dir, cache_size, geometry, boundingbox, precision = args
+
+    record = dict(job)
+    if staged:
+        with open(_marker(staged[0]), 'w') as f:
+            f.write(str(os.getpid()))
+    start = time.time()
+    recorder = StageRecorder(profile_dir=profile_dir)
+
+    try:
+        try:
+            validate_inputs(job['inputFile'], job['material'], job['coatings'])
+        except:
+            raise TDPError("One or more of the inputs is not valid.")
+
+        record['outputFile'] = run_tdp(job['inputFile'], job['material'], job['coatings'],
+                                       recorder=recorder,
+                                       cache=open_cache(cache_dir, cache_size),
+                                       scratch=workdir, geometry=geometry,
+                                       boundingbox=boundingbox, precision=precision,
+                                       staged=staged)
+        record['status'] = 'ok'
+    except TDPError as e:
+        record['outputFile'] = str(e)
+        record['status'] = 'error'
+    except BaseException:
+        record['outputFile'] = "Unknown error."
+        record['status'] = 'error'
+
+    if staged:
+        _discard(staged[0])
+        _discard(_marker(staged[0]))
+    record['seconds'] = round(time.time() - start, 3)
+    record['stages'] = recorder.stages
+    if 'cache' in recorder.info:
+        record['cache'] = recorder.info['cache']
+    return record
+
+def run_batch(jobs, workdir, output, processes=None, profile_dir=None,
+              cache_dir=None, cache_size=None, heavy_processes=1,
+              heavy_seconds=HEAVY_SECONDS, cost_model=COST_MODEL_FILE,
+              download_dir=None, download_size=4096, geometry="exact",
+              boundingbox="tight", precision=DEFAULT_PRECISION, staged_parts=None):
+    if workdir:
+        workdir = os.path.abspath(workdir)
+    if profile_dir:
+        profile_dir = os.path.abspath(profile_dir)
+    if cache_dir:
+        cache_dir = os.path.abspath(cache_dir)
+    model = CostModel.load(cost_model)
+    downloads = open_download_cache(download_dir, download_size)
+    staging = tempfile.mkdtemp(prefix='tdp_staging_', dir=workdir)
+    if not staged_parts:
+        staged_parts = 2 * ((processes or multiprocessing.cpu_count()) + heavy_processes)
+    # a slot is taken for each file staged and given back when its part
+    # finishes, fails triage or is lost
+    slots = threading.BoundedSemaphore(staged_parts)
+
+    triage = ThreadPool(processes=TRIAGE_THREADS)
+    pools = {'light': multiprocessing.Pool(processes=processes),
+             'heavy': multiprocessing.Pool(processes=heavy_processes)}
+    lock = threading.Lock()
+    failed = [0]
+    lost = set()
+
+    try:
+        with open(output, 'w') as out:
+            # records arrive from the triage loop and from the result
+            # threads of both pools
+            def write(record):
+                with lock:
+                    if record['status'] != 'ok':
+                        failed[0] += 1
+                    out.write(json.dumps(record) + '\n')
+                    out.flush()
+                    print "Part " + str(record['index']) + ": " + record['status']
+
+            def finished(record):
+                slots.release()
+                write(record)
+
+            pending = []
+
+            def submit(record, staged):
+                if staged is None:
+                    write(record)
+                    return
+                record['pool'] = ('heavy' if record['predicted']['total'] > heavy_seconds
+                                  else 'light')
+                task = (record, staged, workdir, profile_dir, cache_dir, cache_size, geometry,
+                        boundingbox, precision)
+                pending.append((record, staged[0], pools[record['pool']].apply_async(
+                    run_part, (task,), callback=finished)))
+
+            tasks = [(job, staging, model, downloads, slots) for job in jobs]
+            triaged = triage.imap_unordered(triage_part, tasks)
+            triaging = True
+            # a part whose worker died never returns, so results are not
+            # waited for without checking on the workers, and triage may
+            # be waiting for the slot of a lost part
+            while triaging or pending:
+                if triaging:
+                    try:
+                        record, staged = triaged.next(POLL_INTERVAL)
+                    except StopIteration:
+                        triaging = False
+                    except multiprocessing.TimeoutError:
+                        pass
+                    else:
+                        submit(record, staged)
+                else:
+                    pending[0][2].wait(POLL_INTERVAL)
+
+                for entry in list(pending):
+                    record, staged, result = entry
+                    if result.ready():
+                        pending.remove(entry)
+                    elif _lost(staged):
+                        pending.remove(entry)
+                        _discard(staged)
+                        _discard(_marker(staged))
+                        record['outputFile'] = "Worker process died."
+                        record['status'] = 'error'
+                        finished(record)
+                        lost.add(record['pool'])
+        # a pool still holding a lost part would wait for it on join
+        for name, pool in pools.items():
+            if name in lost:
+                pool.terminate()
+            else:
+                pool.close()
+    except:
+        for pool in pools.values():
+            pool.terminate()
+        raise
+    finally:
+        triage.close()
+        for pool in pools.values():
+            pool.join()
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return failed[0]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate TDPs for every part in a manifest.")
+    parser.add_argument('manifest', help="CSV or JSON-lines file with url, material and coatings")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument('--workdir', default=None,
+                        help="parent of the per-part scratch directories (default: system temp)")
+    parser.add_argument('--output', default='results.jsonl',
+                        help="JSON-lines file with one result record per part")
+    parser.add_argument('--profile', metavar='DIR', nargs='?', const='profiles',
+                        help="dump cProfile stats for every stage into DIR")
+    parser.add_argument('--cache', metavar='DIR',
+                        help="reuse finished TDPs for identical STEP/material/coatings")
+    parser.add_argument('--cache-size', type=int, default=2048, metavar='MB',
+                        help="result cache size limit (default: 2048 MB)")
+    parser.add_argument('--heavy-processes', type=int, default=1,
+                        help="worker processes for parts predicted to be heavy (default: 1)")
+    parser.add_argument('--heavy-seconds', type=float, default=HEAVY_SECONDS,
+                        help="predicted seconds above which a part is heavy (default: %d)"
+                             % HEAVY_SECONDS)
+    parser.add_argument('--cost-model', default=COST_MODEL_FILE,
+                        help="calibrated cost model, see benchmarks/calibrate_cost.py")
+    parser.add_argument('--download-cache', metavar='DIR',
+                        help="keep downloaded STEP files by URL and revalidate them")
+    parser.add_argument('--download-cache-size', type=int, default=4096, metavar='MB',
+                        help="download cache size limit (default: 4096 MB)")
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="exact",
+                        help="exact BRep integration, or a faster mesh estimate (needs NumPy)")
+    parser.add_argument('--boundingbox', choices=BOUNDINGBOX_MODES, default="tight",
+                        help="stock size from the padded OCC box, the exact axis-aligned box, or "
+                             "an oriented box (needs NumPy) (default: tight)")
+    parser.add_argument('--precision', choices=sorted(PRECISIONS), default=DEFAULT_PRECISION,
+                        help="integration error bound, or mesh deflection, traded against time "
+                             "(default: %s)" % DEFAULT_PRECISION)
+    parser.add_argument('--staged-parts', type=int, default=None,
+                        help="STEP files downloaded ahead of the workers at most (default: "
+                             "twice the number of worker processes)")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    jobs = read_manifest(args.manifest)
+    args.output = os.path.abspath(args.output)
+
+    failed = run_batch(jobs, args.workdir, args.output, args.processes, args.profile,
+                       args.cache, args.cache_size, args.heavy_processes,
+                       args.heavy_seconds, args.cost_model, args.download_cache,
+                       args.download_cache_size, args.geometry, args.boundingbox,
+                       args.precision, args.staged_parts)
+
+    print str(len(jobs) - failed) + " of " + str(len(jobs)) + " parts succeeded."
+    sys.exit(1 if failed else 0)
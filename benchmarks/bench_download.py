@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Compares the streaming downloader (tdpDownload.py) with the urlretrieve
+# download it replaced, against a local HTTP server. For every corpus file
+# it times the full download plus hashing, and the time until the STEP
+# header is parsed; a second server drops every connection half way through
+# the file once, to check that the resumed download hashes to the same
+# digest. The 'cached' method goes through a download cache that the
+# server revalidates with 304 Not Modified. Results go to
+# benchmarks/results/download_<timestamp>.json.
+#
+#   python -m benchmarks.bench_download --repeat 5
+
+import os
+import json
+import time
+import shutil
+import urllib
+import tempfile
+import argparse
+
+from tdpCache import file_digest, DownloadCache
+from tdpDownload import Download
+from STParser.header import read_header
+
+from benchmarks.common import RESULTS_DIR, percentile, environment
+from benchmarks.standins import serve_directory
+
+def legacy_download(url, filename):
+    '''urlretrieve, then the cache hash and the header read from disk
+    '''
+    start = time.time()
+    urllib.urlretrieve(url, filename)
+    read_header(filename)
+    header = time.time() - start
+    digest = file_digest(filename).hexdigest()
+    return header, time.time() - start, digest
+
+def streaming_download(url, filename, cache=None):
+    start = time.time()
+    download = Download(url, filename, cache=cache)
+    download.start()
+    with download.stream() as stream:
+        read_header(stream)
+    header = time.time() - start
+    digest = download.result().hexdigest()
+    return header, time.time() - start, digest
+
+def bench(func, url, filename, repeat):
+    headers, totals, digests = [], [], set()
+    for _ in range(repeat):
+        header, total, digest = func(url, filename)
+        headers.append(header)
+        totals.append(total)
+        digests.add(digest)
+    return {'header_p50': percentile(headers, 50), 'p50': percentile(totals, 50),
+            'p90': percentile(totals, 90), 'digests': sorted(digests)}
+
+def run(corpus, repeat, output):
+    results = {'environment': environment(), 'repeat': repeat, 'files': []}
+    files = sorted(name for name in os.listdir(corpus)
+                   if name.lower().endswith(('.stp', '.step')))
+    scratch = tempfile.mkdtemp(prefix='tdp_bench_download_')
+    filename = os.path.join(scratch, 'download.stp')
+
+    cache = DownloadCache(os.path.join(scratch, 'cache'), 1 << 40)
+    cached_download = lambda url, filename: streaming_download(url, filename, cache)
+
+    server, base_url = serve_directory(corpus)
+    try:
+        print "%-28s %-10s %10s %10s" % ('file', 'method', 'header', 'p50')
+        for name in files:
+            size = os.path.getsize(os.path.join(corpus, name))
+            entry = {'file': name, 'bytes': size, 'methods': {}}
+            for method, func in (('legacy', legacy_download), ('streaming', streaming_download),
+                                 ('cached', cached_download)):
+                timing = bench(func, base_url + name, filename, repeat)
+                entry['methods'][method] = timing
+                print "%-28s %-10s %10.4f %10.4f" % (name, method, timing['header_p50'],
+                                                     timing['p50'])
+
+            # a fresh server per file, as each drops the connection only once
+            dropping, dropping_url = serve_directory(corpus, drop_at=size // 2)
+            try:
+                download = Download(dropping_url + name, filename)
+                download.start()
+                entry['resumed'] = {'digest': download.result().hexdigest(),
+                                    'resumed': download.resumed}
+            finally:
+                dropping.shutdown()
+            entry['resumed']['matches'] = (
+                entry['resumed']['digest'] in entry['methods']['legacy']['digests'])
+            print "%-28s %-10s %s" % (name, 'resumed',
+                                      'ok' if entry['resumed']['matches'] else 'DIGEST MISMATCH')
+            results['files'].append(entry)
+    finally:
+        server.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Results written to " + output
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the streaming STEP downloader.")
+    parser.add_argument('--corpus', default=os.path.join('benchmarks', 'corpus'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=os.path.join(
+        RESULTS_DIR, 'download_' + time.strftime('%Y%m%dT%H%M%S') + '.json'))
+    args = parser.parse_args()
+
+    run(args.corpus, args.repeat, os.path.abspath(args.output))
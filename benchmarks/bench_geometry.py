@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Compares the precision tiers of exact integration (tdpMassProps.py) and
+# the mesh geometry backend (tdpMesh.py) on the corpus. Every tier and
+# deflection ratio is timed, and the actual relative error of volume and
+# area against the exact tier is recorded next to the error achieved or
+# estimated by the integration or mesh itself. Every
+# bounding box mode (tdpBoundingBox.py) is timed as well, with the volume of
+# its box relative to the tight one. Results go to
+# benchmarks/results/geometry_<timestamp>.json.
+#
+#   python -m benchmarks.bench_geometry --repeat 3 --ratios 1e-2 1e-3 1e-4
+
+import os
+import json
+import time
+import argparse
+
+import tdpMesh
+import tdpBoundingBox
+from tdpAssembly import read_assembly
+from tdpMassProps import mass_properties, PRECISIONS
+
+from benchmarks.common import RESULTS_DIR, percentile, environment
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        times.append(time.time() - start)
+    return result, {'p50': percentile(times, 50), 'p90': percentile(times, 90)}
+
+def relative(value, exact):
+    return abs(value - exact) / abs(exact) if exact else abs(value)
+
+def run(files, ratios, repeat, output):
+    results = {'environment': environment(), 'repeat': repeat, 'ratios': ratios, 'files': []}
+
+    print "%-28s %-8s %10s %12s %12s %12s" % ('file', 'ratio', 'p50', 'volume err',
+                                               'estimated', 'area err')
+    for filename in files:
+        shape = read_assembly(filename).shape
+        entry = {'file': os.path.basename(filename), 'precision': {}, 'mesh': []}
+        # the exact tier is the reference for everything else
+        exact = None
+        for precision in ["exact"] + sorted(set(PRECISIONS) - set(["exact"])):
+            props, timing = timed(lambda: mass_properties(shape, precision), repeat)
+            exact = exact or props
+            timing.update(volume_error=relative(props['volume'], exact['volume']),
+                          area_error=relative(props['area'], exact['area']),
+                          achieved=props['error'])
+            entry['precision'][precision] = timing
+            print "%-28s %-8s %10.4f %12.3e %12s %12.3e" % (
+                entry['file'], precision, timing['p50'], timing['volume_error'],
+                '%.3e' % props['error']['volume'] if props['error'] else '-',
+                timing['area_error'])
+
+        for ratio in ratios:
+            deflection = tdpMesh.deflection_of(shape, ratio)
+            mesh, timing = timed(lambda: tdpMesh.mesh_properties(shape, deflection), repeat)
+            timing.update(ratio=ratio, triangles=mesh['triangles'],
+                          volume_error=relative(mesh['volume'], exact['volume']),
+                          area_error=relative(mesh['area'], exact['area']),
+                          estimated=mesh['error'])
+            entry['mesh'].append(timing)
+            print "%-28s %-8g %10.4f %12.3e %12.3e %12.3e" % (
+                entry['file'], ratio, timing['p50'], timing['volume_error'],
+                mesh['error']['volume'], timing['area_error'])
+
+        entry['boundingbox'] = {}
+        for mode in tdpBoundingBox.MODES:
+            box, timing = timed(lambda: tdpBoundingBox.bounding_box(shape, mode), repeat)
+            size = box['size']
+            timing.update(size=size, error=box['error'], box_volume=size[0] * size[1] * size[2])
+            entry['boundingbox'][mode] = timing
+        tight = entry['boundingbox']['tight']['box_volume']
+        for mode in tdpBoundingBox.MODES:
+            timing = entry['boundingbox'][mode]
+            timing['relative_volume'] = timing['box_volume'] / tight if tight else None
+            print "%-28s %-8s %10.4f %12s %12s %12s" % (
+                entry['file'], mode, timing['p50'], '', '',
+                '%.4f' % timing['relative_volume'] if tight else '')
+        results['files'].append(entry)
+
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Results written to " + output
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark mesh against exact geometry.")
+    parser.add_argument('--corpus', default=os.path.join('benchmarks', 'corpus'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--ratios', type=float, nargs='+',
+                        default=[1e-2, tdpMesh.DEFLECTION_RATIO, 1e-4],
+                        help="mesh deflections as fractions of the bounding box diagonal")
+    parser.add_argument('--output', default=os.path.join(
+        RESULTS_DIR, 'geometry_' + time.strftime('%Y%m%dT%H%M%S') + '.json'))
+    args = parser.parse_args()
+
+    files = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                   if name.lower().endswith(('.stp', '.step')))
+    run(files, args.ratios, args.repeat, os.path.abspath(args.output))
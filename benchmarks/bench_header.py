@@ -0,0 +1,273 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Compares the Part 21 header parser (STParser.part21) with the line based,
+# eval() driven parser it replaced. Headers are written in the styles of the
+# common exporters, each followed by a DATA section of the requested size, and
+# any .stp files in --corpus are added. Both parsers run on every file; the
+# p50/p90 times, and whether the legacy parser failed, go to
+# benchmarks/results/header_<timestamp>.json.
+#
+#   python -m benchmarks.bench_header --repeat 20 --data-size 1048576
+
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import argparse
+
+from STParser.stp_header_parser import stp_header_parser
+from STParser.header import read_header
+
+from benchmarks.common import RESULTS_DIR, percentile, environment
+
+HEADERS = {
+    'solidworks': """ISO-10303-21;
+HEADER;
+FILE_DESCRIPTION (( 'STEP AP214' ),
+    '1' );
+FILE_NAME ('Bracket.STEP',
+    '2017-03-02T10:20:30',
+    ( '' ),
+    ( '' ),
+    'SwSTEP 2.0',
+    'SolidWorks 2016',
+    '' );
+FILE_SCHEMA (( 'AUTOMOTIVE_DESIGN' ));
+ENDSEC;
+""",
+    'creo': """ISO-10303-21;
+HEADER;
+FILE_DESCRIPTION(('a Product shape'),'2;1');
+FILE_NAME('ASM0001','2017-03-02T10:20:30',('jdoe'),('ACME'),
+'CREO PARAMETRIC BY PTC INC, 2016030','CREO PARAMETRIC BY PTC INC, 2016030','');
+FILE_SCHEMA(('AUTOMOTIVE_DESIGN { 1 0 10303 214 1 1 1 1 }'));
+ENDSEC;
+""",
+    'catia': """ISO-10303-21;
+HEADER;
+/* Generated by software containing ST-Developer
+ * from STEP Tools, Inc. (www.steptools.com)
+ */
+FILE_DESCRIPTION(
+/* description */ ('CATIA V5 STEP Exchange'),
+/* implementation_level */ '2;1');
+FILE_NAME(
+/* name */ 'Part1',
+/* time_stamp */ '2017-03-02T10:20:30+00:00',
+/* author */ ('none'),
+/* organization */ ('none'),
+/* preprocessor_version */ 'ST-DEVELOPER v16',
+/* originating_system */ 'CATIA Version 5 Release 26 (IN-10)',
+/* authorisation */ 'none');
+FILE_SCHEMA (('CONFIG_CONTROL_DESIGN'));
+ENDSEC;
+""",
+    'nx_unicode': """ISO-10303-21;
+HEADER;
+FILE_DESCRIPTION(('NX STEP Export','Part ''A'' rev. 2'),'2;1');
+FILE_NAME('\\X2\\00C400D6\\X0\\-Halter.stp','2017-03-02T10:20:30',('M\\X\\FCller'),
+('Stra\\S\\_e'),'NX 11','NX 11','');
+FILE_SCHEMA(('AP242_MANAGED_MODEL_BASED_3D_ENGINEERING_MIM_LF { 1 0 10303 442 1 1 4 }'));
+ENDSEC;
+"""
+}
+
+UNIT = "#10=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT(.MILLI.,.METRE.));\n"
+DATA_LINE = "#%d=CARTESIAN_POINT('',(%d.,%d.5,-%d.25));\n"
+DATA_END = """ENDSEC;
+END-ISO-10303-21;
+"""
+
+def legacy_header_parser(stp_filename):
+    '''STParser.stp_header_parser as it was before STParser.part21, kept
+    verbatim apart from the class wrapper and the debug output
+    '''
+    def get_unit_abbr(units):
+        prefix = {'MILLI': 'm'}
+        unit = {'METRE': 'm'}
+        return prefix[units[0]]+unit[units[1]]
+
+    def remove_comments(line):
+        comment_pattern = re.compile('/\*.*?\*/')
+        return comment_pattern.sub('', line)
+
+    def line_extract(filehandle=None, str_startswith='', str_endswith='', str_contains=''):
+        for line in filehandle:
+            line = line.strip()
+            if str_startswith in line:
+                line_extracted = line
+                if line.endswith(str_endswith):
+                    if str_contains in line_extracted:
+                        return line_extracted
+                    else:
+                        continue
+                for line in filehandle:
+                    line = line.strip()
+                    line_extracted += line
+                    if line.endswith(str_endswith):
+                        if str_contains in line_extracted:
+                            return line_extracted
+                        else:
+                            break
+                else:
+                    return ""
+        else:
+            return ""
+
+    infos_name = [
+        'ISO Standard',
+        'Description',
+        'Implementation Level',
+        'Name',
+        'Time_Stamp',
+        'Author',
+        'Organization',
+        'Preprocessor Version',
+        'Originating System',
+        'Authorization',
+        'Schema',
+        'Unit'
+    ]
+
+    infos_value = []
+
+    len_infos_name = len(infos_name)
+
+    with open(stp_filename, 'r') as f:
+
+        line = line_extract(f, 'ISO-', ';')
+
+        if line:
+            ISO_Standard = line[:-1]
+            infos_value.append(ISO_Standard)
+
+        line = line_extract(f, 'HEADER', ';')
+
+        if line:
+            line = line_extract(f, 'FILE_DESCRIPTION', ';')
+            line = remove_comments(line)
+            File_Description = eval(line[16:-1])
+            infos_value += File_Description
+
+            line = line_extract(f, 'FILE_NAME', ';')
+            line = remove_comments(line)
+            File_Name = eval(line[9:-1])
+            infos_value += File_Name
+
+            line = line_extract(f, 'FILE_SCHEMA', ';')
+            line = remove_comments(line)
+            File_Schema = eval(line[11:-1])
+            infos_value.append(File_Schema)
+
+            line_extract(f, 'ENDSEC', ';')
+
+        line = line_extract(f, 'LENGTH_UNIT', ';', 'SI_UNIT')
+        units = line.split('SI_UNIT')
+        if(len(units) == 2):
+            units = units[1].split('.')[1:4:2]
+            units = get_unit_abbr(units)
+            infos_value.append(units)
+        else:
+            infos_value.append("units")
+
+    return {
+        index: list(parameter) for (
+            index, parameter) in zip(
+            range(len_infos_name), zip(
+                infos_name, infos_value))}
+
+def current_header_parser(stp_filename):
+    return stp_header_parser().stp_header_parser(stp_filename=stp_filename)
+
+def header_only(stp_filename):
+    return read_header(stp_filename)
+
+PARSERS = [('legacy', legacy_header_parser),
+           ('part21', current_header_parser),
+           ('part21_header_only', header_only)]
+
+def write_samples(directory, data_size):
+    '''one file per header style with the unit context at the start of the
+    DATA section, and one with it at the end
+    '''
+    files = []
+    for style in sorted(HEADERS):
+        for unit_last in (False, True):
+            filename = os.path.join(directory, style + ('_unit_last' if unit_last else '') + '.stp')
+            with open(filename, 'w') as f:
+                f.write(HEADERS[style])
+                f.write("DATA;\n")
+                if not unit_last:
+                    f.write(UNIT)
+                written, index = 0, 100
+                while written < data_size:
+                    line = DATA_LINE % (index, index, index, index)
+                    f.write(line)
+                    written += len(line)
+                    index += 1
+                if unit_last:
+                    f.write(UNIT)
+                f.write(DATA_END)
+            files.append(filename)
+    return files
+
+def bench_parser(func, filename, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        try:
+            func(filename)
+        except Exception as e:
+            return {'error': "%s: %s" % (type(e).__name__, e)}
+        times.append(time.time() - start)
+    return {'p50': percentile(times, 50), 'p90': percentile(times, 90),
+            'min': min(times), 'max': max(times)}
+
+def run(files, repeat, output):
+    results = {'environment': environment(), 'repeat': repeat, 'files': []}
+
+    print "%-24s %-20s %10s %10s" % ('file', 'parser', 'p50', 'p90')
+    for filename in files:
+        entry = {'file': os.path.basename(filename), 'bytes': os.path.getsize(filename),
+                 'parsers': {}}
+        for name, func in PARSERS:
+            timing = bench_parser(func, filename, repeat)
+            entry['parsers'][name] = timing
+            if 'error' in timing:
+                print "%-24s %-20s %s" % (entry['file'], name, timing['error'])
+            else:
+                print "%-24s %-20s %10.6f %10.6f" % (entry['file'], name,
+                                                     timing['p50'], timing['p90'])
+        results['files'].append(entry)
+
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Results written to " + output
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark STEP header parsing against the legacy parser.")
+    parser.add_argument('--corpus', default=os.path.join('benchmarks', 'corpus'),
+                        help="directory of additional .stp files")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--data-size', type=int, default=1024 * 1024,
+                        help="bytes of DATA section after each sample header")
+    parser.add_argument('--output', default=os.path.join(
+        RESULTS_DIR, 'header_' + time.strftime('%Y%m%dT%H%M%S') + '.json'))
+    args = parser.parse_args()
+
+    sample_dir = tempfile.mkdtemp(prefix='tdp_bench_header_')
+    try:
+        files = write_samples(sample_dir, args.data_size)
+        if os.path.isdir(args.corpus):
+            files += sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                            if name.lower().endswith(('.stp', '.step')))
+        run(files, args.repeat, os.path.abspath(args.output))
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
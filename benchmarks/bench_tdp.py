@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Times every stage of generateTDP.py and the hot OCCUtils helpers against the
+# synthetic corpus (see benchmarks/corpus.py). Downloads come from a local HTTP
+# server and uploads go to a local S3 stand-in. Results are written as JSON
+# to benchmarks/results/<timestamp>.json; pass --compare to diff against an
+# earlier run.
+#
+#   python -m benchmarks.corpus
+#   python -m benchmarks.bench_tdp --repeat 5
+#   python -m benchmarks.bench_tdp --compare benchmarks/results/20170101T000000.json
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+
+import generateTDP
+from tdpMetrics import StageRecorder
+from tdpUtility import JobDirectory
+from tdpMassProps import PRECISIONS
+from OCCUtils.Common import get_boundingbox, GpropsFromShape
+from OCCUtils.Topology import Topo
+
+from benchmarks.common import RESULTS_DIR, percentile, environment
+from benchmarks.standins import serve_directory, install_local_s3, restore_s3
+
+MATERIAL = "Steel"
+COATINGS = "benchmark"
+
+def summarize(entries, size=None):
+    walls = [entry['wall'] for entry in entries]
+    summary = {
+        'runs': len(walls),
+        'min': min(walls),
+        'mean': sum(walls) / len(walls),
+        'p50': percentile(walls, 50),
+        'p90': percentile(walls, 90),
+        'p99': percentile(walls, 99),
+        'max': max(walls),
+        'cpu_mean': sum(entry['cpu'] for entry in entries) / len(entries),
+        'peak_rss_kb': max(entry['peak_rss_kb'] for entry in entries),
+        'throughput_per_s': len(walls) / sum(walls) if sum(walls) else None
+    }
+    if size:
+        summary['mb_per_s'] = size / 1048576. / summary['p50'] if summary['p50'] else None
+    return summary
+
+def no_snapshots(shape, renderer, job):
+    return []
+
+def bench_stages(url, recorder, snapshots):
+    '''runs the pipeline stages one after another so that each timing is
+    free of interference from the others
+    '''
+    with JobDirectory() as job:
+        filename = job.join(generateTDP.FILENAME)
+        with recorder.stage('download_stp_file'):
+            generateTDP.download_stp_file(url, filename)
+        with recorder.stage('check_stp_file'):
+            generateTDP.check_stp_file(filename)
+        with recorder.stage('get_metadata'):
+            metadata = generateTDP.get_metadata(filename, MATERIAL, COATINGS)
+        with recorder.stage('import_step'):
+            assembly = generateTDP.load_assembly(filename)
+            shape = assembly.shape
+        with recorder.stage('get_geometry'):
+            geometry = generateTDP.get_parts_geometry(assembly, MATERIAL, metadata['unit'], job)
+        with recorder.stage('generate_xml'):
+            xml = generateTDP.generate_xml(metadata, assembly, geometry)
+        if snapshots:
+            with recorder.stage('get_snapshots'):
+                images = generateTDP.get_snapshots(shape, None, job)
+        else:
+            images = []
+        with recorder.stage('generate_face_table'):
+            faces = generateTDP.generate_face_table(xml, geometry)
+        with recorder.stage('generate_zip'):
+            zip_filename, archive = generateTDP.generate_zip(xml, filename, images, job, faces)
+        with recorder.stage('upload_zip'):
+            generateTDP.upload_zip(zip_filename, archive)
+        archive.close()
+
+    with recorder.stage('occutils.get_boundingbox'):
+        get_boundingbox(shape)
+    with recorder.stage('occutils.number_of_faces'):
+        Topo(shape).number_of_faces()
+    for precision, tolerance in sorted(PRECISIONS.items()):
+        gprops = GpropsFromShape(shape, tolerance)
+        with recorder.stage('occutils.volume.' + precision) as stage:
+            gprops.volume()
+            stage['achieved'] = gprops.error
+        with recorder.stage('occutils.surface.' + precision) as stage:
+            gprops.surface()
+            stage['achieved'] = gprops.error
+
+def bench_file(entry, base_url, repeat, snapshots):
+    url = base_url + entry['file']
+    stages = {}
+
+    for _ in range(repeat):
+        recorder = StageRecorder()
+        bench_stages(url, recorder, snapshots)
+        for stage in recorder.stages:
+            stages.setdefault(stage['stage'], []).append(stage)
+
+    end_to_end = []
+    for _ in range(repeat):
+        recorder = StageRecorder()
+        start = time.time()
+        cpu = sum(os.times()[:4])
+        generateTDP.run_tdp(url, MATERIAL, COATINGS, recorder=recorder)
+        end_to_end.append({
+            'wall': time.time() - start,
+            'cpu': sum(os.times()[:4]) - cpu,
+            'peak_rss_kb': max(stage['peak_rss_kb'] for stage in recorder.stages)
+        })
+
+    sized = ('download_stp_file', 'check_stp_file', 'get_metadata', 'import_step')
+    result = dict(entry)
+    result['stages'] = dict(
+        (name, summarize(entries, entry['bytes'] if name in sized else None))
+        for name, entries in stages.items())
+    result['end_to_end'] = summarize(end_to_end, entry['bytes'])
+    return result
+
+def compare(previous, current):
+    '''prints the p50 ratio current/previous for every file and stage
+    '''
+    old = dict((entry['file'], entry) for entry in previous['files'])
+
+    print "%-28s %-28s %10s %10s %7s" % ('file', 'stage', 'old p50', 'new p50', 'ratio')
+    for entry in current['files']:
+        if entry['file'] not in old:
+            continue
+        before = dict(old[entry['file']]['stages'], end_to_end=old[entry['file']]['end_to_end'])
+        after = dict(entry['stages'], end_to_end=entry['end_to_end'])
+        for stage in sorted(after):
+            if stage not in before or not before[stage]['p50']:
+                continue
+            print "%-28s %-28s %10.4f %10.4f %7.2f" % (
+                entry['file'], stage, before[stage]['p50'], after[stage]['p50'],
+                after[stage]['p50'] / before[stage]['p50'])
+
+def run(corpus, repeat, snapshots, output):
+    with open(os.path.join(corpus, 'corpus.json')) as f:
+        entries = json.load(f)
+
+    server, base_url = serve_directory(corpus)
+    workdir = tempfile.mkdtemp(prefix='tdp_bench_')
+    cwd = os.getcwd()
+    previous_s3 = install_local_s3(generateTDP, os.path.join(workdir, 's3'))
+    previous_snapshots = generateTDP.get_snapshots
+    if not snapshots:
+        generateTDP.get_snapshots = no_snapshots
+
+    results = {'environment': environment(), 'repeat': repeat,
+               'snapshots': snapshots, 'files': []}
+    try:
+        os.chdir(workdir)
+        for entry in entries:
+            print "Benchmarking " + entry['file'] + "..."
+            results['files'].append(bench_file(entry, base_url, repeat, snapshots))
+    finally:
+        os.chdir(cwd)
+        generateTDP.get_snapshots = previous_snapshots
+        restore_s3(generateTDP, previous_s3)
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Results written to " + output
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the TDP pipeline on the synthetic corpus.")
+    parser.add_argument('--corpus', default=os.path.join('benchmarks', 'corpus'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--snapshots', action='store_true',
+                        help="include snapshot rendering (needs xvfb-run)")
+    parser.add_argument('--output', default=os.path.join(
+        RESULTS_DIR, time.strftime('%Y%m%dT%H%M%S') + '.json'))
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.repeat, args.snapshots, os.path.abspath(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Fits the job cost model (tdpCost.py) to a benchmark run: the entity counts
+# of every corpus file against the p50 time of its import_step, get_geometry
+# and get_snapshots stages. Stages the run did not time (get_snapshots
+# without --snapshots) keep their current coefficients.
+#
+#   python -m benchmarks.bench_tdp --snapshots --repeat 5
+#   python -m benchmarks.calibrate_cost benchmarks/results/20170101T000000.json
+
+import os
+import json
+import time
+import argparse
+from collections import Counter
+
+from STParser.preflight import preflight
+from tdpCost import CostModel, STAGES, COST_MODEL_FILE, fit
+
+from benchmarks.common import RESULTS_DIR
+
+def latest_results(directory=RESULTS_DIR):
+    runs = sorted(name for name in os.listdir(directory)
+                  if name.endswith('.json') and name[0].isdigit())
+    if not runs:
+        raise SystemExit("No benchmark results in " + directory)
+    return os.path.join(directory, runs[-1])
+
+def calibrate(results, corpus, model):
+    samples = dict((stage, []) for stage in STAGES)
+    for entry in results['files']:
+        counts = Counter()
+        preflight(os.path.join(corpus, entry['file']), counts=counts)
+        for stage in STAGES:
+            if stage in entry['stages']:
+                samples[stage].append((counts, entry['stages'][stage]['p50']))
+
+    coefficients = dict(model.coefficients)
+    for stage in STAGES:
+        if len(samples[stage]) < 2:
+            print "%-14s not enough samples, keeping current coefficients" % stage
+            continue
+        coefficients[stage] = fit(samples[stage])
+
+        fitted = CostModel({stage: coefficients[stage]})
+        errors = [abs(fitted.predict(counts)[stage] - seconds) / seconds
+                  for counts, seconds in samples[stage] if seconds]
+        print "%-14s %d samples, mean relative error %.1f%%" % (
+            stage, len(samples[stage]), 100. * sum(errors) / max(len(errors), 1))
+
+    return CostModel(coefficients)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibrate the job cost model from a benchmark run.")
+    parser.add_argument('results', nargs='?', help="bench_tdp results file (default: latest)")
+    parser.add_argument('--corpus', default=os.path.join('benchmarks', 'corpus'))
+    parser.add_argument('--output', default=COST_MODEL_FILE)
+    args = parser.parse_args()
+
+    results_file = args.results or latest_results()
+    with open(results_file) as f:
+        results = json.load(f)
+
+    model = calibrate(results, args.corpus, CostModel.load(args.output))
+    model.save(args.output, calibrated=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+               results=os.path.basename(results_file),
+               host=results['environment'].get('host'))
+    print "Cost model written to " + args.output
@@ -0,0 +1,34 @@
+# Helpers shared by the benchmarks. Only the standard library is imported
+# here, so that benchmarks of the parsers and downloads run without OCC or
+# boto installed.
+
+import os
+import time
+import socket
+import platform
+import subprocess
+import multiprocessing
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+def percentile(values, pct):
+    '''nearest-rank percentile of a non-empty list
+    '''
+    ordered = sorted(values)
+    rank = int(round(pct / 100. * (len(ordered) - 1)))
+    return ordered[rank]
+
+def environment():
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'revision': revision,
+        'host': socket.gethostname(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': multiprocessing.cpu_count()
+    }
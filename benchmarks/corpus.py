@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Reproducible synthetic STEP corpus for the benchmarks. Every family is built
+# from OCCUtils.Construct primitives and scales with a complexity level; the
+# same level always produces the same geometry.
+#
+#   python -m benchmarks.corpus --output benchmarks/corpus --levels 1 2 4 8
+
+import os
+import json
+import math
+import argparse
+
+from OCC.gp import gp_Pnt, gp_Vec, gp_Dir, gp_Ax1, gp_Trsf
+from OCC.TopLoc import TopLoc_Location
+from OCC.Interface import Interface_Static_SetCVal
+from OCC.STEPControl import STEPControl_Writer, STEPControl_AsIs
+from OCC.IFSelect import IFSelect_RetDone
+
+from OCCUtils.Common import points_to_bspline
+from OCCUtils.Construct import (make_box, make_loft, make_pipe, boolean_cut,
+                                translate_topods_from_vector, make_circle,
+                                make_edge, make_wire, make_face, compound)
+from OCCUtils.Topology import Topo
+
+DEFAULT_LEVELS = [1, 2, 4, 8, 16]
+
+def _pattern(shape, count, pitch):
+    '''count copies of shape on a square grid with the given pitch
+    '''
+    side = int(math.ceil(math.sqrt(count)))
+    copies = []
+    for i in range(count):
+        vec = gp_Vec((i % side) * pitch, (i // side) * pitch, 0)
+        copies.append(translate_topods_from_vector(shape, vec, copy=True))
+    return copies
+
+def pocketed_plate(level):
+    '''plate with a level x level grid of rectangular pockets: planar faces,
+    one boolean cut, 6 + 5 * level^2 faces
+    '''
+    pitch = 10.
+    size = pitch * level + pitch
+    plate = make_box(gp_Pnt(0, 0, 0), size, size, 5.)
+    pocket = make_box(gp_Pnt(pitch * .75, pitch * .75, 2.), pitch * .5, pitch * .5, 3.)
+    pockets = _pattern(pocket, level * level, pitch)
+    return boolean_cut(plate, compound(pockets))
+
+def lofted_pattern(level):
+    '''level^2 lofts through circular sections of varying radius: B-spline
+    surfaces with a non-trivial integration cost
+    '''
+    sections = []
+    for k, radius in enumerate([4., 6., 3., 5.]):
+        sections.append(make_wire(make_circle(gp_Pnt(0, 0, k * 5.), radius)))
+    loft = make_loft(sections)
+    return compound(_pattern(loft, level * level, 15.))
+
+def swept_pipes(level):
+    '''level^2 circular pipes swept along a B-spline spine
+    '''
+    points = [gp_Pnt(0, 0, 0), gp_Pnt(0, 0, 10), gp_Pnt(5, 5, 20),
+              gp_Pnt(0, 10, 30), gp_Pnt(0, 10, 40)]
+    spine = make_wire(make_edge(points_to_bspline(points)))
+    profile = make_face(make_wire(make_circle(gp_Pnt(0, 0, 0), 1.5)))
+    pipe = make_pipe(spine, profile)
+    return compound(_pattern(pipe, level * level, 20.))
+
+def located_solids(level):
+    '''level^2 turned instances of one pocketed block that share its TShape,
+    each placed by a location of its own rather than copied: the faces of
+    a part are integrated about different origins
+    '''
+    block = boolean_cut(make_box(gp_Pnt(0, 0, 0), 8., 6., 4.),
+                        make_box(gp_Pnt(2, 2, 2), 4., 2., 2.))
+    instances = []
+    for i in range(level * level):
+        turn = gp_Trsf()
+        turn.SetRotation(gp_Ax1(gp_Pnt(0, 0, 0), gp_Dir(0, 0, 1)), i * math.pi / 7)
+        move = gp_Trsf()
+        move.SetTranslation(gp_Vec((i % level) * 15., (i // level) * 15., i * .5))
+        instances.append(block.Moved(TopLoc_Location(move.Multiplied(turn))))
+    return compound(instances)
+
+FAMILIES = {
+    'pocketed_plate': pocketed_plate,
+    'lofted_pattern': lofted_pattern,
+    'swept_pipes': swept_pipes,
+    'located_solids': located_solids
+}
+
+# families written as assemblies, keeping the locations of their instances
+ASSEMBLIES = set(['located_solids'])
+
+def write_step(shape, filename, assembly=False):
+    Interface_Static_SetCVal("write.step.assembly", "On" if assembly else "Off")
+    writer = STEPControl_Writer()
+    writer.Transfer(shape, STEPControl_AsIs)
+    if writer.Write(filename) != IFSelect_RetDone:
+        raise IOError("Unable to write " + filename)
+
+def build_corpus(output, levels=DEFAULT_LEVELS, families=None):
+    '''writes <family>_<level>.stp for every family and level, plus
+    corpus.json describing each file; returns that description
+    '''
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    entries = []
+    for family in sorted(families or FAMILIES):
+        for level in levels:
+            filename = os.path.join(output, "%s_%03d.stp" % (family, level))
+            print "Building " + filename + "..."
+            shape = FAMILIES[family](level)
+            write_step(shape, filename, family in ASSEMBLIES)
+            entries.append({
+                'file': os.path.basename(filename),
+                'family': family,
+                'level': level,
+                'faces': Topo(shape).number_of_faces(),
+                'bytes': os.path.getsize(filename)
+            })
+
+    with open(os.path.join(output, 'corpus.json'), 'w') as f:
+        json.dump(entries, f, indent=2)
+
+    return entries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the synthetic STEP benchmark corpus.")
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'corpus'))
+    parser.add_argument('--levels', type=int, nargs='+', default=DEFAULT_LEVELS)
+    parser.add_argument('--families', nargs='+', choices=sorted(FAMILIES))
+    args = parser.parse_args()
+
+    build_corpus(args.output, args.levels, args.families)
@@ -0,0 +1,175 @@
+# Local stand-ins for the network services the pipeline talks to, so that
+# benchmarks measure the pipeline rather than S3 or the upload origin.
+# LocalS3 mimics the boto calls upload_zip makes, including multipart
+# uploads; to exercise real boto against an S3-compatible server (minio,
+# moto_server) instead, add host/port/is_secure/bucket to aws.json.
+
+import os
+import re
+import json
+import shutil
+import threading
+import SimpleHTTPServer
+import SocketServer
+
+class _QuietHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve_directory(directory, drop_at=None):
+    '''serves directory over HTTP on a free localhost port from a background
+    thread; returns (server, base_url), call server.shutdown() when done.
+    Files carry an ETag and Last-Modified, conditional requests are answered
+    with 304 Not Modified and 'bytes=N-' range requests are honoured, unless
+    an If-Range no longer matches. With
+    drop_at set, the first response for each file that reaches that offset
+    is cut off there, as a dropped connection would be.
+    '''
+    directory = os.path.abspath(directory)
+    dropped = set()
+
+    class Handler(_QuietHandler):
+        def translate_path(self, path):
+            relative = SimpleHTTPServer.SimpleHTTPRequestHandler.translate_path(self, path)
+            return os.path.join(directory, os.path.relpath(relative, os.getcwd()))
+
+        def do_GET(self):
+            path = self.translate_path(self.path)
+            if not os.path.isfile(path):
+                return _QuietHandler.do_GET(self)
+
+            size = os.path.getsize(path)
+            modified = self.date_time_string(os.path.getmtime(path))
+            etag = '"%x-%x"' % (int(os.path.getmtime(path)), size)
+            # If-Modified-Since only counts without an If-None-Match
+            if_none_match = self.headers.getheader('If-None-Match')
+            if (if_none_match == etag or if_none_match is None and
+                    self.headers.getheader('If-Modified-Since') == modified):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            start = 0
+            match = re.match(r'bytes=([0-9]+)-$', self.headers.getheader('Range', ''))
+            if_range = self.headers.getheader('If-Range')
+            if match and int(match.group(1)) < size and if_range in (None, etag, modified):
+                start = int(match.group(1))
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, size - 1, size))
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(size - start))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Last-Modified', modified)
+            self.send_header('ETag', etag)
+            self.end_headers()
+
+            end = size
+            if drop_at is not None and start <= drop_at < size and path not in dropped:
+                dropped.add(path)
+                end = drop_at
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 64 * 1024))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            self.close_connection = 1
+
+    server = _Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server, 'http://127.0.0.1:%d/' % server.server_address[1]
+
+class LocalBucket(object):
+    def __init__(self, root, name):
+        self.name = name
+        self.path = os.path.join(root, name)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def initiate_multipart_upload(self, key_name):
+        return LocalMultipartUpload(self, key_name)
+
+class LocalMultipartUpload(object):
+    def __init__(self, bucket, key_name):
+        self.bucket = bucket
+        self.key_name = key_name
+        self.parts = {}
+        self.lock = threading.Lock()
+
+    def upload_part_from_file(self, fp, part_num, size=None):
+        data = fp.read(size) if size is not None else fp.read()
+        with self.lock:
+            self.parts[part_num] = data
+
+    def complete_upload(self):
+        with open(os.path.join(self.bucket.path, self.key_name), 'wb') as f:
+            for part_num in sorted(self.parts):
+                f.write(self.parts[part_num])
+
+    def cancel_upload(self):
+        self.parts = {}
+
+class LocalKey(object):
+    '''the subset of boto.s3.key.Key used by upload_zip, backed by a directory
+    '''
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.key = None
+
+    def set_contents_from_filename(self, filename):
+        shutil.copyfile(filename, os.path.join(self.bucket.path, self.key))
+
+    def set_contents_from_file(self, fp, rewind=False):
+        if rewind:
+            fp.seek(0)
+        with open(os.path.join(self.bucket.path, self.key), 'wb') as f:
+            shutil.copyfileobj(fp, f)
+
+class LocalS3(object):
+    '''stand-in for boto.s3.connection.S3Connection; objects are stored under
+    root/<bucket>/<key> and presigned URLs are file:// URLs
+    '''
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def get_bucket(self, name):
+        return LocalBucket(self.root, name)
+
+    def generate_url(self, expires_in, method, bucket, key, query_auth=True):
+        return 'file://' + os.path.join(self.root, bucket, key)
+
+def install_local_s3(module, root):
+    '''points module's S3Connection, Key and AWS_CONFIG at a LocalS3 rooted
+    at root; returns the previous values for restore_s3
+    '''
+    previous = (module.S3Connection, module.Key, module.AWS_CONFIG)
+    if not os.path.isdir(root):
+        os.makedirs(root)
+
+    aws_config = os.path.join(root, 'aws.json')
+    with open(aws_config, 'w') as f:
+        json.dump({'accessKeyId': 'local', 'secretAccessKey': 'local'}, f)
+
+    module.S3Connection = LocalS3(root)
+    module.Key = LocalKey
+    module.AWS_CONFIG = aws_config
+    return previous
+
+def restore_s3(module, previous):
+    module.S3Connection, module.Key, module.AWS_CONFIG = previous
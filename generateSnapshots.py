@@ -1,42 +1,60 @@
 import sys
+import os
+from io import BytesIO
 from PyQt5 import QtWidgets
 from OCC.Display.OCCViewer import Viewer3d
 from PIL import Image
-from tdpUtility import import_step, FILENAME, SNAPSHOTS_FILE
+from tdpUtility import import_step, read_shape, FILENAME, SNAPSHOTS_FILE, SHAPE_FILE
 
 VIEWS = ["front", "rear", "top", "bottom", "left", "right", "iso"]
 
-def generate_snapshots(shape):
-    print "Generating snapshots..."
+class SnapshotRenderer(object):
+    '''offscreen viewer that is created once and reused for every shape
+    '''
+    def __init__(self):
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+        self.widget = QtWidgets.QWidget()
+        self.widget.resize(1000,1000)
+        self.view = Viewer3d(int(self.widget.winId()))
+        self.view.Create()
+        self.view.SetModeShaded()
 
-    try:
-        app = QtWidgets.QApplication(sys.argv)
-        widget = QtWidgets.QWidget()
-        widget.resize(1000,1000)
-        view = Viewer3d(int(widget.winId()))
-        view.Create()
-        view.SetModeShaded()
-        view.DisplayShape(shape, update=True)
-
-        VIEW_FUNC = {
-            "front": view.View_Front,
-            "rear": view.View_Rear,
-            "top": view.View_Top,
-            "bottom": view.View_Bottom,
-            "left": view.View_Left,
-            "right": view.View_Right,
-            "iso": view.View_Iso
+        self.view_func = {
+            "front": self.view.View_Front,
+            "rear": self.view.View_Rear,
+            "top": self.view.View_Top,
+            "bottom": self.view.View_Bottom,
+            "left": self.view.View_Left,
+            "right": self.view.View_Right,
+            "iso": self.view.View_Iso
         }
 
+    def render(self, shape, directory='.'):
+        '''returns a list of (filename, png bytes), one per view; only the
+        raw viewer capture touches the disk
+        '''
+        print "Generating snapshots..."
+
+        capture = os.path.join(directory, 'capture.ppm')
+
+        self.view.EraseAll()
+        self.view.DisplayShape(shape, update=True)
+
         snapshots = []
 
         for view_type in VIEWS:
-            VIEW_FUNC[view_type]()
-            view.ExportToImage('capture.ppm')
-            im = Image.open('capture.ppm')
-            snapshot = view_type + '_capture.png'
-            im.save(snapshot)
-            snapshots.append(snapshot)
+            self.view_func[view_type]()
+            self.view.ExportToImage(capture)
+            im = Image.open(capture)
+            png = BytesIO()
+            im.save(png, 'PNG')
+            snapshots.append((view_type + '_capture.png', png.getvalue()))
+
+        return snapshots
+
+def generate_snapshots(shape):
+    try:
+        snapshots = SnapshotRenderer().render(shape)
     except:
         sys.exit(1)
 
@@ -45,14 +63,19 @@ def generate_snapshots(shape):
 def write_to_file(snapshots):
     outfile = open(SNAPSHOTS_FILE, 'w')
 
-    for snapshot in snapshots:
+    for snapshot, data in snapshots:
+        with open(snapshot, 'wb') as f:
+            f.write(data)
         outfile.write(snapshot + '\n')
 
     outfile.close()
 
 if __name__ == '__main__':
     try:
-        shape = import_step(FILENAME)
+        if os.path.exists(SHAPE_FILE):
+            shape = read_shape(SHAPE_FILE)
+        else:
+            shape = import_step(FILENAME)
         snapshots = generate_snapshots(shape)
         write_to_file(snapshots)
     except:
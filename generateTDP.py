@@ -1,31 +1,54 @@
 #!/usr/bin/python
 # coding: utf-8
 
-# TODO: add functionality for multi-part assemblies
 # TODO: customUI; inputTemplate, outputTemplate
 
+import csv
 import uuid
-import re
+import argparse
+import subprocess
+import tempfile
 import time
 import sys
 import zipfile
 import os
-import urllib
+import shutil
 import json
+import multiprocessing
+from cStringIO import StringIO
+from collections import Counter
 import xml.etree.cElementTree as ET
-from boto.s3.connection import S3Connection
+from boto.s3.connection import S3Connection, OrdinaryCallingFormat
 from boto.s3.key import Key
-from OCC.Bnd import Bnd_Box
-from OCC.BRepBndLib import brepbndlib_Add
-from OCC.GProp import GProp_GProps
-from OCC.BRepGProp import (brepgprop_LinearProperties,
-                           brepgprop_SurfaceProperties,
-                           brepgprop_VolumeProperties)
-from tdpUtility import import_step, FILENAME, SNAPSHOTS_FILE
+from tdpUtility import (write_shape, read_shape, JobDirectory, FILENAME,
+                        SNAPSHOTS_FILE, SHAPE_FILE, TDPError)
+from tdpMassProps import mass_properties, PRECISIONS, DEFAULT_PRECISION, FACE_COLUMNS
+import tdpMesh
+from tdpBoundingBox import bounding_box, MODES as BOUNDINGBOX_MODES
+from tdpAssembly import read_assembly, transform_values, transform_point, transform_box
+from tdpMetrics import StageRecorder, METRICS_FILE
+from tdpCache import ResultCache, DownloadCache
+from tdpGraph import TaskGraph
+from tdpUpload import multipart_upload, source_size, MULTIPART_THRESHOLD
+from tdpCost import CostModel
+from tdpDownload import Download, DownloadError
+from tdpCompression import compression, decompressing, decompress, uncompressed_size
+from STParser.header import read_header, length_unit, product_name
+from STParser.preflight import preflight, PreflightError
 
 OUTPUT_TEMPLATE = "<div class=\"project-run-services padding-10\" ng-if=\"!runHistory\" layout=\"column\">          <style>            #custom-dome-UI {             margin-top: -30px;           }          </style>            <div id=\"custom-dome-UI\">             <div layout=\"row\" layout-wrap style=\"padding: 0px 30px\">               <h2>Technical Data Package Created Successfully:</h2>               <p><a href=\"{{outputFile}}\">{{outputFile}}</a></p>             </div>           </div>        </div>   <script> </script>"
 
-TOLERANCE = 1e-6
+S3_BUCKET = 'psubucket01'
+
+# Lifetime of the presigned GET URL, in seconds
+URL_EXPIRES = 1209600
+
+# Archives larger than this are spooled to the job directory, in bytes
+ZIP_SPOOL_SIZE = 64 * 1024 * 1024
+
+# Resolved at import so jobs can run from their own working directory
+TDP_DIR = os.path.dirname(os.path.abspath(__file__))
+AWS_CONFIG = os.path.abspath('aws.json')
 
 # Unit: kg/m^3
 DENSITIES = {
@@ -34,6 +57,10 @@ DENSITIES = {
     "Aluminum": 2700
 }
 
+# get_geometry backends: exact integration of the BRep, or a NumPy
+# reduction over a mesh with an error estimate (tdpMesh.py)
+GEOMETRY_BACKENDS = ("exact", "mesh")
+
 UNIT_FACTOR = {
     "units": 1,
     "m": 1,
@@ -41,164 +68,22 @@ UNIT_FACTOR = {
     "mm": .001
 }
 
+def format_output(outtext):
+    return "outputFile=" + outtext + "\noutputTemplate=" + OUTPUT_TEMPLATE
+
 def exit_app(outtext, status_code=0):
     outfile = open('out.txt', 'w')
-    outfile.write("outputFile=" + outtext)
-    outfile.write("\noutputTemplate=" + OUTPUT_TEMPLATE)
+    outfile.write(format_output(outtext))
     outfile.close()
     sys.exit(0)
 
-class GpropsFromShape(object):
-    def __init__(self, shape, tolerance=1e-5):
-        self.shape = shape
-        self.tolerance = tolerance
-
-    def volume(self):
-        '''returns the volume of a solid
-        '''
-        prop = GProp_GProps()
-        brepgprop_VolumeProperties(self.shape, prop, self.tolerance)
-        return prop
-
-    def surface(self):
-        '''returns the area of a surface
-        '''
-        prop = GProp_GProps()
-        brepgprop_SurfaceProperties(self.shape, prop, self.tolerance)
-        return prop
-
-    def linear(self):
-        '''returns the length of a wire or edge
-        '''
-        prop = GProp_GProps()
-        brepgprop_LinearProperties(self.shape, prop)
-        return prop
-
-def get_boundingbox(shape, tol=TOLERANCE):
-    '''
-    :param shape: TopoDS_Shape such as TopoDS_Face
-    :param tol: tolerance
-    :return: xmin, ymin, zmin, xmax, ymax, zmax
-    '''
-    bbox = Bnd_Box()
-    bbox.SetGap(tol)
-    brepbndlib_Add(shape, bbox)
-    xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
-    return xmin, ymin, zmin, xmax, ymax, zmax
-
-class stp_header_parser():
-
-    def stp_header_parser(self, stp_filename='', is_debug=False):
-
-        def get_unit_abbr(units):
-            prefix = {'MILLI': 'm'}
-            unit = {'METRE': 'm'}
-            return prefix[units[0]]+unit[units[1]]
-
-        def remove_comments(line):
-            comment_pattern = re.compile('/\*.*?\*/')
-            return comment_pattern.sub('', line)
-
-        def line_extract(filehandle=None, str_startswith='', str_endswith='', str_contains=''):
-            for line in filehandle:
-                line = line.strip()
-                if str_startswith in line:
-                    line_extracted = line
-                    if line.endswith(str_endswith):
-                        if str_contains in line_extracted:
-                            return line_extracted
-                        else:
-                            continue
-                    for line in filehandle:
-                        line = line.strip()
-                        line_extracted += line
-                        if line.endswith(str_endswith):
-                            if str_contains in line_extracted:
-                                return line_extracted
-                            else:
-                                break
-                    else:
-                        return ""
-            else:
-                return ""
-
-        infos_name = [
-            'ISO Standard',
-            'Description',
-            'Implementation Level',
-            'Name',
-            'Time_Stamp',
-            'Author',
-            'Organization',
-            'Preprocessor Version',
-            'Originating System',
-            'Authorization',
-            'Schema',
-            'Unit'
-        ]
-
-        infos_value = []
-
-        len_infos_name = len(infos_name)
-
-        with open(stp_filename, 'r') as f:
-
-            line = line_extract(f, 'ISO-', ';')
-
-            if line:
-                ISO_Standard = line[:-1]
-                infos_value.append(ISO_Standard)
-
-            line = line_extract(f, 'HEADER', ';')
-
-            if line:
-                if is_debug:
-                    print('>>> Header Start Mark Found <<<')
-
-                line = line_extract(f, 'FILE_DESCRIPTION', ';')
-                line = remove_comments(line)
-                File_Description = eval(line[16:-1])
-                infos_value += File_Description
-
-                line = line_extract(f, 'FILE_NAME', ';')
-                line = remove_comments(line)
-                File_Name = eval(line[9:-1])
-                infos_value += File_Name
-
-                line = line_extract(f, 'FILE_SCHEMA', ';')
-                line = remove_comments(line)
-                File_Schema = eval(line[11:-1])
-                infos_value.append(File_Schema)
-
-                if line_extract(f, 'ENDSEC', ';'):
-                    if is_debug:
-                        print('>>> Header End Mark Found <<<')
-
-            line = line_extract(f, 'LENGTH_UNIT', ';', 'SI_UNIT')
-            units = line.split('SI_UNIT')
-            if(len(units) == 2):
-                units = units[1].split('.')[1:4:2]
-                units = get_unit_abbr(units)
-                infos_value.append(units)
-            else:
-                infos_value.append("units")
-
-        infos_dict = {
-            index: list(parameter) for (
-                index, parameter) in zip(
-                range(len_infos_name), zip(
-                    infos_name, infos_value))}
-
-        if is_debug:
-            for key in infos_dict:
-                print('{:02}\t{}'.format(key, infos_dict[key]))
-
-        return infos_dict
-
-def get_dome_inputs():
-    with open('in.txt') as f:
+def get_dome_inputs(filename='in.txt'):
+    with open(filename) as f:
         lines = f.readlines()
 
+    return parse_dome_inputs(lines)
+
+def parse_dome_inputs(lines):
     inputs = {}
 
     for line in lines:
@@ -214,70 +99,163 @@ def validate_inputs(inputFile, material, coatings):
     assert(material in DENSITIES)
     assert(coatings)
 
-def get_tdp_inputs():
+def get_tdp_inputs(inputs=None):
     print "Getting TDP inputs..."
 
     try:
-        inputs = get_dome_inputs()
+        if inputs is None:
+            inputs = get_dome_inputs()
         inputFile = inputs["inputFile"]
         material = inputs["material"]
         coatings = inputs["coatings"]
     except:
-        exit_app("Error parsing inputs.", status_code=1)
-        sys.exit()
+        raise TDPError("Error parsing inputs.")
 
     try:
         validate_inputs(inputFile, material, coatings)
     except:
-        exit_app("One or more of the inputs is not valid.", status_code=1)
-        sys.exit()
+        raise TDPError("One or more of the inputs is not valid.")
 
     return inputFile, material, coatings
 
-def download_stp_file(url, filename):
+def start_download(url, filename, cache=None):
+    '''starts downloading url into filename in the background, through the
+    DownloadCache cache if there is one
+    '''
     print "Downloading STP file..."
+    download = Download(url, filename, cache=cache)
+    download.start()
+    return download
+
+def finish_download(download):
+    '''waits for download and returns the SHA-256 digest of the file
+    '''
+    try:
+        return download.result()
+    except DownloadError:
+        raise TDPError("Unable to download STP file.")
+
+def download_stp_file(url, filename, cache=None):
+    return finish_download(start_download(url, filename, cache))
+
+def stream_header(download):
+    '''parses the STEP header from the first chunks of a download in
+    progress; None if it cannot, get_metadata then reads the whole file
+    '''
     try:
-        urllib.urlretrieve(url, filename)
+        with download.stream() as stream:
+            return read_header(decompressing(stream))
     except:
-        exit_app("Unable to download STP file.", status_code=1)
+        return None
 
-def upload_zip(zipfile):
-    print "Uploading zipfile..."
+def decompress_stp_file(filename, job=None):
+    '''returns the plain STEP file for a download that may be gzip or zip
+    compressed. The compressed file is renamed aside and decompressed to
+    filename, or for a job to the same name on tmpfs when it has room.
+    '''
+    try:
+        kind = compression(filename)
+    except:
+        raise TDPError("Unable to read STP file.")
+    if kind is None:
+        return filename
 
+    print "Decompressing STP file..."
     try:
-        timestamp = int(time.time())
+        packed = filename + '.' + kind
+        os.rename(filename, packed)
+        target = filename
+        if job is not None:
+            target = job.memory_join(os.path.basename(filename), uncompressed_size(packed))
+        decompress(packed, target)
+        os.remove(packed)
+    except:
+        raise TDPError("Error decompressing STP file.")
+
+    return target
 
-        with open('aws.json') as json_data:
+def s3_connect(aws):
+    '''aws.json may also carry host, port and is_secure to target an
+    S3-compatible endpoint, and bucket to override S3_BUCKET
+    '''
+    options = {}
+    if 'host' in aws:
+        options['host'] = aws['host']
+        options['calling_format'] = OrdinaryCallingFormat()
+    if 'port' in aws:
+        options['port'] = int(aws['port'])
+    if 'is_secure' in aws:
+        options['is_secure'] = bool(aws['is_secure'])
+
+    return S3Connection(aws['accessKeyId'], aws['secretAccessKey'], **options)
+
+def upload_zip(zipfile, source=None):
+    '''uploads source, a path (default ./zipfile) or an open archive, under
+    the key zipfile; archives above MULTIPART_THRESHOLD go up as concurrent
+    multipart uploads
+    '''
+    print "Uploading zipfile..."
+
+    try:
+        with open(AWS_CONFIG) as json_data:
             aws = json.load(json_data)
-            access_key = aws['accessKeyId']
-            secret_key = aws['secretAccessKey']
 
-        conn = S3Connection(access_key, secret_key)
-        bucket = conn.get_bucket('psubucket01')
+        conn = s3_connect(aws)
+        bucket_name = aws.get('bucket', S3_BUCKET)
+        bucket = conn.get_bucket(bucket_name)
 
-        k = Key(bucket)
-        k.key = zipfile
-        k.set_contents_from_filename('./'+zipfile)
+        if source is None or isinstance(source, basestring):
+            fp = open(source or './'+zipfile, 'rb')
+        else:
+            fp = source
+
+        try:
+            if source_size(fp) > MULTIPART_THRESHOLD:
+                multipart_upload(bucket, zipfile, fp)
+            else:
+                k = Key(bucket)
+                k.key = zipfile
+                k.set_contents_from_file(fp, rewind=True)
+        finally:
+            if fp is not source:
+                fp.close()
 
         return conn.generate_url(
-            expires_in=long(1209600),
+            expires_in=long(URL_EXPIRES),
             method='GET',
-            bucket='psubucket01',
-            key=k.key,
+            bucket=bucket_name,
+            key=zipfile,
             query_auth=True,
         )
     except:
-        exit_app("Error uploading zipfile.", status_code=1)
+        raise TDPError("Error uploading zipfile.")
+
+def check_stp_file(filename):
+    '''pre-flight checks filename and returns its entity type counts
+    '''
+    print "Checking STP file..."
+
+    try:
+        counts = Counter()
+        instances = preflight(filename, counts=counts)
+        print str(instances) + " entities found..."
+    except PreflightError as e:
+        raise TDPError("Invalid STP file: " + str(e))
+    except:
+        raise TDPError("Error checking STP file.")
+
+    return counts
 
-def get_metadata(filename, material, coatings):
+def get_metadata(filename, material, coatings, header=None):
     print "Gathering metatdata from STP file..."
 
     try:
-        header = stp_header_parser()
-        header = header.stp_header_parser(stp_filename=filename)
-        metadata = {'name': header[3][1], 'material': material, 'coatings': coatings, 'unit': header[11][1]}
+        header = header or read_header(filename)
+        unit = length_unit(filename)
+        name = header.file_name.name or product_name(filename) or ""
+        metadata = {'name': name, 'material': material, 'coatings': coatings, 'unit': unit or "units"}
     except:
-        exit_app("Error gathering metadata from STP file.", status_code=1)
+        raise TDPError("Error gathering metadata from STP file.")
 
     return metadata
 
@@ -293,50 +271,170 @@ def get_metadata(filename, material, coatings):
 #
 #     return my_importer.shapes[0]
 
-def get_geometry(shape, material, unit="units"):
+def get_geometry(shape, material, unit="units", scratch=None, backend="exact",
+                 boundingbox="tight", precision=DEFAULT_PRECISION):
     print "Calculating geometry..."
 
-    try:
-        boundingbox_points = get_boundingbox(shape)
-        length = boundingbox_points[3] - boundingbox_points[0]
-        height = boundingbox_points[5] - boundingbox_points[2]
-        width = boundingbox_points[4] - boundingbox_points[1]
+    if backend == "mesh" and not tdpMesh.available():
+        print "NumPy is not installed, using exact geometry..."
+        backend = "exact"
 
-        gprop = GpropsFromShape(shape)
-        volume = gprop.volume().Mass()
+    try:
+        if backend == "mesh":
+            deflection = tdpMesh.deflection_of(shape, tdpMesh.DEFLECTION_RATIOS[precision])
+            props = tdpMesh.mesh_properties(shape, deflection, face_table=True)
+        else:
+            # volume, area, centroid, inertia and the face table in one pass
+            # over the faces
+            props = mass_properties(shape, precision, scratch=scratch, face_table=True)
+        error = props['error']
+        # stock size: x, y and z, or the oriented box longest side first
+        stock = bounding_box(shape, boundingbox)
+        boundingbox_points = stock['box']
+        length, width, height = stock['size']
+
+        volume = props['volume']
         density = DENSITIES[material]
-        mass = volume*density*pow(UNIT_FACTOR[unit], 3)
-        surface_area = gprop.surface().Mass()
+        scale = UNIT_FACTOR[unit]
+        mass = volume*density*pow(scale, 3)
+        surface_area = props['area']
+        centroid = props['centroid']
+        # kg m^2 from the volume moments, which are in unit^5
+        inertia = [[value*density*pow(scale, 5) for value in row] for row in props['inertia']]
+        solids = [{'volume': solid['volume'], 'mass': solid['volume']*density*pow(scale, 3),
+                   'surface_area': solid['area'], 'centroid': solid['centroid']}
+                  for solid in props['solids']]
     except:
-        exit_app("Error calculating geometry.", status_code=1)
+        raise TDPError("Error calculating geometry.")
+
+    return {'length': length, 'height': height, 'width': width, 'volume': volume, 'mass': mass, 'surface_area': surface_area,
+            'centroid': centroid, 'boundingbox': tuple(boundingbox_points), 'inertia': inertia,
+            'solids': solids, 'error': error, 'stock': stock, 'faces': props['faces']}
+
+def _part_geometry(args):
+    filename, material, unit, backend, boundingbox, precision = args
+    return get_geometry(read_shape(filename), material, unit, None, backend, boundingbox,
+                        precision)
+
+def get_parts_geometry(assembly, material, unit, job, backend="exact", boundingbox="tight",
+                       precision=DEFAULT_PRECISION):
+    '''geometry of every unique part, in the order of assembly.parts. With
+    more than one part the parts are written out as BRep and computed
+    across a process pool; batch workers, which may not start processes of
+    their own, compute them one after another.
+    '''
+    shapes = [part['shape'] for part in assembly.parts]
+    if len(shapes) == 1 or multiprocessing.current_process().daemon:
+        return [get_geometry(shape, material, unit, job.path, backend, boundingbox, precision)
+                for shape in shapes]
 
-    return {'length': length, 'height': height, 'width': width, 'volume': volume, 'mass': mass, 'surface_area': surface_area}
+    try:
+        tasks = []
+        for index, shape in enumerate(shapes):
+            filename = job.join('part_' + str(index) + '.brep')
+            write_shape(shape, filename)
+            tasks.append((filename, material, unit, backend, boundingbox, precision))
+    except:
+        raise TDPError("Error calculating geometry.")
 
-def generate_xml(metadata, geometry):
+    pool = multiprocessing.Pool(min(len(tasks), multiprocessing.cpu_count()))
+    try:
+        return pool.map(_part_geometry, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+def _instance_element(instances, instance, instance_ids, assembly_ids, properties=None, unit=None):
+    '''the instance, with the world-space centroid and bounding box of a
+    part instance moved there from its prototype's rather than computed
+    again
+    '''
+    element = ET.SubElement(instances, "instance", instance_id=instance_ids[instance['id']])
+    if instance['parent'] is not None:
+        element.set("assembly_id", assembly_ids[instance['parent']])
+    if instance['name']:
+        ET.SubElement(element, "name").text = instance['name']
+    transform = transform_values(instance['location'])
+    ET.SubElement(element, "transform").text = " ".join(repr(value) for value in transform)
+    if properties is not None:
+        ET.SubElement(element, "centroid", unit=unit).text = " ".join(
+            repr(value) for value in transform_point(transform, properties["centroid"]))
+        ET.SubElement(element, "boundingbox", unit=unit).text = " ".join(
+            repr(value) for value in transform_box(transform, properties["boundingbox"]))
+
+def generate_xml(metadata, assembly, geometry):
     print "Generating xml..."
 
     try:
-        part_id = str(uuid.uuid4())
-        instance_id = str(uuid.uuid4())
+        part_ids = [str(uuid.uuid4()) for part in assembly.parts]
+        instance_ids = [str(uuid.uuid4()) for instance in assembly.instances]
+        assembly_ids = [str(uuid.uuid4()) for item in assembly.assemblies]
 
         mBOM = ET.Element("mBOM", version="2.0")
         parts = ET.SubElement(mBOM, "parts")
-        part = ET.SubElement(parts, "part", id=part_id)
-        ET.SubElement(part, "name").text = metadata["name"]
-        ET.SubElement(part, "length", unit=metadata["unit"]).text = str(geometry["length"])
-        ET.SubElement(part, "height", unit=metadata["unit"]).text = str(geometry["height"])
-        ET.SubElement(part, "width", unit=metadata["unit"]).text = str(geometry["width"])
-        ET.SubElement(part, "surface_area", unit=metadata["unit"]+"2").text = str(geometry["surface_area"])
-        ET.SubElement(part, "volume", unit=metadata["unit"]+"3").text = str(geometry["volume"])
-        ET.SubElement(part, "weight", unit="kg").text = str(geometry["mass"])
-        instances = ET.SubElement(part, "instances")
-        ET.SubElement(instances, "instance", instance_id=instance_id)
-        manufacturingDetails = ET.SubElement(part, "manufacturingDetails")
-        ET.SubElement(manufacturingDetails, "material").text = metadata["material"]
-        ET.SubElement(manufacturingDetails, "coatings").text = metadata["coatings"]
+        for index, (item, properties) in enumerate(zip(assembly.parts, geometry)):
+            part = ET.SubElement(parts, "part", id=part_ids[index])
+            # a single part keeps the name from the file header, as before
+            # the product structure was imported
+            name = item['name']
+            if len(assembly.parts) == 1:
+                name = metadata["name"] or name
+            ET.SubElement(part, "name").text = name
+            stock = properties["stock"]
+            for dimension in ("length", "height", "width"):
+                element = ET.SubElement(part, dimension, unit=metadata["unit"])
+                element.text = str(properties[dimension])
+                element.set("boundingbox", stock["mode"])
+                if stock["error"] is not None:
+                    element.set("error", repr(stock["error"]))
+            # directions of length, width and height
+            if stock["mode"] == "oriented":
+                ET.SubElement(part, "axes").text = " ".join(
+                    repr(value) for axis in stock["axes"] for value in axis)
+            surface_area = ET.SubElement(part, "surface_area", unit=metadata["unit"]+"2")
+            surface_area.text = str(properties["surface_area"])
+            volume = ET.SubElement(part, "volume", unit=metadata["unit"]+"3")
+            volume.text = str(properties["volume"])
+            # relative error, achieved by exact integration or estimated
+            # for a mesh; draft integration has none
+            if properties["error"] is not None:
+                surface_area.set("error", repr(properties["error"]["area"]))
+                volume.set("error", repr(properties["error"]["volume"]))
+            ET.SubElement(part, "weight", unit="kg").text = str(properties["mass"])
+            ET.SubElement(part, "centroid", unit=metadata["unit"]).text = " ".join(
+                repr(value) for value in properties["centroid"])
+            ET.SubElement(part, "inertia", unit="kg*m2").text = " ".join(
+                repr(value) for row in properties["inertia"] for value in row)
+            solids = ET.SubElement(part, "solids")
+            for solid_properties in properties["solids"]:
+                solid = ET.SubElement(solids, "solid")
+                ET.SubElement(solid, "surface_area", unit=metadata["unit"]+"2").text = str(solid_properties["surface_area"])
+                ET.SubElement(solid, "volume", unit=metadata["unit"]+"3").text = str(solid_properties["volume"])
+                ET.SubElement(solid, "weight", unit="kg").text = str(solid_properties["mass"])
+                ET.SubElement(solid, "centroid", unit=metadata["unit"]).text = " ".join(
+                    repr(value) for value in solid_properties["centroid"])
+            instances = ET.SubElement(part, "instances")
+            for instance in assembly.instances:
+                if instance.get('part') == index:
+                    _instance_element(instances, instance, instance_ids, assembly_ids,
+                                      properties, metadata["unit"])
+            manufacturingDetails = ET.SubElement(part, "manufacturingDetails")
+            ET.SubElement(manufacturingDetails, "material").text = metadata["material"]
+            ET.SubElement(manufacturingDetails, "coatings").text = metadata["coatings"]
+
         assemblies = ET.SubElement(mBOM, "assemblies")
+        for index, item in enumerate(assembly.assemblies):
+            element = ET.SubElement(assemblies, "assembly", id=assembly_ids[index])
+            ET.SubElement(element, "name").text = item['name']
+            instances = ET.SubElement(element, "instances")
+            for instance in assembly.instances:
+                if instance.get('assembly') == index:
+                    _instance_element(instances, instance, instance_ids, assembly_ids)
+            components = ET.SubElement(element, "components")
+            for child in item['components']:
+                ET.SubElement(components, "component", instance_id=instance_ids[child])
     except:
-        exit_app("Error generating xml.", status_code=1)
+        raise TDPError("Error generating xml.")
 
     return mBOM
 
@@ -376,73 +474,278 @@ def generate_xml(metadata, geometry):
 #
 #     return snapshots
 
-def get_snapshots():
+def get_snapshots(shape, renderer, job):
+    if renderer is not None:
+        try:
+            return renderer.render(shape, job.path)
+        except:
+            raise TDPError("Error generating snapshots.")
+
     try:
-        return_val = os.system("xvfb-run -a --server-args='-screen 0 1360x768x24' /home/dmcAdmin/anaconda2/bin/python generateSnapshots.py")
-        #return_val = os.system("xvfb-run -a --server-args='-screen 0 1360x768x24' python generateSnapshots.py")
+        write_shape(shape, job.join(SHAPE_FILE))
+
+        return_val = subprocess.call("xvfb-run -a --server-args='-screen 0 1360x768x24' /home/dmcAdmin/anaconda2/bin/python " + os.path.join(TDP_DIR, "generateSnapshots.py"), shell=True, cwd=job.path)
+        #return_val = subprocess.call("xvfb-run -a --server-args='-screen 0 1360x768x24' python " + os.path.join(TDP_DIR, "generateSnapshots.py"), shell=True, cwd=job.path)
         print("return val = " + str(return_val))
         assert(not return_val)
 
-        with open(SNAPSHOTS_FILE) as f:
+        with open(job.join(SNAPSHOTS_FILE)) as f:
             lines = f.readlines()
 
         snapshots = []
         for snapshot in lines:
-            snapshots.append(snapshot.rstrip('\n'))
+            snapshot = snapshot.rstrip('\n')
+            with open(job.join(snapshot), 'rb') as f:
+                snapshots.append((snapshot, f.read()))
 
         return snapshots
     except:
-        exit_app("Error generating snapshots.", status_code=1)
-
-def generate_zip(xml, filename, snapshots):
-    print "Generating zipfile..."
+        raise TDPError("Error generating snapshots.")
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "%.9g" % value
+    return value
+
+def generate_face_table(xml, geometry):
+    '''CSV of the FACE_COLUMNS rows of every part, after the id of its part
+    in the mBOM xml, for coating estimates
+    '''
+    print "Generating face table..."
 
     try:
-        file_id = int(time.time())
-        zip_filename = 'TDP_' + str(file_id) + '.zip'
+        table = StringIO()
+        writer = csv.writer(table, lineterminator="\n")
+        writer.writerow(("part",) + FACE_COLUMNS)
+        for part, properties in zip(xml.find("parts"), geometry):
+            part_id = part.get("id")
+            for row in properties["faces"]:
+                writer.writerow([part_id] + [_cell(value) for value in row])
+    except:
+        raise TDPError("Error generating face table.")
 
-        tree = ET.ElementTree(xml)
-        xml_file = "TDP_" + str(file_id) + ".xml"
-        tree.write(xml_file)
+    return table.getvalue()
 
-        with zipfile.ZipFile(zip_filename, 'w') as myzip:
-            myzip.write(filename)
-            myzip.write(xml_file)
-            for snapshot in snapshots:
-                myzip.write(snapshot)
+def generate_zip(xml, filename, snapshots, job, faces=None):
+    '''packs the STEP file, the mBOM, the face table and the (name, png
+    bytes) snapshots into an archive buffer that only spills to disk above
+    ZIP_SPOOL_SIZE; returns (zip name, buffer rewound to the start)
+    '''
+    print "Generating zipfile..."
 
-        myzip.close()
+    try:
+        zip_filename = job.artifact('.zip')
+        xml_file = job.artifact('.xml')
+
+        archive = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE, dir=job.path)
+        with zipfile.ZipFile(archive, 'w') as myzip:
+            myzip.write(filename, os.path.basename(filename))
+            myzip.writestr(xml_file, ET.tostring(xml))
+            if faces is not None:
+                # one row per face, so it is deflated unlike the rest
+                myzip.writestr(xml_file[:-len('.xml')] + '_faces.csv', faces,
+                               zipfile.ZIP_DEFLATED)
+            for snapshot, data in snapshots:
+                myzip.writestr(snapshot, data)
+
+        archive.seek(0)
     except:
-        exit_app("Error generating zipfile.", status_code=1)
+        raise TDPError("Error generating zipfile.")
 
-    return zip_filename
+    return zip_filename, archive
 
-if __name__ == '__main__':
-    try:
-        inputFile, material, coatings = get_tdp_inputs()
+def cached_result(cache, key):
+    print "Checking result cache..."
+
+    hit = cache.lookup(key)
+    if hit is None:
+        return None
 
-        filename = FILENAME
-        download_stp_file(inputFile, filename)
+    print "Result cache hit, skipping TDP generation..."
+    url, zip_path, zip_name = hit
+    if url is None:
+        url = upload_zip(zip_name, zip_path)
+        cache.refresh(key, url, URL_EXPIRES)
 
-        metadata = get_metadata(filename, material, coatings)
+    return url
 
+def load_assembly(filename):
+    try:
+        return read_assembly(filename)
+    except:
+        raise TDPError("Error importing shapes from STP file.")
+
+def run_tdp(inputFile, material, coatings, renderer=None, recorder=None, cache=None,
+            scratch=None, keep=False, downloads=None, geometry="exact", boundingbox="tight",
+            precision=DEFAULT_PRECISION, staged=None):
+    if recorder is None:
+        recorder = StageRecorder()
+
+    with JobDirectory(scratch, keep) as job:
+        return run_job(job, inputFile, material, coatings, renderer, recorder, cache, downloads,
+                       geometry, boundingbox, precision, staged)
+
+def run_job(job, inputFile, material, coatings, renderer, recorder, cache, downloads=None,
+            geometry="exact", boundingbox="tight", precision=DEFAULT_PRECISION, staged=None):
+    '''staged, (filename, hex digest, entity counts) of a STEP file that has
+    already been downloaded, decompressed and checked, as by batchTDP,
+    skips those stages; the file is moved into the job directory
+    '''
+    filename = job.join(FILENAME)
+    if staged is not None:
+        header = None
         try:
-            shape = import_step(filename)
+            shutil.move(staged[0], filename)
         except:
-            exit_app("Error importing shapes from STP file.", status_code=1)
-
-        geometry = get_geometry(shape, material, metadata["unit"])
-
-        xml = generate_xml(metadata, geometry)
+            raise TDPError("Unable to read STP file.")
+        digest, counts = staged[1:]
+    else:
+        # the header is parsed from the first chunks while the rest of the
+        # file downloads, and the bytes are hashed for the result cache as
+        # they are written
+        with recorder.stage('download_stp_file') as stage:
+            started = time.time()
+            download = start_download(inputFile, filename, downloads)
+            header = stream_header(download)
+            stage['header_wall'] = round(time.time() - started, 6)
+            digest = finish_download(download).hexdigest()
+            stage['bytes'] = download.size
+            stage['resumed'] = download.resumed
+        if downloads is not None:
+            recorder.info['download_cache'] = download.cached or 'miss'
+
+    if cache is not None:
+        with recorder.stage('result_cache'):
+            variant = ",".join(value for value, default in ((geometry, "exact"), (boundingbox, "tight"),
+                                                            (precision, DEFAULT_PRECISION))
+                               if value != default)
+            cache_key = cache.key(filename, material, coatings, digest, variant)
+            zip_url = cached_result(cache, cache_key)
+        recorder.info['cache'] = 'hit' if zip_url else 'miss'
+        if zip_url:
+            return zip_url
+
+    if staged is None:
+        # gzip and zip downloads are decompressed to tmpfs for the importer
+        if compression(filename):
+            with recorder.stage('decompress_stp_file'):
+                filename = decompress_stp_file(filename, job)
+
+        # rejects malformed and truncated files before any time is spent on
+        # the OCC translation
+        with recorder.stage('check_stp_file'):
+            counts = check_stp_file(filename)
+    recorder.info['predicted'] = CostModel.load().predict(counts)
+
+    graph = TaskGraph(recorder)
+    graph.add('get_metadata', lambda: get_metadata(filename, material, coatings, header))
+    graph.add('import_step', lambda: load_assembly(filename))
+    graph.add('get_geometry',
+              lambda assembly, metadata: get_parts_geometry(assembly, material, metadata["unit"], job,
+                                                            geometry, boundingbox, precision),
+              deps=('import_step', 'get_metadata'))
+    graph.add('generate_xml', generate_xml, deps=('get_metadata', 'import_step', 'get_geometry'))
+    graph.add('get_snapshots', lambda assembly: get_snapshots(assembly.shape, renderer, job),
+              deps=('import_step',), main_thread=renderer is not None)
+    graph.add('generate_face_table', generate_face_table, deps=('generate_xml', 'get_geometry'))
+    graph.add('generate_zip',
+              lambda xml, snapshots, faces: generate_zip(xml, filename, snapshots, job, faces),
+              deps=('generate_xml', 'get_snapshots', 'generate_face_table'))
+    graph.add('upload_zip', lambda archive: upload_zip(*archive), deps=('generate_zip',))
+
+    results = graph.run()
+    zip_filename, archive = results['generate_zip']
+    zip_url = results['upload_zip']
+
+    if cache is not None:
+        try:
+            cache.store(cache_key, zip_filename, archive, zip_url, URL_EXPIRES)
+        except (IOError, OSError):
+            print "Unable to store result in cache."
+    archive.close()
+
+    return zip_url
+
+def open_cache(cache_dir, cache_size):
+    if not cache_dir:
+        return None
+    return ResultCache(os.path.abspath(cache_dir), cache_size * 1024 * 1024)
+
+def open_download_cache(cache_dir, cache_size):
+    if not cache_dir:
+        return None
+    return DownloadCache(os.path.abspath(cache_dir), cache_size * 1024 * 1024)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a Technical Data Package from a STEP file.")
+    parser.add_argument('--worker', action='store_true',
+                        help="stay resident and process jobs from --queue or --socket")
+    parser.add_argument('--queue', help="queue directory polled for <job>.in files")
+    parser.add_argument('--socket', help="unix socket to accept jobs on")
+    parser.add_argument('--metrics', default=METRICS_FILE,
+                        help="JSON-lines file that receives one stage timing record per job")
+    parser.add_argument('--profile', metavar='DIR', nargs='?', const='profiles',
+                        help="dump cProfile stats for every stage into DIR")
+    parser.add_argument('--cache', metavar='DIR',
+                        help="reuse finished TDPs for identical STEP/material/coatings")
+    parser.add_argument('--cache-size', type=int, default=2048, metavar='MB',
+                        help="result cache size limit (default: 2048 MB)")
+    parser.add_argument('--download-cache', metavar='DIR',
+                        help="keep downloaded STEP files by URL and revalidate them")
+    parser.add_argument('--download-cache-size', type=int, default=4096, metavar='MB',
+                        help="download cache size limit (default: 4096 MB)")
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="exact",
+                        help="exact BRep integration, or a faster mesh estimate (needs NumPy)")
+    parser.add_argument('--boundingbox', choices=BOUNDINGBOX_MODES, default="tight",
+                        help="stock size from the padded OCC box, the exact axis-aligned box, or "
+                             "an oriented box (needs NumPy) (default: tight)")
+    parser.add_argument('--precision', choices=sorted(PRECISIONS), default=DEFAULT_PRECISION,
+                        help="integration error bound, or mesh deflection, traded against time "
+                             "(default: %s)" % DEFAULT_PRECISION)
+    parser.add_argument('--scratch', metavar='DIR',
+                        help="parent of the per-job working directories (default: system temp)")
+    parser.add_argument('--keep', action='store_true',
+                        help="keep per-job working directories instead of removing them")
+    return parser.parse_args()
 
-        snapshots = get_snapshots()
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.worker:
+        import tdpWorker
+        tdpWorker.serve(queue_dir=args.queue, socket_path=args.socket,
+                        metrics_file=args.metrics, profile_dir=args.profile,
+                        cache=open_cache(args.cache, args.cache_size),
+                        scratch=args.scratch, keep=args.keep,
+                        downloads=open_download_cache(args.download_cache,
+                                                      args.download_cache_size),
+                        geometry=args.geometry, boundingbox=args.boundingbox,
+                        precision=args.precision)
+        sys.exit(0)
 
-        zip_filename = generate_zip(xml, filename, snapshots)
+    recorder = StageRecorder(profile_dir=args.profile)
 
-        zip_url = upload_zip(zip_filename)
+    try:
+        with recorder.stage('get_tdp_inputs'):
+            inputFile, material, coatings = get_tdp_inputs()
+        recorder.info.update(inputFile=inputFile, material=material, coatings=coatings)
+
+        zip_url = run_tdp(inputFile, material, coatings, recorder=recorder,
+                          cache=open_cache(args.cache, args.cache_size),
+                          scratch=args.scratch, keep=args.keep,
+                          downloads=open_download_cache(args.download_cache,
+                                                        args.download_cache_size),
+                          geometry=args.geometry, boundingbox=args.boundingbox,
+                          precision=args.precision)
 
         exit_app(zip_url)
+    except TDPError as e:
+        exit_app(str(e), status_code=1)
     except SystemExit as e:
         sys.exit(0)
     except:
         exit_app("Unknown error.", status_code=1)
+    finally:
+        recorder.write(args.metrics)
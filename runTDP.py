@@ -1,8 +1,85 @@
 import sys
 import os
+import time
+import uuid
+import socket
+import argparse
+
+# seconds to wait for a worker's reply
+JOB_TIMEOUT = 3600
+
+def _timed_out(timeout):
+    # imported here, as tdpUtility brings in OCC, which this client
+    # otherwise does without
+    from tdpUtility import TDPError
+    return TDPError("No reply from the worker within %d seconds." % timeout)
+
+def submit_socket(socket_path, request, timeout=JOB_TIMEOUT):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall(request)
+        client.shutdown(socket.SHUT_WR)
+
+        chunks = []
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.timeout:
+        raise _timed_out(timeout)
+    finally:
+        client.close()
+
+    return "".join(chunks)
+
+def submit_queue(queue_dir, request, poll_interval=0.2, timeout=JOB_TIMEOUT):
+    job = os.path.join(queue_dir, str(uuid.uuid4()))
+
+    with open(job + ".tmp", 'w') as f:
+        f.write(request)
+    os.rename(job + ".tmp", job + ".in")
+
+    deadline = time.time() + timeout
+    while not os.path.exists(job + ".out"):
+        if time.time() > deadline:
+            # withdrawn unless a worker has claimed it already
+            try:
+                os.remove(job + ".in")
+            except OSError:
+                pass
+            raise _timed_out(timeout)
+        time.sleep(poll_interval)
+
+    with open(job + ".out") as f:
+        reply = f.read()
+    os.remove(job + ".out")
+
+    return reply
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a TDP job, optionally on a resident worker.")
+    parser.add_argument('--queue', help="queue directory of a running worker")
+    parser.add_argument('--socket', help="unix socket of a running worker")
+    parser.add_argument('--timeout', type=int, default=JOB_TIMEOUT,
+                        help="seconds to wait for the worker's reply (default: %d)" % JOB_TIMEOUT)
+    args = parser.parse_args()
+
     try:
-        os.system("xvfb-run -a --server-args='-screen 0 1360x768x24' /home/dmcAdmin/anaconda2/bin/python generateTDP.py")
+        if args.queue or args.socket:
+            with open('in.txt') as f:
+                request = f.read()
+
+            if args.socket:
+                reply = submit_socket(args.socket, request, timeout=args.timeout)
+            else:
+                reply = submit_queue(args.queue, request, timeout=args.timeout)
+
+            with open('out.txt', 'w') as f:
+                f.write(reply)
+        else:
+            os.system("xvfb-run -a --server-args='-screen 0 1360x768x24' /home/dmcAdmin/anaconda2/bin/python generateTDP.py")
     except:
         sys.exit(0)
@@ -0,0 +1,163 @@
+from OCC.BRep import BRep_Builder
+from OCC.TopoDS import TopoDS_Compound
+from OCC.TopLoc import TopLoc_Location
+from OCC.IFSelect import IFSelect_RetDone
+from OCC.STEPCAFControl import STEPCAFControl_Reader
+from OCC.TDocStd import Handle_TDocStd_Document
+from OCC.TCollection import TCollection_ExtendedString, TCollection_AsciiString
+from OCC.TDF import TDF_LabelSequence, TDF_Label, TDF_Tool_Entry
+from OCC.XCAFApp import XCAFApp_Application_GetApplication
+from OCC.XCAFDoc import XCAFDoc_DocumentTool_ShapeTool
+
+# upper bound for TopoDS_Shape.HashCode
+HASH_UPPER = 2 ** 31 - 1
+
+def _entry(label):
+    '''the tag path of a label, e.g. '0:1:1:3', which identifies it
+    '''
+    entry = TCollection_AsciiString()
+    TDF_Tool_Entry(label, entry)
+    return entry.ToCString()
+
+def _name(label):
+    try:
+        return label.GetLabelName()
+    except:
+        return ""
+
+def transform_values(location):
+    '''the 3x4 matrix of a TopLoc_Location, row by row
+    '''
+    trsf = location.Transformation()
+    return [trsf.Value(row, col) for row in range(1, 4) for col in range(1, 5)]
+
+def transform_point(values, point):
+    '''point moved by the 3x4 matrix values
+    '''
+    x, y, z = point
+    return tuple(values[4 * row] * x + values[4 * row + 1] * y + values[4 * row + 2] * z +
+                 values[4 * row + 3] for row in range(3))
+
+def transform_box(values, box):
+    '''the axis-aligned box (xmin, ymin, zmin, xmax, ymax, zmax) around box
+    moved by the 3x4 matrix values
+    '''
+    corners = [transform_point(values, (x, y, z))
+               for x in (box[0], box[3]) for y in (box[1], box[4]) for z in (box[2], box[5])]
+    return (tuple(min(corner[axis] for corner in corners) for axis in range(3)) +
+            tuple(max(corner[axis] for corner in corners) for axis in range(3)))
+
+class Assembly(object):
+    '''product structure of a STEP file read through XCAF.
+
+    parts are the unique shapes, each once however often it is placed, as
+    dicts of id, name and shape. Labels whose shapes share one TShape, as
+    the copies of a fastener often do, are one part: the prototype, whose
+    properties are computed once. instances place a part or an assembly in
+    its parent assembly (None at the top) with the location of the
+    instance in world space. assemblies have an id, a name and the ids of
+    their component instances. shape is the whole model as placed, for
+    snapshots.
+    '''
+    def __init__(self):
+        self.parts = []
+        self.instances = []
+        self.assemblies = []
+        self.shape = None
+        self._parts = {}
+        self._prototypes = {}
+        self._assemblies = {}
+
+    def _part(self, label, shape_tool):
+        '''the part of label and the location of its shape relative to the
+        part's prototype shape
+        '''
+        entry = _entry(label)
+        if entry in self._parts:
+            return self._parts[entry]
+
+        shape = shape_tool.GetShape(label)
+        # HashCode covers the location as well as the TShape, so it is
+        # taken with the location stripped; IsPartner compares TShapes
+        key = shape.Located(TopLoc_Location()).HashCode(HASH_UPPER)
+        for index in self._prototypes.get(key, ()):
+            prototype = self.parts[index]['shape']
+            if prototype.IsPartner(shape):
+                relative = shape.Location().Multiplied(prototype.Location().Inverted())
+                break
+        else:
+            index = len(self.parts)
+            self.parts.append({'id': entry, 'name': _name(label), 'shape': shape})
+            self._prototypes.setdefault(key, []).append(index)
+            relative = TopLoc_Location()
+
+        self._parts[entry] = index, relative
+        return self._parts[entry]
+
+    def _add(self, label, shape_tool, parent, location, name):
+        '''adds an instance of label, a part or an assembly, placed at
+        location in world space
+        '''
+        instance = {'id': len(self.instances), 'name': name, 'parent': parent,
+                    'location': location}
+        self.instances.append(instance)
+
+        if not shape_tool.IsAssembly(label):
+            instance['part'], relative = self._part(label, shape_tool)
+            instance['location'] = location.Multiplied(relative)
+            return
+
+        entry = _entry(label)
+        first = entry not in self._assemblies
+        if first:
+            self._assemblies[entry] = len(self.assemblies)
+            self.assemblies.append({'id': entry, 'name': _name(label), 'components': []})
+        assembly = self._assemblies[entry]
+        instance['assembly'] = assembly
+
+        components = TDF_LabelSequence()
+        shape_tool.GetComponents(label, components, False)
+        for index in range(1, components.Length() + 1):
+            component = components.Value(index)
+            referred = TDF_Label()
+            if not shape_tool.GetReferredShape(component, referred):
+                continue
+            placed = location.Multiplied(shape_tool.GetLocation(component))
+            # an assembly placed more than once lists the components of its
+            # first instance
+            if first:
+                self.assemblies[assembly]['components'].append(len(self.instances))
+            self._add(referred, shape_tool, assembly, placed, _name(component))
+
+def read_assembly(filename):
+    '''reads filename with STEPCAFControl into an Assembly; raises an
+    Exception if the file cannot be read or holds no shape
+    '''
+    handle = Handle_TDocStd_Document()
+    application = XCAFApp_Application_GetApplication().GetObject()
+    application.NewDocument(TCollection_ExtendedString("MDTV-XCAF"), handle)
+    document = handle.GetObject()
+    shape_tool = XCAFDoc_DocumentTool_ShapeTool(document.Main()).GetObject()
+
+    reader = STEPCAFControl_Reader()
+    reader.SetNameMode(True)
+    if reader.ReadFile(filename) != IFSelect_RetDone or not reader.Transfer(document.GetHandle()):
+        raise Exception("Error reading " + filename)
+
+    free = TDF_LabelSequence()
+    shape_tool.GetFreeShapes(free)
+    if not free.Length():
+        raise Exception("No shapes in " + filename)
+
+    assembly = Assembly()
+    builder = BRep_Builder()
+    model = TopoDS_Compound()
+    builder.MakeCompound(model)
+    for index in range(1, free.Length() + 1):
+        label = free.Value(index)
+        assembly._add(label, shape_tool, None, TopLoc_Location(), _name(label))
+        builder.Add(model, shape_tool.GetShape(label))
+    assembly.shape = model
+
+    print str(len(assembly.parts)) + " parts, " + str(len(assembly.instances)) + " instances loaded..."
+    return assembly
@@ -0,0 +1,113 @@
+import time
+
+from OCC.Bnd import Bnd_Box
+from OCCUtils.Common import get_boundingbox
+
+import tdpMesh
+
+try:
+    from OCC.BRepBndLib import brepbndlib_AddOptimal
+except ImportError:
+    # OCC before 7.1
+    brepbndlib_AddOptimal = None
+
+MODES = ("loose", "tight", "oriented")
+
+_IDENTITY = ((1., 0., 0.), (0., 1., 0.), (0., 0., 1.))
+
+def _aligned(mode, box, error, started):
+    xmin, ymin, zmin, xmax, ymax, zmax = box
+    return {'mode': mode, 'box': tuple(box), 'axes': _IDENTITY,
+            'center': ((xmin + xmax) / 2., (ymin + ymax) / 2., (zmin + zmax) / 2.),
+            'size': (xmax - xmin, ymax - ymin, zmax - zmin),
+            'error': error, 'seconds': time.time() - started}
+
+def loose_box(shape):
+    '''the Bnd_Box of shape, padded by tolerances and the hulls of control
+    polygons by an amount that is not known, hence error None
+    '''
+    started = time.time()
+    return _aligned("loose", get_boundingbox(shape), None, started)
+
+def tight_box(shape):
+    '''the axis-aligned box of the geometry itself, with error its largest
+    distance from the true extent
+    '''
+    started = time.time()
+    if brepbndlib_AddOptimal is not None:
+        box = Bnd_Box()
+        brepbndlib_AddOptimal(shape, box, False, False)
+        return _aligned("tight", box.Get(), box.GetGap(), started)
+
+    # mesh vertices lie on the surface, within the deflection of it
+    # everywhere else
+    deflection = tdpMesh.deflection_of(shape)
+    vertices = tdpMesh.triangulate(shape, deflection)[0]
+    return _aligned("tight", tuple(vertices.min(axis=0)) + tuple(vertices.max(axis=0)),
+                    deflection, started)
+
+def _principal_axes(vertices, triangles):
+    '''rows of unit vectors along the principal axes of the surface of a
+    mesh, weighted by area so that the mesh density does not matter
+    '''
+    numpy = tdpMesh.numpy
+    a, b, c = vertices[triangles[:, 0]], vertices[triangles[:, 1]], vertices[triangles[:, 2]]
+    area = numpy.sqrt((numpy.cross(b - a, c - a) ** 2).sum(axis=1)) / 2.
+    centroid = (area[:, None] * (a + b + c)).sum(axis=0) / (3. * area.sum())
+    a, b, c = a - centroid, b - centroid, c - centroid
+    corners = a + b + c
+    # second moments of area of a triangle about the centroid of the mesh
+    covariance = numpy.einsum('i,ij,ik->jk', area / 12., a, a)
+    for points in (b, c, corners):
+        covariance += numpy.einsum('i,ij,ik->jk', area / 12., points, points)
+    return numpy.linalg.eigh(covariance)[1].T
+
+def oriented_box(shape, deflection=None):
+    '''a box around shape along the principal axes of its mesh, size
+    longest first, and the axis-aligned box of the mesh; mesh vertices are
+    within error of the surface
+    '''
+    started = time.time()
+    numpy = tdpMesh.numpy
+    if deflection is None:
+        deflection = tdpMesh.deflection_of(shape)
+    vertices, triangles = tdpMesh.triangulate(shape, deflection)[:2]
+
+    axes = _principal_axes(vertices, triangles)
+    projected = vertices.dot(axes.T)
+    lower, upper = projected.min(axis=0), projected.max(axis=0)
+    # the principal axes of a shape with equal moments, a cube say, are
+    # arbitrary; its axis-aligned box is kept if that is smaller
+    aligned_lower, aligned_upper = vertices.min(axis=0), vertices.max(axis=0)
+    if numpy.prod(aligned_upper - aligned_lower) <= numpy.prod(upper - lower):
+        axes, lower, upper = numpy.identity(3), aligned_lower, aligned_upper
+
+    order = numpy.argsort(lower - upper)
+    axes, lower, upper = axes[order], lower[order], upper[order]
+    if numpy.linalg.det(axes) < 0:
+        axes[2] = -axes[2]
+        lower[2], upper[2] = -upper[2], -lower[2]
+
+    return {'mode': "oriented",
+            'box': tuple(aligned_lower) + tuple(aligned_upper),
+            'axes': tuple(tuple(axis) for axis in axes),
+            'center': tuple(((lower + upper) / 2.).dot(axes)),
+            'size': tuple(upper - lower),
+            'error': deflection, 'seconds': time.time() - started}
+
+def bounding_box(shape, mode="tight"):
+    '''box, axes, center, size along the axes, error and seconds of one of
+    MODES: "loose" is the cheapest, "tight" the exact axis-aligned extent and
+    "oriented" the smallest stock found along the principal axes. Modes
+    that need a mesh fall back to the loose box without NumPy.
+    '''
+    if mode == "loose":
+        return loose_box(shape)
+    if mode == "tight" and brepbndlib_AddOptimal is not None:
+        return tight_box(shape)
+    if not tdpMesh.available():
+        print "NumPy is not installed, using the loose bounding box..."
+        return loose_box(shape)
+    if mode == "tight":
+        return tight_box(shape)
+    return oriented_box(shape)
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+CHUNK_SIZE = 1 << 20
+
+# presigned URLs are only reused while at least this many seconds remain
+URL_MARGIN = 3600
+# part of every result key; bump it whenever a change to the pipeline
+# changes the archives it produces, so that older results are not reused
+RESULT_VERSION = 1
+
+def _bytes(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+def file_digest(filename, digest=None):
+    digest = digest or hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest
+
+class DiskLRU(object):
+    '''directory of cached files with a JSON index, bounded by total bytes and
+    evicted least recently used first. The index is guarded by a flock so that
+    batch processes and workers on one host can share a cache directory.
+    '''
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @contextmanager
+    def _index(self):
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index_path = os.path.join(self.directory, INDEX_FILE)
+                try:
+                    with open(index_path) as f:
+                        index = json.load(f)
+                except (IOError, ValueError):
+                    index = {'entries': {}, 'hits': 0, 'misses': 0, 'evictions': 0}
+
+                yield index
+
+                with open(index_path + ".tmp", 'w') as f:
+                    json.dump(index, f)
+                os.rename(index_path + ".tmp", index_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        '''returns the entry's metadata and marks it as used, or None
+        '''
+        with self._index() as index:
+            entry = index['entries'].get(key)
+            if entry is not None and not os.path.exists(self.path(key)):
+                del index['entries'][key]
+                entry = None
+
+            if entry is None:
+                index['misses'] += 1
+                return None
+
+            index['hits'] += 1
+            entry['last_used'] = time.time()
+            return dict(entry)
+
+    def update(self, key, **meta):
+        with self._index() as index:
+            entry = index['entries'].get(key)
+            if entry is not None:
+                entry.update(meta)
+
+    def _temp(self, key):
+        '''an open file descriptor and path for a new file in the cache
+        directory, unique to this call so that processes storing the same key
+        at the same time never write into one file
+        '''
+        return tempfile.mkstemp(prefix=key + '.', suffix='.tmp', dir=self.directory)
+
+    def put(self, key, filename, move=False, **meta):
+        '''copies (or moves) filename into the cache under key
+        '''
+        fd, tmp = self._temp(key)
+        os.close(fd)
+        try:
+            if move:
+                shutil.move(filename, tmp)
+            else:
+                shutil.copyfile(filename, tmp)
+        except:
+            os.remove(tmp)
+            raise
+        self._commit(key, tmp, meta)
+
+    def put_file(self, key, fp, **meta):
+        '''copies the contents of the open file fp, from its start
+        '''
+        fd, tmp = self._temp(key)
+        try:
+            fp.seek(0)
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(fp, f)
+        except:
+            os.remove(tmp)
+            raise
+        self._commit(key, tmp, meta)
+
+    def _commit(self, key, tmp, meta):
+        os.rename(tmp, self.path(key))
+
+        with self._index() as index:
+            meta['size'] = os.path.getsize(self.path(key))
+            meta['last_used'] = time.time()
+            index['entries'][key] = meta
+            self._evict(index)
+
+    def _evict(self, index):
+        entries = index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+
+        for key in sorted(entries, key=lambda k: entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]['size']
+            del entries[key]
+            index['evictions'] += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._index() as index:
+            return {
+                'hits': index['hits'],
+                'misses': index['misses'],
+                'evictions': index['evictions'],
+                'entries': len(index['entries']),
+                'bytes': sum(entry['size'] for entry in index['entries'].values())
+            }
+
+class ResultCache(DiskLRU):
+    '''finished TDP archives keyed by the STEP bytes plus material and coatings
+    '''
+    def key(self, filename, material, coatings, digest=None, variant=""):
+        '''digest, the hex SHA-256 of the file if it was hashed on the way
+        in, saves reading filename again. variant names non-default
+        settings that change the result, such as the geometry backend
+        '''
+        digest = hashlib.sha256(b'%d\0' % RESULT_VERSION +
+                                _bytes(digest or file_digest(filename).hexdigest()))
+        digest.update(b'\0' + _bytes(material) + b'\0' + _bytes(coatings))
+        if variant:
+            digest.update(b'\0' + _bytes(variant))
+        return digest.hexdigest()
+
+    def lookup(self, key):
+        '''returns (url, zip_path, zip_name) for a hit; url is None when the
+        stored presigned URL has expired and the archive must be re-uploaded
+        '''
+        entry = self.get(key)
+        if entry is None:
+            return None
+
+        url = entry.get('url')
+        if url and entry.get('expires', 0) < time.time() + URL_MARGIN:
+            url = None
+
+        return url, self.path(key), entry['name']
+
+    def store(self, key, zip_name, archive, url, expires_in):
+        self.put_file(key, archive, name=zip_name, url=url,
+                      expires=time.time() + expires_in)
+
+    def refresh(self, key, url, expires_in):
+        self.update(key, url=url, expires=time.time() + expires_in)
+
+class DownloadCache(DiskLRU):
+    '''downloaded STEP files keyed by URL, stored with the ETag,
+    Last-Modified and max-age of the response so that they can be
+    revalidated with a conditional request
+    '''
+    def key(self, url):
+        return hashlib.sha256(_bytes(url)).hexdigest()
+
+    def lookup(self, url):
+        '''returns (path, entry, fresh) for a cached URL, fresh if its
+        max-age has not run out and the server need not be asked at all
+        '''
+        key = self.key(url)
+        entry = self.get(key)
+        if entry is None:
+            return None
+        return self.path(key), entry, entry.get('fresh_until', 0) > time.time()
+
+    def store(self, url, filename, etag=None, last_modified=None, max_age=None):
+        self.put(self.key(url), filename, url=url, etag=etag, last_modified=last_modified,
+                 fresh_until=time.time() + (max_age or 0))
+
+    def refresh(self, url, max_age=None):
+        self.update(self.key(url), fresh_until=time.time() + (max_age or 0))
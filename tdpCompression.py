@@ -0,0 +1,166 @@
+import zlib
+import gzip
+import struct
+import shutil
+import zipfile
+
+CHUNK_SIZE = 256 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+STEP_EXTENSIONS = ('.stp', '.step', '.p21')
+
+_ZIP_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_ZIP_DEFLATED, _ZIP_STORED = 8, 0
+
+def sniff(prefix):
+    ''''gzip', 'zip' or None for the first bytes of a file
+    '''
+    if prefix.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if prefix.startswith(ZIP_MAGIC):
+        return 'zip'
+    return None
+
+def compression(filename):
+    with open(filename, 'rb') as f:
+        return sniff(f.read(4))
+
+def _read_exact(raw, size):
+    data = b''
+    while len(data) < size:
+        chunk = raw.read(size - len(data))
+        if not chunk:
+            raise IOError("Unexpected end of compressed stream")
+        data += chunk
+    return data
+
+class _Inflater(object):
+    '''decompressing view of a raw stream; only reads as much of it as the
+    bytes asked for need
+    '''
+    def __init__(self, raw, wbits, prefix=b'', limit=None):
+        self.raw = raw
+        self.decompressor = zlib.decompressobj(wbits) if wbits is not None else None
+        self.pending = prefix
+        self.limit = limit
+        self.buffer = b''
+        self.eof = False
+
+    def _raw_read(self):
+        if self.pending:
+            data, self.pending = self.pending, b''
+        else:
+            size = CHUNK_SIZE if self.limit is None else min(CHUNK_SIZE, self.limit)
+            data = self.raw.read(size) if size else b''
+        if self.limit is not None:
+            data = data[:self.limit]
+            self.limit -= len(data)
+        return data
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            if self.decompressor is None:
+                data = self._raw_read()
+                self.buffer += data
+                self.eof = not data
+                continue
+            # input held back by max_length is decompressed first
+            data = self.decompressor.unconsumed_tail or self._raw_read()
+            if not data:
+                self.buffer += self.decompressor.flush()
+                self.eof = True
+                continue
+            self.buffer += self.decompressor.decompress(data, CHUNK_SIZE)
+            # the rest of the raw stream is a gzip trailer or the next zip entry
+            if self.decompressor.unused_data:
+                self.eof = True
+
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.raw.close()
+
+def decompressing(raw):
+    '''a file object that reads raw, any binary stream, decompressed if it
+    starts with a gzip or zip signature; for a zip, the first entry must be
+    the STEP file. Nothing past what is read is decompressed, so that the
+    header of a compressed download can be parsed from its first chunks.
+    '''
+    prefix = b''
+    while len(prefix) < 4:
+        chunk = raw.read(4 - len(prefix))
+        if not chunk:
+            break
+        prefix += chunk
+
+    kind = sniff(prefix)
+    if kind == 'gzip':
+        # 16 + MAX_WBITS: a gzip header and trailer around the deflate data
+        return _Inflater(raw, 16 + zlib.MAX_WBITS, prefix)
+    if kind == 'zip':
+        header = prefix + _read_exact(raw, _ZIP_HEADER.size - len(prefix))
+        (_, _, flags, method, _, _, _, compressed_size, _,
+         name_length, extra_length) = _ZIP_HEADER.unpack(header)
+        name = _read_exact(raw, name_length)
+        _read_exact(raw, extra_length)
+        if not name.lower().endswith(STEP_EXTENSIONS):
+            raise IOError("First zip entry " + name + " is not a STEP file")
+        if method == _ZIP_DEFLATED:
+            return _Inflater(raw, -zlib.MAX_WBITS)
+        # a stored entry of unknown size (data descriptor) cannot be streamed
+        if method == _ZIP_STORED and not flags & 0x08:
+            return _Inflater(raw, None, limit=compressed_size)
+        raise IOError("Unsupported zip entry compression %d" % method)
+    return _Inflater(raw, None, prefix)
+
+def _step_entry(archive):
+    '''the STEP file entry of a zip archive: the first with a STEP
+    extension, or the only entry
+    '''
+    entries = [info for info in archive.infolist() if not info.filename.endswith('/')]
+    for info in entries:
+        if info.filename.lower().endswith(STEP_EXTENSIONS):
+            return info
+    if len(entries) == 1:
+        return entries[0]
+    raise IOError("No STEP file in zip archive")
+
+def uncompressed_size(filename):
+    '''size of the decompressed STEP file, from the gzip trailer (modulo
+    4 GB) or the zip directory; None if it is not compressed
+    '''
+    kind = compression(filename)
+    if kind == 'gzip':
+        with open(filename, 'rb') as f:
+            f.seek(-4, 2)
+            return struct.unpack('<I', f.read(4))[0]
+    if kind == 'zip':
+        with zipfile.ZipFile(filename) as archive:
+            return _step_entry(archive).file_size
+    return None
+
+def decompress(filename, target):
+    '''writes the decompressed STEP file of filename, gzip or zip, to target
+    '''
+    kind = compression(filename)
+    if kind == 'zip':
+        # the central directory, unlike decompressing(), finds the STEP
+        # entry wherever it is in the archive
+        with zipfile.ZipFile(filename) as archive:
+            source = archive.open(_step_entry(archive))
+    elif kind == 'gzip':
+        source = gzip.GzipFile(filename, 'rb')
+    else:
+        raise IOError(filename + " is not compressed")
+
+    try:
+        with open(target, 'wb') as f:
+            shutil.copyfileobj(source, f, CHUNK_SIZE)
+    finally:
+        source.close()
+    return target
@@ -0,0 +1,122 @@
+import os
+import json
+
+COST_MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cost_model.json")
+
+# jobs predicted to take longer than this are sent to the heavy pool
+HEAVY_SECONDS = 60.
+
+# entity types that drive the cost of a job, as counted by
+# STParser.preflight; complex instances count once for each partial type
+FEATURES = [
+    'ADVANCED_FACE',
+    'B_SPLINE_SURFACE_WITH_KNOTS',
+    'B_SPLINE_CURVE_WITH_KNOTS',
+    'CARTESIAN_POINT',
+    'MANIFOLD_SOLID_BREP',
+    'NEXT_ASSEMBLY_USAGE_OCCURRENCE'
+]
+
+STAGES = ['import_step', 'get_geometry', 'get_snapshots']
+
+# seconds per stage before the model is calibrated with
+# benchmarks/calibrate_cost.py; rough figures for a single core
+DEFAULT_COEFFICIENTS = {
+    'import_step': {'intercept': 0.5, 'ADVANCED_FACE': 2e-3,
+                    'B_SPLINE_SURFACE_WITH_KNOTS': 1e-2, 'NEXT_ASSEMBLY_USAGE_OCCURRENCE': 5e-3},
+    'get_geometry': {'intercept': 0.05, 'ADVANCED_FACE': 5e-4,
+                     'B_SPLINE_SURFACE_WITH_KNOTS': 5e-3},
+    'get_snapshots': {'intercept': 2.0, 'ADVANCED_FACE': 1e-3,
+                      'B_SPLINE_SURFACE_WITH_KNOTS': 2e-3}
+}
+
+def features(counts):
+    return dict((name, float(counts.get(name, 0))) for name in FEATURES)
+
+class CostModel(object):
+    '''linear model of the time of each expensive stage, in seconds, in the
+    entity counts of the STEP file
+    '''
+    def __init__(self, coefficients=None):
+        self.coefficients = coefficients or DEFAULT_COEFFICIENTS
+
+    @classmethod
+    def load(cls, filename=COST_MODEL_FILE):
+        '''the calibrated model in filename, or the default one if there is
+        none yet
+        '''
+        try:
+            with open(filename) as f:
+                return cls(json.load(f)['coefficients'])
+        except (IOError, ValueError, KeyError):
+            return cls()
+
+    def save(self, filename=COST_MODEL_FILE, **info):
+        with open(filename + ".tmp", 'w') as f:
+            json.dump(dict(info, coefficients=self.coefficients), f, indent=2, sort_keys=True)
+        os.rename(filename + ".tmp", filename)
+
+    def predict(self, counts):
+        '''{stage: seconds} for every stage, plus their sum as 'total'
+        '''
+        x = features(counts)
+        prediction = {}
+        for stage, coefficients in self.coefficients.items():
+            prediction[stage] = max(0., coefficients.get('intercept', 0.) +
+                                    sum(coefficients.get(name, 0.) * value
+                                        for name, value in x.items()))
+        prediction['total'] = sum(prediction.values())
+        return prediction
+
+def _solve(a, b):
+    '''solves the square system a x = b by Gaussian elimination with
+    partial pivoting; a and b are modified
+    '''
+    n = len(b)
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda row: abs(a[row][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        b[col], b[pivot] = b[pivot], b[col]
+        if abs(a[col][col]) < 1e-12:
+            raise ValueError("Singular system")
+        for row in range(col + 1, n):
+            factor = a[row][col] / a[col][col]
+            for k in range(col, n):
+                a[row][k] -= factor * a[col][k]
+            b[row] -= factor * b[col]
+
+    x = [0.] * n
+    for row in reversed(range(n)):
+        x[row] = (b[row] - sum(a[row][k] * x[k] for k in range(row + 1, n))) / a[row][row]
+    return x
+
+def fit(samples, ridge=1e-3):
+    '''least squares coefficients for [(counts, seconds)], none of them
+    negative: a feature whose coefficient comes out negative is dropped and
+    the rest are fitted again. Features are scaled to their largest value
+    and lightly ridge-regularised, so that features which do not vary
+    across the samples do not make the system singular.
+    '''
+    rows = [features(counts) for counts, seconds in samples]
+    y = [seconds for counts, seconds in samples]
+    active = [name for name in FEATURES if any(row[name] for row in rows)]
+
+    while True:
+        scale = dict((name, max(row[name] for row in rows)) for name in active)
+        columns = [[1.] * len(rows)] + [[row[name] / scale[name] for row in rows]
+                                        for name in active]
+        n = len(columns)
+        a = [[sum(p * q for p, q in zip(columns[i], columns[j])) + (ridge if i == j and i else 0.)
+              for j in range(n)] for i in range(n)]
+        b = [sum(p * t for p, t in zip(columns[i], y)) for i in range(n)]
+        x = _solve(a, b)
+
+        negative = [name for name, value in zip(active, x[1:]) if value < 0]
+        if not negative:
+            break
+        active = [name for name in active if name not in negative]
+
+    coefficients = {'intercept': max(0., x[0])}
+    for name, value in zip(active, x[1:]):
+        coefficients[name] = value / scale[name]
+    return coefficients
@@ -0,0 +1,280 @@
+import os
+import re
+import time
+import socket
+import urllib
+import urllib2
+import httplib
+import hashlib
+import urlparse
+import threading
+
+CHUNK_SIZE = 256 * 1024
+DOWNLOAD_RETRIES = 3
+RETRY_DELAY = 1.0
+TIMEOUT = 60
+
+_MAX_AGE = re.compile(r'max-age\s*=\s*([0-9]+)')
+
+class DownloadError(IOError):
+    pass
+
+class _Incomplete(IOError):
+    '''the connection closed before Content-Length bytes arrived
+    '''
+    pass
+
+def _freshness(headers):
+    '''(cacheable, max-age in seconds) from the Cache-Control header
+    '''
+    control = (headers.getheader('Cache-Control') or '').lower()
+    if 'no-store' in control:
+        return False, 0
+    match = _MAX_AGE.search(control)
+    if match is None or 'no-cache' in control:
+        return True, 0
+    return True, int(match.group(1))
+
+def _url(location):
+    '''location as a URL; plain paths become file: URLs
+    '''
+    if urlparse.urlparse(location).scheme:
+        return location
+    return urlparse.urljoin('file:', urllib.pathname2url(os.path.abspath(location)))
+
+class Download(threading.Thread):
+    '''downloads url into filename from a background thread, hashing the
+    bytes with SHA-256 as they arrive. A dropped connection is resumed with
+    an HTTP Range request from the last byte written, made conditional with
+    If-Range on the ETag or Last-Modified of the first response; a server
+    that answers with the whole file instead, because it has changed or
+    ignores ranges, has the file written from the start again. Readers can
+    follow the file while it grows, see stream().
+
+    With a tdpCache.DownloadCache, a copy of the URL that is still fresh is
+    used without asking the server, and an older one is revalidated with
+    If-None-Match / If-Modified-Since; cached tells which happened.
+    '''
+    def __init__(self, url, filename, chunk_size=CHUNK_SIZE, retries=DOWNLOAD_RETRIES,
+                 timeout=TIMEOUT, cache=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.url = _url(url)
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        # local files are read directly, never cached
+        self.cache = cache if not self.url.startswith('file:') else None
+        self.cached = None
+
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.length = None
+        self.resumed = 0
+        self.restarts = 0
+        self.error = None
+        self.done = False
+        self._file = None
+        self._validators = {}
+        self._if_range = None
+        self._changed = threading.Condition()
+
+    def start(self):
+        # created before the thread runs so that stream() can open it at once
+        self._file = open(self.filename, 'wb')
+        threading.Thread.start(self)
+
+    def run(self):
+        try:
+            with self._file:
+                self._fetch()
+            if self.cache is not None and self.cached is None and self._validators:
+                try:
+                    self.cache.store(self.url, self.filename, **self._validators)
+                except (IOError, OSError):
+                    print "Unable to store download in cache."
+        except Exception as e:
+            error = e
+        else:
+            error = None
+
+        with self._changed:
+            self.error = error
+            self.done = True
+            self._changed.notify_all()
+
+    def _fetch(self):
+        cached = None
+        if self.cache is not None:
+            cached = self.cache.lookup(self.url)
+        if cached is not None and cached[2] and self._copy(cached[0]):
+            self.cached = 'fresh'
+            return
+
+        attempt = 0
+        while True:
+            try:
+                request = urllib2.Request(self.url)
+                if self.size:
+                    request.add_header('Range', 'bytes=%d-' % self.size)
+                    if self._if_range:
+                        request.add_header('If-Range', self._if_range)
+                elif cached is not None:
+                    if cached[1].get('etag'):
+                        request.add_header('If-None-Match', cached[1]['etag'])
+                    if cached[1].get('last_modified'):
+                        request.add_header('If-Modified-Since', cached[1]['last_modified'])
+                response = urllib2.urlopen(request, timeout=self.timeout)
+                try:
+                    self._receive(response)
+                finally:
+                    response.close()
+                return
+            except urllib2.HTTPError as e:
+                if e.code == 304 and cached is not None and not self.size:
+                    if self._copy(cached[0]):
+                        self.cached = 'revalidated'
+                        self.cache.refresh(self.url, _freshness(e.info())[1])
+                        return
+                    # evicted in the meantime
+                    cached = None
+                    continue
+                if e.code < 500 or attempt == self.retries:
+                    raise
+            except (urllib2.URLError, socket.error, httplib.HTTPException, _Incomplete):
+                if attempt == self.retries:
+                    raise
+
+            attempt += 1
+            self.resumed += 1
+            print "Resuming download at byte " + str(self.size) + "..."
+            time.sleep(RETRY_DELAY * (2 ** (attempt - 1)))
+
+    def _receive(self, response):
+        headers = response.info()
+        length = headers.getheader('Content-Length')
+        length = int(length) if length is not None else None
+
+        if self.size and response.getcode() == 206:
+            start = headers.getheader('Content-Range', '').split(' ')[-1].split('-')[0]
+            if start != str(self.size):
+                raise DownloadError("Unexpected Content-Range " + headers.getheader('Content-Range', ''))
+            if length is not None:
+                length += self.size
+        elif self.size:
+            self._restart()
+        if length is not None:
+            self.length = length
+
+        if not self.size:
+            cacheable, max_age = _freshness(headers)
+            etag = headers.getheader('ETag')
+            last_modified = headers.getheader('Last-Modified')
+            self._validators = {}
+            if cacheable and (etag or last_modified or max_age):
+                self._validators = {'etag': etag, 'last_modified': last_modified,
+                                    'max_age': max_age}
+            # If-Range only takes a strong ETag
+            self._if_range = (etag if etag and not etag.startswith('W/')
+                              else last_modified)
+
+        while True:
+            chunk = response.read(self.chunk_size)
+            if not chunk:
+                break
+            self._write(chunk)
+
+        if self.length is not None and self.size < self.length:
+            raise _Incomplete("Connection closed after %d of %d bytes" % (self.size, self.length))
+
+    def _write(self, chunk):
+        self._file.write(chunk)
+        self._file.flush()
+        self.digest.update(chunk)
+        with self._changed:
+            self.size += len(chunk)
+            self._changed.notify_all()
+
+    def _restart(self):
+        '''empties the file for the whole of it to be written again
+        '''
+        print "Restarting download..."
+        self._file.seek(0)
+        self._file.truncate()
+        self.digest = hashlib.sha256()
+        self.length = None
+        with self._changed:
+            self.size = 0
+            self.restarts += 1
+            self._changed.notify_all()
+
+    def _copy(self, path):
+        '''fills the file from a cached copy; False if it has gone
+        '''
+        try:
+            cached = open(path, 'rb')
+        except IOError:
+            return False
+        with cached:
+            for chunk in iter(lambda: cached.read(self.chunk_size), b''):
+                self._write(chunk)
+        return True
+
+    def wait_for(self, offset, restarts=0):
+        '''blocks until the file holds more than offset bytes or the download
+        has finished; raises DownloadError if it failed, or if it has been
+        restarted more than restarts times and the bytes before offset are
+        gone
+        '''
+        with self._changed:
+            while self.size <= offset and not self.done and self.restarts == restarts:
+                # a timeout keeps the wait interruptible
+                self._changed.wait(0.5)
+            if self.restarts != restarts:
+                raise DownloadError("Download restarted")
+            if self.error is not None and self.size <= offset:
+                raise DownloadError(str(self.error))
+
+    def stream(self):
+        '''a file object that reads the download as it arrives
+        '''
+        return _Stream(self)
+
+    def result(self):
+        '''waits for the download and returns its SHA-256 digest object
+        '''
+        while self.is_alive():
+            self.join(0.5)
+        if self.error is not None:
+            raise DownloadError(str(self.error))
+        return self.digest
+
+class _Stream(object):
+    '''read-only view of a Download in progress; read() blocks until at
+    least one byte past the current position has arrived and returns b''
+    only once the download is complete. It raises DownloadError once the
+    download restarts, as what it has read is no longer in the file.
+    '''
+    def __init__(self, download):
+        self.download = download
+        self.restarts = download.restarts
+        self.file = open(download.filename, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def read(self, size=-1):
+        position = self.file.tell()
+        self.download.wait_for(position, self.restarts)
+        available = max(0, self.download.size - position)
+        chunk = self.file.read(available if size < 0 else min(size, available))
+        if self.download.restarts != self.restarts:
+            raise DownloadError("Download restarted")
+        return chunk
@@ -0,0 +1,96 @@
+import sys
+import threading
+from collections import OrderedDict
+from Queue import Queue
+
+class Task(object):
+    def __init__(self, name, func, deps, main_thread):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.main_thread = main_thread
+
+class TaskGraph(object):
+    '''runs pipeline stages as soon as the stages they depend on have
+    finished, each on its own thread. Every task is called with the results
+    of its dependencies as positional arguments, in the order listed.
+
+    Tasks added with main_thread=True run on the thread that called run(),
+    which Qt requires for in-process snapshot rendering. The first exception
+    raised by a task stops new tasks from starting and is re-raised by run()
+    once the running ones have finished.
+    '''
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self.tasks = OrderedDict()
+
+    def add(self, name, func, deps=(), main_thread=False):
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError("Task " + name + " depends on unknown task " + dep)
+        self.tasks[name] = Task(name, func, deps, main_thread)
+
+    def _execute(self, task, args):
+        try:
+            if self.recorder is not None:
+                with self.recorder.stage(task.name):
+                    result = task.func(*args)
+            else:
+                result = task.func(*args)
+            exc_info = None
+        except BaseException:
+            exc_info = sys.exc_info()
+
+        with self._lock:
+            self._running -= 1
+            if exc_info is not None:
+                if self._error is None:
+                    self._error = exc_info
+            else:
+                self._results[task.name] = result
+            self._schedule()
+
+    def _schedule(self):
+        # called with self._lock held
+        if self._error is None:
+            ready = [task for task in self._pending.values()
+                     if all(dep in self._results for dep in task.deps)]
+            for task in ready:
+                del self._pending[task.name]
+                self._running += 1
+                args = [self._results[dep] for dep in task.deps]
+                if task.main_thread:
+                    self._main.put((task, args))
+                else:
+                    thread = threading.Thread(target=self._execute, args=(task, args),
+                                              name=task.name)
+                    thread.daemon = True
+                    thread.start()
+
+        if not self._running:
+            self._main.put(None)
+
+    def run(self):
+        self._results = {}
+        self._pending = OrderedDict(self.tasks)
+        self._running = 0
+        self._error = None
+        self._lock = threading.Lock()
+        self._main = Queue()
+
+        with self._lock:
+            self._schedule()
+
+        while True:
+            item = self._main.get()
+            if item is None:
+                break
+            self._execute(*item)
+
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+
+        if self._pending:
+            raise ValueError("Unresolvable task dependencies: " + ", ".join(self._pending))
+
+        return self._results
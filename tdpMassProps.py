@@ -0,0 +1,275 @@
+import os
+import math
+import tempfile
+import multiprocessing
+
+from OCC.gp import gp_Pnt, gp_Dir, gp_Ax1
+from OCC.GProp import GProp_GProps
+from OCC.BRepGProp import (brepgprop_SurfaceProperties, BRepGProp_Face, BRepGProp_Domain,
+                            BRepGProp_Vinert)
+from OCC.BRepAdaptor import BRepAdaptor_Surface
+from OCC.GeomAbs import GeomAbs_Plane
+from OCC.TopAbs import TopAbs_SOLID, TopAbs_FACE, TopAbs_REVERSED
+from OCC.TopExp import TopExp_Explorer
+from OCC.TopoDS import topods_Face, TopoDS_Iterator
+from OCCUtils.types_lut import surface_lut
+
+from tdpUtility import write_shape, read_shape
+
+# relative error bound of OCC's adaptive Gauss integration per precision
+# tier; OCC scales it by each result, so it needs no adjusting to the
+# size or unit of a part. draft integrates at a fixed Gauss order, without
+# error control.
+PRECISIONS = {
+    "draft": None,
+    "standard": 1e-5,
+    "exact": 1e-7
+}
+DEFAULT_PRECISION = "standard"
+
+# below this many faces the integration stays in the calling process
+PARALLEL_FACES = 200
+# face ranges handed out per worker process, for load balancing
+RANGES_PER_PROCESS = 4
+# fewer faces than this per process do not pay for reading the shape
+MIN_FACES_PER_PROCESS = 50
+
+# per face and per solid sums: volume, its first moments (3), its second
+# moments about the origin of the shape (xx, yy, zz, xy, xz, yz), area and
+# its first moments (3)
+FIELDS = 14
+# followed, while integrating, by the absolute errors of volume and area
+_SUMS = FIELDS + 2
+
+# per-face table: index in solid_faces order, surface type, area, centroid
+# and, for planar faces, the outward normal
+FACE_COLUMNS = ('face', 'type', 'area', 'cx', 'cy', 'cz', 'nx', 'ny', 'nz')
+
+_AXES = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 0, 1), (0, 1, 1)]
+
+_faces = None
+_origin = None
+_tolerance = None
+_face_table = False
+
+def solid_faces(shape):
+    '''[(solid index or None, face)] in explorer order, and the number of
+    solids; faces outside any solid come last
+    '''
+    faces = []
+    solids = 0
+    solid_explorer = TopExp_Explorer(shape, TopAbs_SOLID)
+    while solid_explorer.More():
+        explorer = TopExp_Explorer(solid_explorer.Current(), TopAbs_FACE)
+        while explorer.More():
+            faces.append((solids, topods_Face(explorer.Current())))
+            explorer.Next()
+        solids += 1
+        solid_explorer.Next()
+
+    explorer = TopExp_Explorer(shape, TopAbs_FACE, TopAbs_SOLID)
+    while explorer.More():
+        faces.append((None, topods_Face(explorer.Current())))
+        explorer.Next()
+    return faces, solids
+
+def _origin_of(shape):
+    '''the point the faces are integrated about: the origin of the shape's
+    location, as brepgprop_VolumeProperties takes for the whole shape
+    '''
+    return gp_Pnt(0, 0, 0).Transformed(shape.Location().Transformation())
+
+def _volume_properties(face, origin, tolerance):
+    '''the properties of the cone from origin to face and the relative
+    error achieved; brepgprop_VolumeProperties would take the cone from the
+    origin of the face's own location, which differs between the solids of
+    a compound
+    '''
+    props = BRepGProp_Vinert()
+    props.SetLocation(origin)
+    surface = BRepGProp_Face(face)
+    # a face without wires is bounded by its surface, as in BRepGProp
+    if TopoDS_Iterator(face).More():
+        arguments = (surface, BRepGProp_Domain(face))
+    else:
+        arguments = (surface,)
+    if tolerance is None:
+        props.Perform(*arguments)
+        return props, 0.
+    return props, props.Perform(*(arguments + (tolerance,)))
+
+def _face_sums(face, origin, tolerance):
+    '''one integration per property type, all about origin; the second
+    moments are read as moments about axes through origin, which OCC returns
+    without the centroid round trip that MatrixOfInertia takes
+    '''
+    props, volume_error = _volume_properties(face, origin, tolerance)
+    surface = GProp_GProps()
+    if tolerance is None:
+        brepgprop_SurfaceProperties(face, surface)
+        area_error = 0.
+    else:
+        # the relative error OCC achieved
+        area_error = brepgprop_SurfaceProperties(face, surface, tolerance)
+    volume = props.Mass()
+    centre = props.CentreOfMass()
+    moments = [props.MomentOfInertia(gp_Ax1(origin, gp_Dir(*axis))) for axis in _AXES]
+    xx, yy, zz = moments[:3]
+    # about (a + b) / sqrt(2): (aa + bb) / 2 + ab
+    xy = moments[3] - (xx + yy) / 2.
+    xz = moments[4] - (xx + zz) / 2.
+    yz = moments[5] - (yy + zz) / 2.
+
+    area = surface.Mass()
+    surface_centre = surface.CentreOfMass()
+
+    return (volume, volume * centre.X(), volume * centre.Y(), volume * centre.Z(),
+            xx, yy, zz, xy, xz, yz,
+            area, area * surface_centre.X(), area * surface_centre.Y(), area * surface_centre.Z(),
+            abs(volume * volume_error), abs(area * area_error))
+
+def face_row(index, face, area, centroid):
+    '''the FACE_COLUMNS row of a face; the type comes from
+    OCCUtils.types_lut, the normal from the plane itself
+    '''
+    adaptor = BRepAdaptor_Surface(face, True)
+    kind = adaptor.GetType()
+    normal = (None, None, None)
+    if kind == GeomAbs_Plane:
+        plane = adaptor.Plane()
+        direction = plane.Axis().Direction()
+        # the surface normal is X x Y, against the axis of an indirect plane
+        sign = 1 if plane.Position().Direct() else -1
+        if face.Orientation() == TopAbs_REVERSED:
+            sign = -sign
+        normal = (sign * direction.X(), sign * direction.Y(), sign * direction.Z())
+    return (index, surface_lut[kind], area) + tuple(centroid) + normal
+
+def _accumulate(faces, origin, tolerance, rows=None, start=0):
+    '''{solid index or None: sums} over faces; with rows, appends the
+    FACE_COLUMNS row of each face, numbered from start
+    '''
+    sums = {}
+    for number, (solid, face) in enumerate(faces, start):
+        values = _face_sums(face, origin, tolerance)
+        total = sums.setdefault(solid, [0.] * _SUMS)
+        for index, value in enumerate(values):
+            total[index] += value
+        if rows is not None:
+            area = values[10]
+            centroid = [value / area for value in values[11:14]] if area else (None, None, None)
+            rows.append(face_row(number, face, area, centroid))
+    return sums
+
+def _merge(sums, more):
+    for solid, values in more.items():
+        total = sums.setdefault(solid, [0.] * _SUMS)
+        for index, value in enumerate(values):
+            total[index] += value
+    return sums
+
+def _load(filename, tolerance, face_table):
+    '''pool initializer: reads the shape once per worker process
+    '''
+    global _faces, _origin, _tolerance, _face_table
+    shape = read_shape(filename)
+    _faces = solid_faces(shape)[0]
+    _origin = _origin_of(shape)
+    _tolerance = tolerance
+    _face_table = face_table
+
+def _range(span):
+    start, end = span
+    rows = [] if _face_table else None
+    return _accumulate(_faces[start:end], _origin, _tolerance, rows, start), rows
+
+def sum_properties(sums, origin):
+    '''volume, area, centroid and the inertia matrix about the centroid, for
+    density 1, from summed moments
+    '''
+    volume = sums[0]
+    area = sums[10]
+    if abs(volume) > 0:
+        centroid = (sums[1] / volume, sums[2] / volume, sums[3] / volume)
+    elif area > 0:
+        centroid = (sums[11] / area, sums[12] / area, sums[13] / area)
+    else:
+        centroid = (origin.X(), origin.Y(), origin.Z())
+
+    # parallel axis theorem, from the origin to the centroid
+    xx, yy, zz, xy, xz, yz = sums[4:10]
+    dx, dy, dz = (centroid[0] - origin.X(), centroid[1] - origin.Y(),
+                  centroid[2] - origin.Z())
+    xx -= volume * (dy * dy + dz * dz)
+    yy -= volume * (dx * dx + dz * dz)
+    zz -= volume * (dx * dx + dy * dy)
+    xy += volume * dx * dy
+    xz += volume * dx * dz
+    yz += volume * dy * dz
+
+    return {'volume': volume, 'area': area, 'centroid': centroid,
+            'inertia': ((xx, xy, xz), (xy, yy, yz), (xz, yz, zz))}
+
+def _errors(sums):
+    '''relative errors of volume and area from the summed absolute errors
+    of the faces, an upper bound
+    '''
+    return {'volume': sums[FIELDS] / abs(sums[0]) if sums[0] else 0.,
+            'area': sums[FIELDS + 1] / sums[10] if sums[10] else 0.}
+
+def mass_properties(shape, precision=DEFAULT_PRECISION, processes=None, scratch=None,
+                    face_table=False):
+    '''volume, area, centroid and inertia matrix (about the centroid, for
+    density 1) of shape from a single integration of each face, plus the
+    same for each of its solids under 'solids'. precision is one of
+    PRECISIONS; the relative errors of volume and area it achieved go under
+    'error', None for draft. With face_table, 'faces' holds a FACE_COLUMNS
+    row per face from the same integration.
+
+    Faces are integrated in ranges across a process pool once the shape
+    has PARALLEL_FACES faces; every worker reads the shape from a BRep copy
+    in scratch once. Pool workers of the caller, which may not start
+    processes of their own, integrate in-process.
+    '''
+    tolerance = PRECISIONS[precision]
+    faces, solids = solid_faces(shape)
+    origin = _origin_of(shape)
+    processes = min(processes or multiprocessing.cpu_count(),
+                    len(faces) // MIN_FACES_PER_PROCESS)
+
+    rows = [] if face_table else None
+    if (len(faces) < PARALLEL_FACES or processes <= 1 or
+            multiprocessing.current_process().daemon):
+        sums = _accumulate(faces, origin, tolerance, rows)
+    else:
+        handle, filename = tempfile.mkstemp(suffix='.brep', dir=scratch)
+        os.close(handle)
+        try:
+            write_shape(shape, filename)
+            size = int(math.ceil(len(faces) / float(processes * RANGES_PER_PROCESS)))
+            spans = [(start, start + size) for start in range(0, len(faces), size)]
+            pool = multiprocessing.Pool(processes, initializer=_load,
+                                        initargs=(filename, tolerance, face_table))
+            try:
+                sums = {}
+                for more, more_rows in pool.imap_unordered(_range, spans):
+                    _merge(sums, more)
+                    if rows is not None:
+                        rows.extend(more_rows)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            os.remove(filename)
+
+    total = [0.] * _SUMS
+    for values in sums.values():
+        for index, value in enumerate(values):
+            total[index] += value
+
+    result = sum_properties(total, origin)
+    result['error'] = _errors(total) if tolerance is not None else None
+    result['faces'] = sorted(rows) if rows is not None else None
+    result['solids'] = [sum_properties(sums.get(index, [0.] * _SUMS), origin)
+                        for index in range(solids)]
+    return result
@@ -0,0 +1,165 @@
+from OCC.gp import gp_Pnt
+from OCC.BRep import BRep_Tool
+from OCC.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.BRepBuilderAPI import BRepBuilderAPI_Copy
+from OCC.BRepTools import breptools_Clean
+from OCC.TopAbs import TopAbs_REVERSED
+
+from OCCUtils.Common import get_boundingbox
+from tdpAssembly import transform_values
+from tdpMassProps import solid_faces, sum_properties, face_row, FIELDS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# linear deflection of the mesh as a fraction of the bounding box
+# diagonal, per tdpMassProps precision tier
+DEFLECTION_RATIOS = {
+    "draft": 1e-2,
+    "standard": 1e-3,
+    "exact": 1e-4
+}
+DEFLECTION_RATIO = DEFLECTION_RATIOS["standard"]
+ANGULAR_DEFLECTION = 0.5
+
+def available():
+    return numpy is not None
+
+def deflection_of(shape, ratio=DEFLECTION_RATIO):
+    xmin, ymin, zmin, xmax, ymax, zmax = get_boundingbox(shape)
+    return ratio * ((xmax - xmin) ** 2 + (ymax - ymin) ** 2 + (zmax - zmin) ** 2) ** .5
+
+def triangulate(shape, deflection):
+    '''meshes shape and returns its vertices (n x 3 floats), triangles
+    (m x 3 vertex indices, outward by the right hand rule), the solid index
+    of every triangle (-1 outside any solid), the number of solids, and the
+    solid_faces index of the face of every triangle. Raises ValueError if a
+    face cannot be meshed, as its area and volume would be missing.
+    '''
+    # meshing stores the triangulation on the TShapes, which the snapshot
+    # stage renders at the same time, so a copy is meshed; a triangulation
+    # copied along would be kept if it is finer than deflection
+    copy = BRepBuilderAPI_Copy(shape).Shape()
+    breptools_Clean(copy)
+    BRepMesh_IncrementalMesh(copy, deflection, False, ANGULAR_DEFLECTION, True)
+
+    faces, solids = solid_faces(copy)
+    vertices, triangles, owners, sources = [], [], [], []
+    count = 0
+    for number, (solid, face) in enumerate(faces):
+        location = face.Location()
+        handle = BRep_Tool.Triangulation(face, location)
+        if handle.IsNull():
+            raise ValueError("Face %d could not be meshed" % number)
+        triangulation = handle.GetObject()
+        nodes = triangulation.Nodes()
+        points = numpy.array([(point.X(), point.Y(), point.Z()) for point in
+                              (nodes.Value(index) for index in range(1, nodes.Length() + 1))])
+        matrix = numpy.array(transform_values(location)).reshape(3, 4)
+        vertices.append(points.dot(matrix[:, :3].T) + matrix[:, 3])
+
+        items = triangulation.Triangles()
+        indices = numpy.array([items.Value(index).Get() for index in range(1, items.Length() + 1)],
+                              dtype=numpy.int64) - 1 + count
+        if face.Orientation() == TopAbs_REVERSED:
+            indices = indices[:, (0, 2, 1)]
+        triangles.append(indices)
+        owners.append(numpy.full(len(indices), -1 if solid is None else solid, dtype=numpy.int64))
+        sources.append(numpy.full(len(indices), number, dtype=numpy.int64))
+        count += len(points)
+
+    if not triangles:
+        raise ValueError("Shape has no triangulation")
+    return (numpy.vstack(vertices), numpy.vstack(triangles), numpy.concatenate(owners), solids,
+            numpy.concatenate(sources))
+
+def _sums(vertices, triangles, owners, solids, reference):
+    '''the tdpMassProps sums per solid (and, last, outside any solid) from
+    the tetrahedra between reference and every triangle
+    '''
+    relative = vertices - reference
+    a, b, c = relative[triangles[:, 0]], relative[triangles[:, 1]], relative[triangles[:, 2]]
+    volume = numpy.einsum('ij,ij->i', a, numpy.cross(b, c)) / 6.
+    corners = a + b + c
+    # second moments of a tetrahedron with one vertex at the reference
+    second = lambda i, j: volume / 20. * (a[:, i] * a[:, j] + b[:, i] * b[:, j] +
+                                          c[:, i] * c[:, j] + corners[:, i] * corners[:, j])
+    xx, yy, zz = second(0, 0), second(1, 1), second(2, 2)
+    area = numpy.sqrt((numpy.cross(b - a, c - a) ** 2).sum(axis=1)) / 2.
+
+    fields = numpy.empty((len(triangles), FIELDS))
+    fields[:, 0] = volume
+    fields[:, 1:4] = volume[:, None] * (corners / 4. + reference)
+    fields[:, 4] = yy + zz
+    fields[:, 5] = xx + zz
+    fields[:, 6] = xx + yy
+    fields[:, 7] = -second(0, 1)
+    fields[:, 8] = -second(0, 2)
+    fields[:, 9] = -second(1, 2)
+    fields[:, 10] = area
+    fields[:, 11:14] = area[:, None] * (corners / 3. + reference)
+
+    buckets = numpy.where(owners < 0, solids, owners)
+    return numpy.array([numpy.bincount(buckets, weights=fields[:, index], minlength=solids + 1)
+                        for index in range(FIELDS)]).T
+
+def _face_rows(shape, vertices, triangles, sources):
+    '''FACE_COLUMNS rows with the area and centroid of every face summed
+    over its triangles
+    '''
+    faces = solid_faces(shape)[0]
+    a, b, c = vertices[triangles[:, 0]], vertices[triangles[:, 1]], vertices[triangles[:, 2]]
+    area = numpy.sqrt((numpy.cross(b - a, c - a) ** 2).sum(axis=1)) / 2.
+    areas = numpy.bincount(sources, weights=area, minlength=len(faces))
+    moments = numpy.array([numpy.bincount(sources, weights=area * (a + b + c)[:, axis] / 3.,
+                                          minlength=len(faces)) for axis in range(3)]).T
+    return [face_row(index, face, areas[index],
+                     moments[index] / areas[index] if areas[index] else (None, None, None))
+            for index, (solid, face) in enumerate(faces)]
+
+def _mesh_properties(shape, deflection, face_table=False):
+    vertices, triangles, owners, solids, sources = triangulate(shape, deflection)
+    lower, upper = vertices.min(axis=0), vertices.max(axis=0)
+    reference = (lower + upper) / 2.
+    sums = _sums(vertices, triangles, owners, solids, reference)
+
+    origin = gp_Pnt(*reference)
+    result = sum_properties(list(sums.sum(axis=0)), origin)
+    result['solids'] = [sum_properties(list(sums[index]), origin) for index in range(solids)]
+    result['boundingbox'] = tuple(lower) + tuple(upper)
+    result['triangles'] = len(triangles)
+    result['faces'] = _face_rows(shape, vertices, triangles, sources) if face_table else None
+    return result
+
+def mesh_properties(shape, deflection=None, estimate=True, face_table=False):
+    '''volume, area, centroid, inertia matrix (about the centroid, for
+    density 1) and solids as tdpMassProps.mass_properties returns them,
+    plus the axis-aligned boundingbox of the mesh vertices, from a mesh of
+    shape with the given linear deflection (default: DEFLECTION_RATIO of
+    the bounding box diagonal).
+
+    The mesh error is close to linear in the deflection, so with estimate
+    the shape is meshed at twice the deflection as well and the relative
+    differences of volume and area go under 'error' as an estimate of the
+    error against the exact integration. With face_table, 'faces' holds a
+    tdpMassProps FACE_COLUMNS row per face.
+    '''
+    if numpy is None:
+        raise ImportError("The mesh geometry backend needs NumPy")
+    if deflection is None:
+        deflection = deflection_of(shape)
+
+    coarse = _mesh_properties(shape, 2 * deflection) if estimate else None
+    result = _mesh_properties(shape, deflection, face_table)
+    result['deflection'] = deflection
+    result['error'] = None
+    if coarse is not None:
+        result['error'] = {
+            'volume': (abs(result['volume'] - coarse['volume']) / abs(result['volume'])
+                       if result['volume'] else 0.),
+            'area': (abs(result['area'] - coarse['area']) / result['area']
+                     if result['area'] else 0.)
+        }
+    return result
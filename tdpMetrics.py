@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import json
+import uuid
+import resource
+import threading
+import cProfile
+from contextlib import contextmanager
+
+METRICS_FILE = "metrics.jsonl"
+
+# getrusage of the calling thread is Linux only, and Python 2 does not
+# name the constant
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD',
+                        1 if sys.platform.startswith('linux') else None)
+
+def _thread_cpu_time():
+    '''user + system time of the calling thread, or None
+    '''
+    if RUSAGE_THREAD is None:
+        return None
+    try:
+        usage = resource.getrusage(RUSAGE_THREAD)
+    except (ValueError, resource.error):
+        return None
+    return usage.ru_utime + usage.ru_stime
+
+# stages run concurrently in threads, so their CPU time is that of their
+# own thread; CPU_SCOPE is 'process' where it has to be the process total
+CPU_SCOPE = 'thread' if _thread_cpu_time() is not None else 'process'
+
+def _cpu_time():
+    '''user + system time of the calling thread (of the process, see
+    CPU_SCOPE) and of waited-for children, which covers the xvfb-run
+    snapshot subprocess
+    '''
+    t = os.times()
+    own = _thread_cpu_time() if CPU_SCOPE == 'thread' else t[0] + t[1]
+    return own + t[2] + t[3]
+
+def _high_water_kb():
+    '''VmHWM, the peak RSS of this process since the last reset, or None
+    without /proc
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def _reset_high_water():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+# stages run concurrently within a job, so resetting the high-water mark
+# for one stage first folds it into the peaks of the others still open
+_lock = threading.Lock()
+_open = {}
+
+def _start_peak():
+    with _lock:
+        high_water = _high_water_kb()
+        if high_water is not None:
+            for key in _open:
+                _open[key] = max(_open[key], high_water)
+        _reset_high_water()
+        key = object()
+        _open[key] = 0
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return key, children
+
+def _peak_rss_kb(started):
+    '''peak RSS of this process during a stage, from VmHWM (ru_maxrss, the
+    peak over its lifetime, without /proc), and of the largest child
+    waited for during the stage if it was larger than any before, else None
+    '''
+    key, children_before = started
+    with _lock:
+        high_water = _high_water_kb()
+        peak = _open.pop(key)
+    if high_water is None:
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    else:
+        own = max(peak, high_water)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own, children if children > children_before else None
+
+class StageRecorder(object):
+    '''records wall time, CPU time and peak RSS for each pipeline stage of one
+    job, the CPU time of the stage's own thread unless the record's
+    cpu_scope is 'process'; with profile_dir set every stage is also run under cProfile and its
+    stats are dumped to <profile_dir>/<job_id>_<stage>.prof
+    '''
+    def __init__(self, job_id=None, profile_dir=None, **info):
+        self.job_id = job_id or str(uuid.uuid4())
+        self.profile_dir = profile_dir
+        self.info = info
+        self.stages = []
+        self.status = "ok"
+        self.started = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        profiler = None
+        if self.profile_dir:
+            profiler = cProfile.Profile()
+
+        entry = {'stage': name}
+        wall = time.time()
+        cpu = _cpu_time()
+        peak = _start_peak()
+        if profiler:
+            profiler.enable()
+
+        try:
+            yield entry
+        except BaseException:
+            entry['error'] = True
+            self.status = "error"
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            entry['wall'] = round(time.time() - wall, 6)
+            entry['cpu'] = round(_cpu_time() - cpu, 6)
+            entry['peak_rss_kb'], entry['children_peak_rss_kb'] = _peak_rss_kb(peak)
+            self.stages.append(entry)
+
+            if profiler:
+                if not os.path.isdir(self.profile_dir):
+                    os.makedirs(self.profile_dir)
+                profiler.dump_stats(os.path.join(
+                    self.profile_dir, self.job_id + "_" + name + ".prof"))
+
+    def record(self):
+        record = {
+            'job': self.job_id,
+            'started': self.started,
+            'wall': round(time.time() - self.started, 6),
+            'status': self.status,
+            'cpu_scope': CPU_SCOPE,
+            'stages': self.stages
+        }
+        record.update(self.info)
+        return record
+
+    def write(self, filename=METRICS_FILE):
+        with open(filename, 'a') as f:
+            f.write(json.dumps(self.record()) + '\n')
@@ -0,0 +1,66 @@
+import os
+import time
+import threading
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+# S3 requires every part but the last to be at least 5 MB
+PART_SIZE = 8 * 1024 * 1024
+MULTIPART_THRESHOLD = 2 * PART_SIZE
+UPLOAD_WORKERS = 4
+PART_RETRIES = 3
+RETRY_DELAY = 1.0
+
+def source_size(fp):
+    fp.seek(0, os.SEEK_END)
+    size = fp.tell()
+    fp.seek(0)
+    return size
+
+class _PartReader(object):
+    '''hands out byte ranges of one shared file to concurrent part uploads
+    '''
+    def __init__(self, fp):
+        self.fp = fp
+        self.lock = threading.Lock()
+
+    def read(self, offset, size):
+        with self.lock:
+            self.fp.seek(offset)
+            return self.fp.read(size)
+
+def _upload_part(mp, reader, part_num, offset, size, retries):
+    for attempt in range(retries + 1):
+        try:
+            data = BytesIO(reader.read(offset, size))
+            mp.upload_part_from_file(data, part_num, size=size)
+            return part_num
+        except Exception:
+            if attempt == retries:
+                raise
+            print "Retrying part " + str(part_num) + "..."
+            time.sleep(RETRY_DELAY * (2 ** attempt))
+
+def multipart_upload(bucket, key_name, fp, part_size=PART_SIZE, workers=UPLOAD_WORKERS,
+                     retries=PART_RETRIES):
+    '''uploads the open file fp as key_name in parts of part_size bytes, at
+    most workers parts at a time; each part is retried on its own and the
+    whole upload is aborted if one part keeps failing
+    '''
+    size = source_size(fp)
+    reader = _PartReader(fp)
+    parts = [(index + 1, offset, min(part_size, size - offset))
+             for index, offset in enumerate(range(0, size, part_size))]
+
+    mp = bucket.initiate_multipart_upload(key_name)
+    pool = ThreadPool(min(workers, len(parts)) or 1)
+    try:
+        pool.map(lambda part: _upload_part(mp, reader, part[0], part[1], part[2], retries),
+                 parts)
+        mp.complete_upload()
+    except:
+        mp.cancel_upload()
+        raise
+    finally:
+        pool.close()
+        pool.join()
@@ -1,9 +1,88 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
 import aocxchange.step
+from OCC.BRep import BRep_Builder
+from OCC.TopoDS import TopoDS_Shape, TopoDS_Compound
+
+try:
+    from OCC.BinTools import bintools_Write as brep_write, bintools_Read as brep_read
+except ImportError:
+    from OCC.BRepTools import breptools_Write as brep_write, breptools_Read as _breptools_Read
+
+    def brep_read(shape, filename):
+        return _breptools_Read(shape, filename, BRep_Builder())
 
 FILENAME = "inputFile.stp"
 SNAPSHOTS_FILE = "snapshots.txt"
+SHAPE_FILE = "inputFile.brep"
+
+# memory backed file system for large intermediate files such as
+# decompressed STEP input; only used while it keeps TMPFS_HEADROOM free
+TMPFS = "/dev/shm"
+TMPFS_HEADROOM = 256 * 1024 * 1024
+
+class TDPError(Exception):
+    '''raised by a pipeline stage; the message is reported back as outputFile
+    '''
+    pass
+
+class JobDirectory(object):
+    '''private scratch directory for one job, removed on exit unless keep is
+    set; artifact names carry the job id so that concurrent jobs never collide
+    '''
+    def __init__(self, root=None, keep=False):
+        if root and not os.path.isdir(root):
+            os.makedirs(root)
+        self.id = uuid.uuid4().hex
+        self.path = tempfile.mkdtemp(prefix='tdp_' + self.id[:8] + '_', dir=root)
+        self.keep = keep
+        self.memory_path = None
+        # one stem for every artifact of the job, even across a second boundary
+        self.stem = 'TDP_' + str(int(time.time())) + '_' + self.id[:8]
+
+    def join(self, name):
+        return os.path.join(self.path, name)
+
+    def memory_join(self, name, size):
+        '''path for a scratch file of about size bytes on TMPFS if it has the
+        room, otherwise in the job directory
+        '''
+        try:
+            stat = os.statvfs(TMPFS)
+            room = stat.f_bavail * stat.f_frsize >= size + TMPFS_HEADROOM
+        except OSError:
+            room = False
+        if not room:
+            return self.join(name)
+
+        if self.memory_path is None:
+            self.memory_path = tempfile.mkdtemp(prefix='tdp_' + self.id[:8] + '_', dir=TMPFS)
+        return os.path.join(self.memory_path, name)
+
+    def artifact(self, extension):
+        '''TDP_<unix-seconds>_<job>.<extension>
+        '''
+        return self.stem + extension
+
+    def cleanup(self):
+        if not self.keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+        # memory is not left behind even with keep
+        if self.memory_path:
+            shutil.rmtree(self.memory_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
 
 def import_step(filename):
+    '''the shapes of filename as one shape, a compound if there are several
+    '''
     print "Importing shapes from STP file..."
     
     try:
@@ -12,5 +91,26 @@ def import_step(filename):
         print str(len(my_importer.shapes)) + " shapes loaded..."
     except:
         raise Exception("Error importing shapes from STP file.")
-        
-    return my_importer.shapes[0]
+
+    if len(my_importer.shapes) == 1:
+        return my_importer.shapes[0]
+    builder = BRep_Builder()
+    compound = TopoDS_Compound()
+    builder.MakeCompound(compound)
+    for shape in my_importer.shapes:
+        builder.Add(compound, shape)
+    return compound
+
+def write_shape(shape, filename=SHAPE_FILE):
+    '''writes an imported shape as native BRep, binary when OCC.BinTools is
+    available, so that other processes can skip STEP translation
+    '''
+    # older BinTools returns nothing, only an explicit False is a failure
+    if brep_write(shape, filename) is False:
+        raise Exception("Error writing shape to " + filename)
+
+def read_shape(filename=SHAPE_FILE):
+    shape = TopoDS_Shape()
+    if brep_read(shape, filename) is False:
+        raise Exception("Error reading shape from " + filename)
+    return shape
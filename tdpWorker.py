@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Long-lived TDP worker. Keeps OCC, aocxchange, boto, PyQt5 and PIL imported
+# and one offscreen render context open, and processes jobs that use the same
+# inputFile/material/coatings format as in.txt. Start it under Xvfb once:
+#
+#   xvfb-run -a --server-args='-screen 0 1360x768x24' python generateTDP.py --worker --queue /var/tdp/queue
+#   xvfb-run -a --server-args='-screen 0 1360x768x24' python generateTDP.py --worker --socket /var/tdp/tdp.sock
+#
+# Queue mode: drop <job>.in into the queue directory, the reply is written to
+# <job>.out. Socket mode: send the in.txt contents, shut down the write side,
+# read the reply. Replies have the same contents exit_app writes to out.txt.
+
+import os
+import sys
+import time
+import socket
+import signal
+
+from generateTDP import (format_output, parse_dome_inputs, get_tdp_inputs,
+                         run_tdp, DEFAULT_PRECISION)
+from generateSnapshots import SnapshotRenderer
+from tdpUtility import TDPError
+from tdpMetrics import StageRecorder, METRICS_FILE
+
+JOB_SUFFIX = ".in"
+WORK_SUFFIX = ".work"
+OUT_SUFFIX = ".out"
+POLL_INTERVAL = 0.5
+# seconds a socket client has to send its whole request
+REQUEST_TIMEOUT = 30
+
+_running = True
+
+def _stop(signum, frame):
+    global _running
+    _running = False
+
+def handle_job(text, renderer, metrics_file=METRICS_FILE, profile_dir=None, cache=None,
+               scratch=None, keep=False, downloads=None, geometry="exact", boundingbox="tight",
+               precision=DEFAULT_PRECISION):
+    recorder = StageRecorder(profile_dir=profile_dir)
+
+    try:
+        with recorder.stage('get_tdp_inputs'):
+            inputs = parse_dome_inputs(text.splitlines())
+            inputFile, material, coatings = get_tdp_inputs(inputs)
+        recorder.info.update(inputFile=inputFile, material=material, coatings=coatings)
+
+        outtext = run_tdp(inputFile, material, coatings, renderer=renderer,
+                          recorder=recorder, cache=cache, scratch=scratch, keep=keep,
+                          downloads=downloads, geometry=geometry, boundingbox=boundingbox,
+                          precision=precision)
+    except TDPError as e:
+        outtext = str(e)
+    except:
+        outtext = "Unknown error."
+
+    if metrics_file:
+        recorder.write(metrics_file)
+
+    return format_output(outtext)
+
+def claim_job(queue_dir):
+    '''renames the oldest <job>.in to <job>.work so that concurrent workers
+    sharing a queue directory never pick up the same job
+    '''
+    jobs = []
+    for name in os.listdir(queue_dir):
+        if not name.endswith(JOB_SUFFIX):
+            continue
+        try:
+            jobs.append((os.path.getmtime(os.path.join(queue_dir, name)), name))
+        except OSError:
+            # claimed by another worker since the listing
+            continue
+    jobs.sort()
+
+    for mtime, name in jobs:
+        job_path = os.path.join(queue_dir, name)
+        work_path = job_path[:-len(JOB_SUFFIX)] + WORK_SUFFIX
+        try:
+            os.rename(job_path, work_path)
+        except OSError:
+            continue
+        return work_path
+
+    return None
+
+def serve_queue(queue_dir, renderer, poll_interval=POLL_INTERVAL, **job_options):
+    print "Watching queue " + queue_dir + "..."
+
+    while _running:
+        work_path = claim_job(queue_dir)
+        if work_path is None:
+            time.sleep(poll_interval)
+            continue
+
+        with open(work_path) as f:
+            reply = handle_job(f.read(), renderer, **job_options)
+
+        out_path = work_path[:-len(WORK_SUFFIX)] + OUT_SUFFIX
+        with open(out_path + ".tmp", 'w') as f:
+            f.write(reply)
+        os.rename(out_path + ".tmp", out_path)
+        os.remove(work_path)
+
+def receive_request(conn, timeout=REQUEST_TIMEOUT):
+    '''reads a request from conn up to the client's shutdown of its write
+    side; raises TDPError if it takes more than timeout seconds
+    '''
+    conn.settimeout(timeout)
+    chunks = []
+    try:
+        while True:
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.timeout:
+        raise TDPError("No request within %d seconds." % timeout)
+    return "".join(chunks)
+
+def serve_socket(socket_path, renderer, request_timeout=REQUEST_TIMEOUT, **job_options):
+    print "Listening on " + socket_path + "..."
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(5)
+    server.settimeout(POLL_INTERVAL)
+
+    try:
+        while _running:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                if not _running:
+                    break
+                raise
+
+            try:
+                request = receive_request(conn, request_timeout)
+                conn.settimeout(None)
+                conn.sendall(handle_job(request, renderer, **job_options))
+            except TDPError as e:
+                print str(e)
+            except socket.error:
+                pass
+            finally:
+                conn.close()
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+def serve(queue_dir=None, socket_path=None, metrics_file=METRICS_FILE, profile_dir=None,
+          cache=None, scratch=None, keep=False, downloads=None, geometry="exact",
+          boundingbox="tight", precision=DEFAULT_PRECISION):
+    if bool(queue_dir) == bool(socket_path):
+        sys.stderr.write("--worker needs exactly one of --queue or --socket\n")
+        sys.exit(2)
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    renderer = SnapshotRenderer()
+    job_options = {'metrics_file': metrics_file and os.path.abspath(metrics_file),
+                   'profile_dir': profile_dir and os.path.abspath(profile_dir),
+                   'cache': cache,
+                   'downloads': downloads,
+                   'geometry': geometry,
+                   'boundingbox': boundingbox,
+                   'precision': precision,
+                   'scratch': scratch and os.path.abspath(scratch),
+                   'keep': keep}
+
+    if queue_dir:
+        serve_queue(queue_dir, renderer, **job_options)
+    else:
+        serve_socket(socket_path, renderer, **job_options)
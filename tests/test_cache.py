@@ -0,0 +1,102 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import tdpCache as module
+from tdpCache import DiskLRU, ResultCache, DownloadCache, URL_MARGIN
+
+class BrokenFile(object):
+    def seek(self, offset):
+        pass
+
+    def read(self, size=-1):
+        raise IOError("Disk error")
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def file(self, data):
+        filename = os.path.join(self.directory, 'source')
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def files(self, cache):
+        return sorted(name for name in os.listdir(cache.directory)
+                      if name not in (module.INDEX_FILE, module.LOCK_FILE))
+
+    def test_eviction(self):
+        cache = DiskLRU(os.path.join(self.directory, 'cache'), 250)
+        for key in ('a', 'b', 'c'):
+            cache.put_file(key, BytesIO(b'x' * 100))
+            time.sleep(0.01)
+        # c takes the cache over its limit, and a, the least recently used, goes
+        self.assertEqual(self.files(cache), ['b', 'c'])
+        self.assertIsNotNone(cache.get('b'))
+        time.sleep(0.01)
+        cache.put('d', self.file(b'y' * 100))
+        self.assertEqual(self.files(cache), ['b', 'd'])
+        self.assertIsNone(cache.get('c'))
+        stats = cache.stats()
+        self.assertEqual((stats['evictions'], stats['entries'], stats['bytes']), (2, 2, 200))
+
+    def test_missing_file(self):
+        cache = DiskLRU(os.path.join(self.directory, 'cache'), 1000)
+        cache.put_file('a', BytesIO(b'x'))
+        os.remove(cache.path('a'))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_temporary_files(self):
+        cache = DiskLRU(os.path.join(self.directory, 'cache'), 1000)
+        first, second = cache._temp('a'), cache._temp('a')
+        self.assertNotEqual(first[1], second[1])
+        for fd, tmp in (first, second):
+            os.close(fd)
+            os.remove(tmp)
+
+        cache.put('a', self.file(b'x' * 10))
+        cache.put_file('a', BytesIO(b'y' * 10))
+        with self.assertRaises(IOError):
+            cache.put_file('b', BrokenFile())
+        self.assertEqual(self.files(cache), ['a'])
+        with open(cache.path('a'), 'rb') as f:
+            self.assertEqual(f.read(), b'y' * 10)
+
+    def test_url_expiry(self):
+        cache = ResultCache(os.path.join(self.directory, 'cache'), 1000)
+        cache.store('a', 'part.zip', BytesIO(b'zip'), 'http://url', URL_MARGIN + 60)
+        self.assertEqual(cache.lookup('a'), ('http://url', cache.path('a'), 'part.zip'))
+        cache.refresh('a', 'http://url', URL_MARGIN - 60)
+        self.assertEqual(cache.lookup('a'), (None, cache.path('a'), 'part.zip'))
+
+    def test_freshness(self):
+        cache = DownloadCache(os.path.join(self.directory, 'cache'), 1000)
+        url = 'http://host/part.stp'
+        cache.store(url, self.file(b'x'), etag='"1"')
+        path, entry, fresh = cache.lookup(url)
+        self.assertEqual((entry['etag'], fresh), ('"1"', False))
+        cache.refresh(url, 60)
+        self.assertTrue(cache.lookup(url)[2])
+
+    def test_result_key(self):
+        cache = ResultCache(os.path.join(self.directory, 'cache'), 1000)
+        filename = self.file(b'ISO-10303-21;')
+        key = cache.key(filename, 'steel', 'paint')
+        self.assertEqual(cache.key(filename, 'steel', 'paint',
+                                   module.file_digest(filename).hexdigest()), key)
+        self.assertNotEqual(cache.key(filename, 'steel', 'paint', variant='mesh'), key)
+        self.assertNotEqual(cache.key(filename, 'steel', 'paint,'), key)
+        version = module.RESULT_VERSION
+        module.RESULT_VERSION += 1
+        try:
+            self.assertNotEqual(cache.key(filename, 'steel', 'paint'), key)
+        finally:
+            module.RESULT_VERSION = version
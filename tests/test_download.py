@@ -0,0 +1,96 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+import tdpDownload as module
+from tdpDownload import Download, DownloadError
+from tdpCache import DownloadCache
+from benchmarks.standins import serve_directory
+
+SIZE = 1024 * 1024
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.served = os.path.join(self.directory, 'served')
+        os.mkdir(self.served)
+        self.write(os.urandom(SIZE))
+        self.server = None
+        self.retry_delay = module.RETRY_DELAY
+        self.urlopen = module.urllib2.urlopen
+        module.RETRY_DELAY = 0
+
+    def tearDown(self):
+        module.RETRY_DELAY = self.retry_delay
+        module.urllib2.urlopen = self.urlopen
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        self.data = data
+        with open(os.path.join(self.served, 'part.stp'), 'wb') as f:
+            f.write(data)
+
+    def serve(self, drop_at=None):
+        self.server, base_url = serve_directory(self.served, drop_at)
+        return base_url + 'part.stp'
+
+    def before_resume(self, change):
+        '''calls change(request) before every request for a range
+        '''
+        def urlopen(request, *args, **kwargs):
+            if request.has_header('Range'):
+                change(request)
+            return self.urlopen(request, *args, **kwargs)
+        module.urllib2.urlopen = urlopen
+
+    def download(self, url, cache=None):
+        download = Download(url, os.path.join(self.directory, 'part.stp'),
+                            chunk_size=16 * 1024, cache=cache)
+        download.start()
+        digest = download.result()
+        with open(download.filename, 'rb') as f:
+            self.assertTrue(f.read() == self.data, "file differs from the one served")
+        self.assertEqual(digest.hexdigest(), hashlib.sha256(self.data).hexdigest())
+        return download
+
+    def test_resume(self):
+        requests = []
+        self.before_resume(lambda request: requests.append(request.get_header('If-range')))
+        download = self.download(self.serve(drop_at=SIZE // 3))
+        self.assertEqual(download.resumed, 1)
+        self.assertEqual(download.restarts, 0)
+        self.assertEqual(len(requests), 1)
+        self.assertTrue(requests[0])
+
+    def test_changed_before_resume(self):
+        # the If-Range no longer matches, so the server sends the whole
+        # new file and the download starts over
+        self.before_resume(lambda request: self.write(os.urandom(SIZE + 1)))
+        download = self.download(self.serve(drop_at=SIZE // 3))
+        self.assertEqual(download.resumed, 1)
+        self.assertEqual(download.restarts, 1)
+
+    def test_unexpected_content_range(self):
+        # asks for the range from one byte before the end of the file
+        self.before_resume(lambda request: request.add_header(
+            'Range', 'bytes=%d-' % (int(request.get_header('Range')[6:-1]) - 1)))
+        download = Download(self.serve(drop_at=SIZE // 3),
+                            os.path.join(self.directory, 'part.stp'))
+        download.start()
+        with self.assertRaises(DownloadError) as raised:
+            download.result()
+        self.assertIn("Unexpected Content-Range", str(raised.exception))
+
+    def test_revalidation(self):
+        cache = DownloadCache(os.path.join(self.directory, 'cache'), 16 * SIZE)
+        url = self.serve()
+        self.assertIsNone(self.download(url, cache).cached)
+        self.assertEqual(self.download(url, cache).cached, 'revalidated')
+        self.write(os.urandom(SIZE + 1))
+        self.assertIsNone(self.download(url, cache).cached)
+        self.assertEqual(self.download(url, cache).cached, 'revalidated')
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from STParser import header as module
+from STParser.header import length_unit, product_name
+
+PART = b"""ISO-10303-21;
+HEADER;
+FILE_DESCRIPTION((''),'2;1');
+FILE_NAME('bracket.stp','2017-01-01T00:00:00',('Author'),('Org'),'pre','sys','');
+FILE_SCHEMA(('AUTOMOTIVE_DESIGN { 1 0 10303 214 1 1 1 1 }'));
+ENDSEC;
+DATA;
+/* #9=PRODUCT('commented','commented','',(#2)); */
+#1=PRODUCT('bracket','it''s a bracket','',(#2));
+#2=PRODUCT_CONTEXT('',#3,'mechanical');
+#3=APPLICATION_CONTEXT('core data');
+#10=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT(.CENTI.,.METRE.));
+#11=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT(.MILLI.,.METRE.));
+#12=(NAMED_UNIT(*)PLANE_ANGLE_UNIT()SI_UNIT($,.RADIAN.));
+#13=(CONVERSION_BASED_UNIT('INCH',#14)LENGTH_UNIT()NAMED_UNIT(#15));
+#14=LENGTH_MEASURE_WITH_UNIT(LENGTH_MEASURE(25.4),#11);
+#15=DIMENSIONAL_EXPONENTS(1.,0.,0.,0.,0.,0.,0.);
+#20=(GEOMETRIC_REPRESENTATION_CONTEXT(3)GLOBAL_UNIT_ASSIGNED_CONTEXT((#11,#12))
+REPRESENTATION_CONTEXT('',''));
+ENDSEC;
+END-ISO-10303-21;
+"""
+
+class HeaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text):
+        filename = os.path.join(self.directory, 'part.stp')
+        with open(filename, 'wb') as f:
+            f.write(text)
+        return filename
+
+    def test_assigned_unit(self):
+        self.assertEqual(length_unit(self.write(PART)), 'mm')
+
+    def test_assigned_unit_not_si(self):
+        self.assertIsNone(length_unit(self.write(PART.replace(b'((#11,#12))', b'((#12,#13))'))))
+
+    def test_without_context(self):
+        # the first SI length unit, not one from a comment
+        text = PART.replace(b'GLOBAL_UNIT_ASSIGNED_CONTEXT((#11,#12))', b'')
+        self.assertEqual(length_unit(self.write(text)), 'cm')
+        text = text.replace(b'/* #9', b'/* #9=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT($,.METRE.)); #9')
+        self.assertEqual(length_unit(self.write(text)), 'cm')
+
+    def test_no_unit(self):
+        self.assertIsNone(length_unit(self.write(PART.split(b'#10=')[0])))
+        self.assertIsNone(length_unit(self.write(b'')))
+
+    def test_product_name(self):
+        self.assertEqual(product_name(self.write(PART)), u"it's a bracket")
+        self.assertIsNone(product_name(self.write(PART.replace(b'=PRODUCT(', b'=PRODUCT_X('))))
+
+    def test_windows(self):
+        # entities between the two windows are found by the full scan
+        points = b''.join(b"#%d=CARTESIAN_POINT('',(%d.,0.,0.));\n" % (index, index)
+                          for index in range(100, 1100))
+        window = module.UNIT_WINDOW
+        module.UNIT_WINDOW = 1024
+        try:
+            filename = self.write(PART.replace(b'DATA;\n', b'DATA;\n' + points)
+                                  .replace(b'ENDSEC;\nEND', points + b'ENDSEC;\nEND'))
+            self.assertEqual(length_unit(filename), 'mm')
+            self.assertEqual(product_name(filename), u"it's a bracket")
+        finally:
+            module.UNIT_WINDOW = window
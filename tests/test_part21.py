@@ -0,0 +1,108 @@
+import unittest
+from io import BytesIO
+
+from STParser.part21 import (Lexer, Part21Error, Enumeration, EntityRef, decode_string,
+                             parse_header, parse_instance, STRING, KEYWORD, REAL, INTEGER,
+                             ENUM, REF, BINARY, PUNCT)
+
+HEADER = b"""ISO-10303-21;
+HEADER;
+/* exported by a test */
+FILE_DESCRIPTION(('it''s a part'),'2;1');
+FILE_NAME('\\X2\\00E9007400E9\\X0\\.stp','2017-01-01T00:00:00',('Author'),('Org'),
+  'pre','sys','');
+FILE_SCHEMA(('AUTOMOTIVE_DESIGN { 1 0 10303 214 1 1 1 1 }'));
+ENDSEC;
+DATA;
+#1=CARTESIAN_POINT('',(1.5E+3,-2.,3));
+ENDSEC;
+END-ISO-10303-21;
+"""
+
+def tokens(text, chunk_size=64 * 1024):
+    return list(Lexer(BytesIO(text), chunk_size=chunk_size))
+
+class DecodeStringTest(unittest.TestCase):
+    def test_quote(self):
+        self.assertEqual(decode_string(b"it''s"), u"it's")
+        self.assertEqual(decode_string(b"''''"), u"''")
+
+    def test_control_directives(self):
+        self.assertEqual(decode_string(b"\\X2\\00E9007400E9\\X0\\"), u"\xe9t\xe9")
+        self.assertEqual(decode_string(b"a\\X2\\\\X0\\b"), u"ab")
+        self.assertEqual(decode_string(b"\\X4\\0001F600\\X0\\"), u"\U0001F600")
+        self.assertEqual(decode_string(b"\\X\\E9"), u"\xe9")
+        self.assertEqual(decode_string(b"\\S\\i"), u"\xe9")
+        # \PB\ selects ISO 8859-2
+        self.assertEqual(decode_string(b"\\PB\\\\S\\u"), u"\u0151")
+        self.assertEqual(decode_string(b"a\\\\b"), u"a\\b")
+
+class LexerTest(unittest.TestCase):
+    def test_kinds(self):
+        found = [(token.kind, token.value) for token in
+                 tokens(b"#12=A('x',.T.,1.5E+3,-2,\"0F\",$,*);")]
+        self.assertEqual(found, [
+            (REF, 12), (PUNCT, '='), (KEYWORD, 'A'), (PUNCT, '('), (STRING, u'x'),
+            (PUNCT, ','), (ENUM, 'T'), (PUNCT, ','), (REAL, 1500.), (PUNCT, ','),
+            (INTEGER, -2), (PUNCT, ','), (BINARY, '"0F"'), (PUNCT, ','), (PUNCT, '$'),
+            (PUNCT, ','), (PUNCT, '*'), (PUNCT, ')'), (PUNCT, ';')])
+        self.assertIsInstance(found[0][1], EntityRef)
+        self.assertIsInstance(found[6][1], Enumeration)
+
+    def test_chunk_boundaries(self):
+        # every chunk size cuts tokens, strings, escapes and comments at a
+        # different place; the tokens must come out the same
+        expected = tokens(HEADER)
+        for chunk_size in range(1, 80):
+            self.assertEqual(tokens(HEADER, chunk_size), expected, chunk_size)
+
+    def test_positions(self):
+        found = dict((token.value, (token.line, token.column)) for token in tokens(HEADER)
+                     if token.kind == KEYWORD)
+        self.assertEqual(found['FILE_DESCRIPTION'], (4, 1))
+        self.assertEqual(found['CARTESIAN_POINT'], (10, 4))
+
+    def test_malformed(self):
+        for text, position in [(b"A(1,?);", (1, 5)),
+                               (b"A(\n'open);\n", (2, 1)),
+                               (b"A(1);\n/* open", (2, 1)),
+                               (b'A("0F);', (1, 3))]:
+            for chunk_size in (1, 3, 64 * 1024):
+                with self.assertRaises(Part21Error) as raised:
+                    tokens(text, chunk_size)
+                self.assertEqual((raised.exception.line, raised.exception.column), position)
+
+    def test_limit(self):
+        with self.assertRaises(Part21Error):
+            list(Lexer(BytesIO(b"A(" + b"1," * 1000 + b"1);"), chunk_size=16, limit=64))
+
+class ParserTest(unittest.TestCase):
+    def test_header(self):
+        header = parse_header(BytesIO(HEADER))
+        self.assertEqual(header.file_description.description, [u"it's a part"])
+        self.assertEqual(header.file_description.implementation_level, u'2;1')
+        self.assertEqual(header.file_name.name, u'\xe9t\xe9.stp')
+        self.assertEqual(header.file_name.organization, [u'Org'])
+        self.assertEqual(header.file_schema.schema_identifiers,
+                         [u'AUTOMOTIVE_DESIGN { 1 0 10303 214 1 1 1 1 }'])
+
+    def test_malformed_header(self):
+        for text in [b"HEADER;ENDSEC;",
+                     HEADER.replace(b"('Org'),", b"('Org')"),
+                     HEADER.replace(b"ENDSEC;\nDATA", b"DATA"),
+                     HEADER[:60]]:
+            with self.assertRaises(Part21Error):
+                parse_header(BytesIO(text))
+
+    def test_instance(self):
+        entity_id, records = parse_instance(
+            b"#10=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT(.MILLI.,.METRE.));")
+        self.assertEqual(entity_id, 10)
+        self.assertEqual([record.type for record in records],
+                         ['LENGTH_UNIT', 'NAMED_UNIT', 'SI_UNIT'])
+        self.assertEqual(records[2].parameters, ['MILLI', 'METRE'])
+        with self.assertRaises(Part21Error):
+            parse_instance(b"#10=A(1,2;")
+
+if __name__ == '__main__':
+    unittest.main()
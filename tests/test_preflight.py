@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from STParser import preflight as module
+from STParser.preflight import preflight, PreflightError
+
+PART = b"""ISO-10303-21;
+HEADER;
+FILE_DESCRIPTION(('a description; with a semicolon'),'2;1');
+FILE_NAME('bracket.stp','2017-01-01T00:00:00',('Author'),('Org'),'pre','sys','');
+FILE_SCHEMA(('AUTOMOTIVE_DESIGN { 1 0 10303 214 1 1 1 1 }'));
+ENDSEC;
+DATA;
+/* a comment; with a semicolon */
+#1=PRODUCT('it''s a bracket','bracket','',(#2));
+#2=PRODUCT_CONTEXT('',#3,'mechanical');
+#3=APPLICATION_CONTEXT('core data');
+#10=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT(.MILLI.,.METRE.));
+ENDSEC;
+END-ISO-10303-21;
+"""
+
+class PreflightTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text):
+        filename = os.path.join(self.directory, 'part.stp')
+        with open(filename, 'wb') as f:
+            f.write(text)
+        return filename
+
+    def check(self, text, instances=4):
+        # every chunk size cuts the text at a different place, inside
+        # strings, comments and escaped quotes among them
+        filename = self.write(text)
+        for chunk_size in range(1, 40):
+            self.assertEqual(preflight(filename, chunk_size=chunk_size), instances)
+        self.assertEqual(preflight(filename), instances)
+
+    def test_line_endings(self):
+        self.check(PART)
+        self.check(PART.replace(b'\n', b'\r\n'))
+        self.check(PART.replace(b'\n', b'\r'))
+
+    def test_single_line(self):
+        self.check(PART.replace(b'\n', b''))
+
+    def test_long_statements_on_one_line(self):
+        # more than a chunk with no line break at all
+        points = b''.join(b"#%d=CARTESIAN_POINT('',(%d.,0.,0.));" % (index, index)
+                          for index in range(100, 5000))
+        self.check(PART.replace(b'ENDSEC;\nEND', points + b'ENDSEC;\nEND').replace(b'\n', b''),
+                   4 + 4900)
+
+    def test_statement_limit(self):
+        # the limit is on a single statement, not on a line
+        points = b''.join(b"#%d=CARTESIAN_POINT('',(%d.,0.,0.));" % (index, index)
+                          for index in range(100, 500))
+        filename = self.write(PART.replace(b'ENDSEC;\nEND', points + b'ENDSEC;\nEND')
+                              .replace(b'\n', b''))
+        limit = module.MAX_STATEMENT
+        module.MAX_STATEMENT = 1024
+        try:
+            self.assertEqual(preflight(filename, chunk_size=4096), 4 + 400)
+            self.write(PART.replace(b'ENDSEC;\nEND', b"/*" + b" " * 8192 + b"*/ENDSEC;\nEND"))
+            with self.assertRaises(PreflightError) as raised:
+                preflight(filename, chunk_size=4096)
+            self.assertIn("Statement longer than 1024 bytes", str(raised.exception))
+        finally:
+            module.MAX_STATEMENT = limit
+
+    def test_malformed(self):
+        for text, message in [
+                (PART.replace(b'#3=', b'#2='), "Duplicate entity #2"),
+                (PART.replace(b'#3=', b'#4='), "#2 references undefined #3"),
+                (PART.replace(b",'mechanical')", b",'mechanical'"), "Unbalanced parentheses"),
+                (PART.replace(b'END-ISO-10303-21;\n', b''), "Truncated file"),
+                (PART.replace(b"'core data'", b"'core data"), "Malformed statement")]:
+            for variant in (text, text.replace(b'\n', b'')):
+                filename = self.write(variant)
+                for chunk_size in (1, 7, 1024 * 1024):
+                    with self.assertRaises(PreflightError) as raised:
+                        preflight(filename, chunk_size=chunk_size)
+                    self.assertIn(message, str(raised.exception))
+
+if __name__ == '__main__':
+    unittest.main()
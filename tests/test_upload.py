@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import tdpUpload as module
+from tdpUpload import multipart_upload
+from benchmarks.standins import LocalBucket, LocalMultipartUpload
+
+PART_SIZE = 1000
+
+class FailingUpload(LocalMultipartUpload):
+    '''a LocalMultipartUpload on which the first failures uploads of part
+    number failing raise
+    '''
+    def __init__(self, bucket, key_name, failing, failures):
+        LocalMultipartUpload.__init__(self, bucket, key_name)
+        self.failing = failing
+        self.failures = failures
+        self.sizes = {}
+        self.cancelled = False
+
+    def upload_part_from_file(self, fp, part_num, size=None):
+        if part_num == self.failing and self.failures:
+            self.failures -= 1
+            raise IOError("Connection reset")
+        self.sizes[part_num] = size
+        LocalMultipartUpload.upload_part_from_file(self, fp, part_num, size)
+
+    def cancel_upload(self):
+        self.cancelled = True
+        LocalMultipartUpload.cancel_upload(self)
+
+class MultipartUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bucket = LocalBucket(self.directory, 'bucket')
+        self.retry_delay = module.RETRY_DELAY
+        module.RETRY_DELAY = 0
+        self.data = os.urandom(2 * PART_SIZE + PART_SIZE // 2)
+
+    def tearDown(self):
+        module.RETRY_DELAY = self.retry_delay
+        shutil.rmtree(self.directory)
+
+    def upload(self, failing=None, failures=0, retries=2):
+        mp = FailingUpload(self.bucket, 'part.zip', failing, failures)
+        self.bucket.initiate_multipart_upload = lambda key_name: mp
+        try:
+            multipart_upload(self.bucket, 'part.zip', BytesIO(self.data), part_size=PART_SIZE,
+                             retries=retries)
+        finally:
+            self.mp = mp
+
+    def uploaded(self):
+        with open(os.path.join(self.bucket.path, 'part.zip'), 'rb') as f:
+            return f.read()
+
+    def test_parts(self):
+        self.upload()
+        self.assertEqual(self.mp.sizes, {1: PART_SIZE, 2: PART_SIZE, 3: PART_SIZE // 2})
+        self.assertTrue(self.uploaded() == self.data)
+        self.assertFalse(self.mp.cancelled)
+
+    def test_part_retried(self):
+        self.upload(failing=2, failures=2)
+        self.assertTrue(self.uploaded() == self.data)
+
+    def test_failed_part(self):
+        with self.assertRaises(IOError):
+            self.upload(failing=2, failures=3)
+        self.assertTrue(self.mp.cancelled)
+        self.assertEqual(self.mp.parts, {})
+        self.assertFalse(os.path.exists(os.path.join(self.bucket.path, 'part.zip')))